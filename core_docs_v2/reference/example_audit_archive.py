@@ -0,0 +1,356 @@
+"""
+Time-partitioned archival and compaction for audit_logs.
+
+Documents older than the retention window are paged out of audit_logs
+in created_at order (idx_created_at) and written to one gzip JSONL file
+per day:
+
+    <archive_dir>/audit_logs/2024/01/2024-01-05.jsonl.gz
+    <archive_dir>/audit_logs/index.json
+
+index.json lists every partition with its time range, document count,
+SHA-256, and the distinct actions, resource types and (when there are
+few) users it contains, so look-ups open only the files that can match.
+
+Documents are deleted only after their files have been re-read and the
+counts match both what was written and what the server reports for the
+same range (one count per month of partitions). Deletes run in parallel batches
+(BatchedDocumentWriter). A run that stops between archiving and
+deleting finishes those deletes first on the next run, so nothing is
+archived twice.
+
+Archived ranges stay queryable without restoring them:
+
+    python example_audit_archive.py query --from 2024-01-01 --to 2024-02-01 --user-id usr_1
+
+Usage:
+    python example_audit_archive.py archive --retention-days 365 --archive-dir ./archive
+    python example_audit_archive.py verify --archive-dir ./archive
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from appwrite.query import Query
+
+from example_dev_set_up import BatchedDocumentWriter, create_databases_from_env, iter_documents
+
+
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+SUMMARY_FIELDS = ('action', 'resource_type')  # Low-cardinality fields kept in full per partition
+MAX_INDEXED_USERS = 500  # Per-partition user_id lists larger than this are not kept
+SERVER_COUNT_LIMIT = 5000  # Appwrite stops counting 'total' here
+
+
+def day_bounds(day: str) -> tuple:
+    """'2024-01-05' -> ('2024-01-05T00:00:00.000Z', '2024-01-06T00:00:00.000Z')"""
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return format_time(start), format_time(start + timedelta(days=1))
+
+
+def format_time(value: datetime) -> str:
+    return value.isoformat(timespec='milliseconds') + 'Z'
+
+
+class AuditArchiver:
+    """Move old audit_logs documents into daily compressed archive files"""
+
+    def __init__(self, databases, archive_dir: str, database_id: str = 'eprescription_dev',
+                 collection_id: str = 'audit_logs', page_size: int = 1000, delete_workers: int = 8,
+                 log=print):
+        self.databases = databases
+        self.database_id = database_id
+        self.collection_id = collection_id
+        self.page_size = page_size
+        self.delete_workers = delete_workers
+        self.log = log
+        self.root = os.path.join(archive_dir, collection_id)
+        os.makedirs(self.root, exist_ok=True)
+        self.index = load_index(self.root)
+
+    def archive(self, retention_days: int = 365, now: datetime = None, dry_run: bool = False) -> dict:
+        """Archive, verify and delete everything older than the retention window"""
+        cutoff = format_time((now or datetime.utcnow()) - timedelta(days=retention_days))
+        result = {'cutoff': cutoff, 'partitions': 0, 'archived': 0, 'deleted': 0, 'failed': [],
+                  'resumed_deletes': 0 if dry_run else self.delete_pending()}
+
+        writer = None
+        month = []  # Closed partitions of the current month, verified together
+        for document in iter_documents(self.databases, self.database_id, self.collection_id,
+                                       [Query.less_than('created_at', cutoff), Query.order_asc('created_at')],
+                                       self.page_size):
+            day = document['created_at'][:10]
+            if writer is None or writer.day != day:
+                if writer is not None:
+                    month.append(writer.close())
+                    if month[0]['day'][:7] != day[:7]:
+                        self.finish_month(month, cutoff, result, dry_run)
+                        month = []
+                writer = PartitionWriter(self.root, day, self.next_part(day))
+            writer.write(document)
+        if writer is not None:
+            month.append(writer.close())
+            self.finish_month(month, cutoff, result, dry_run)
+
+        self.log(f"Archived {result['archived']} {self.collection_id} documents older than {cutoff} "
+                 f"into {result['partitions']} partitions, deleted {result['deleted']}")
+        return result
+
+    def finish_month(self, entries: list, cutoff: str, result: dict, dry_run: bool):
+        """Verify a month of day files against the server, then index them and delete their documents"""
+        problem = self.verify_entries(entries, cutoff)
+        if problem:
+            # Keep the documents; the files are kept for inspection but not indexed
+            for entry in entries:
+                path = os.path.join(self.root, entry['file'])
+                os.replace(path, path + '.unverified')
+            result['failed'].append({'month': entries[0]['day'][:7], 'error': problem})
+            self.log(f"Not deleting {entries[0]['day'][:7]}: {problem}")
+            return
+
+        result['partitions'] += len(entries)
+        result['archived'] += sum(entry['count'] for entry in entries)
+        if dry_run:
+            for entry in entries:
+                os.remove(os.path.join(self.root, entry['file']))
+            return
+
+        for entry in entries:
+            entry['deleted'] = False
+        self.index['partitions'].extend(entries)
+        save_index(self.root, self.index)
+        for entry in entries:
+            result['deleted'] += self.delete_partition(entry)
+
+    def verify_entries(self, entries: list, cutoff: str) -> str:
+        """Re-read the files and compare counts with the server; returns a problem or None"""
+        for entry in entries:
+            count, digest = read_back(os.path.join(self.root, entry['file']))
+            if count != entry['count'] or digest != entry['sha256']:
+                return f"{entry['file']} has {count} documents (sha256 {digest[:12]}), wrote {entry['count']}"
+
+        # One count over the whole range; earlier parts of these days still
+        # in the database (their delete failed) count as archived
+        start, end = day_bounds(entries[0]['day'])[0], day_bounds(entries[-1]['day'])[1]
+        days = {entry['day'] for entry in entries}
+        archived = sum(entry['count'] for entry in entries)
+        archived += sum(p['count'] for p in self.index['partitions'] if p['day'] in days and not p['deleted'])
+        server_count = self.count_range(start, min(end, cutoff))
+        if server_count != archived:
+            return f"server has {server_count} documents from {start} to {min(end, cutoff)}, archived {archived}"
+        return None
+
+    def count_range(self, start: str, end: str) -> int:
+        """Documents with start <= created_at < end"""
+        queries = [Query.greater_than_equal('created_at', start), Query.less_than('created_at', end)]
+        response = self.databases.list_documents(
+            database_id=self.database_id,
+            collection_id=self.collection_id,
+            queries=queries + [Query.limit(1)]
+        )
+        if response['total'] < SERVER_COUNT_LIMIT:
+            return response['total']
+        return sum(1 for _ in iter_documents(self.databases, self.database_id, self.collection_id,
+                                             queries + [Query.select(['$id'])], self.page_size))
+
+    def delete_partition(self, entry: dict) -> int:
+        """Delete an archived partition's documents in parallel batches"""
+        writer = BatchedDocumentWriter(self.databases, self.database_id, batch_size=100,
+                                       workers=self.delete_workers)
+        for document in iter_archive_file(os.path.join(self.root, entry['file'])):
+            writer.delete(self.collection_id, document['$id'])
+        stats = writer.close()
+        if stats['failed']:
+            self.log(f"Deleting {entry['day']} failed for {stats['failed']} documents: {stats['errors'][:3]}")
+            return stats['deleted']
+
+        entry['deleted'] = True
+        save_index(self.root, self.index)
+        return stats['deleted']
+
+    def delete_pending(self) -> int:
+        """Finish deletes of partitions archived by an earlier, interrupted run"""
+        return sum(self.delete_partition(entry) for entry in self.index['partitions'] if not entry['deleted'])
+
+    def next_part(self, day: str) -> int:
+        """Part number for a new file of a day (later runs can add to an archived day)"""
+        return 1 + sum(1 for entry in self.index['partitions'] if entry['day'] == day)
+
+
+class PartitionWriter:
+    """Stream one day's documents into a gzip JSONL file, collecting its index entry"""
+
+    def __init__(self, root: str, day: str, part: int):
+        self.day = day
+        name = f"{day}.jsonl.gz" if part == 1 else f"{day}-{part}.jsonl.gz"
+        self.file = os.path.join(day[:4], day[5:7], name)
+        self.path = os.path.join(root, self.file)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.tmp_path = self.path + '.tmp'
+        self.stream = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+        self.sha256 = hashlib.sha256()
+        self.count = 0
+        self.first = self.last = None
+        self.values = {field: set() for field in SUMMARY_FIELDS}
+        self.users = set()
+
+    def write(self, document: dict):
+        line = json.dumps(document, separators=(',', ':'), sort_keys=True) + '\n'
+        self.stream.write(line)
+        self.sha256.update(line.encode('utf-8'))
+        self.count += 1
+        self.first = self.first or document['created_at']
+        self.last = document['created_at']
+        for field in SUMMARY_FIELDS:
+            self.values[field].add(document.get(field))
+        if self.users is not None:
+            self.users.add(document.get('user_id'))
+            if len(self.users) > MAX_INDEXED_USERS:
+                self.users = None
+
+    def close(self) -> dict:
+        self.stream.close()
+        os.replace(self.tmp_path, self.path)
+        return {
+            'day': self.day,
+            'file': self.file,
+            'count': self.count,
+            'first_created_at': self.first,
+            'last_created_at': self.last,
+            'sha256': self.sha256.hexdigest(),
+            'bytes': os.path.getsize(self.path),
+            'values': {field: sorted(v for v in values if v is not None) for field, values in self.values.items()},
+            'users': sorted(u for u in self.users if u is not None) if self.users is not None else None,
+        }
+
+
+def load_index(root: str) -> dict:
+    path = os.path.join(root, INDEX_FILE)
+    if not os.path.exists(path):
+        return {'version': INDEX_VERSION, 'partitions': []}
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"Unsupported archive index version: {index.get('version')}")
+    return index
+
+
+def save_index(root: str, index: dict):
+    """Write the index atomically"""
+    path = os.path.join(root, INDEX_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def iter_archive_file(path: str):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def read_back(path: str) -> tuple:
+    """(line count, SHA-256 of the uncompressed content) of an archive file"""
+    sha256 = hashlib.sha256()
+    count = 0
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            sha256.update(line)
+            count += 1
+    return count, sha256.hexdigest()
+
+
+def query_archive(archive_dir: str, start: str = None, end: str = None, filters: dict = None,
+                  collection_id: str = 'audit_logs', limit: int = None):
+    """
+    Yield archived documents with start <= created_at < end matching filters.
+
+    filters maps attribute -> value (or list of values). Partitions whose
+    time range or value summary rules them out are never opened.
+    """
+    root = os.path.join(archive_dir, collection_id)
+    filters = {key: set(value) if isinstance(value, (list, tuple, set)) else {value}
+               for key, value in (filters or {}).items()}
+    found = 0
+
+    for entry in sorted(load_index(root)['partitions'], key=lambda p: p['first_created_at']):
+        if (start and entry['last_created_at'] < start) or (end and entry['first_created_at'] >= end):
+            continue
+        if not partition_may_match(entry, filters):
+            continue
+        for document in iter_archive_file(os.path.join(root, entry['file'])):
+            created_at = document['created_at']
+            if (start and created_at < start) or (end and created_at >= end):
+                continue
+            if all(document.get(key) in values for key, values in filters.items()):
+                yield document
+                found += 1
+                if limit and found >= limit:
+                    return
+
+
+def partition_may_match(entry: dict, filters: dict) -> bool:
+    for key, values in filters.items():
+        if key in entry['values'] and not values & set(entry['values'][key]):
+            return False
+        if key == 'user_id' and entry['users'] is not None and not values & set(entry['users']):
+            return False
+    return True
+
+
+def verify_archive(archive_dir: str, collection_id: str = 'audit_logs') -> dict:
+    """Check every indexed file against its count and SHA-256"""
+    root = os.path.join(archive_dir, collection_id)
+    problems = []
+    partitions = load_index(root)['partitions']
+    for entry in partitions:
+        path = os.path.join(root, entry['file'])
+        if not os.path.exists(path):
+            problems.append(f"{entry['file']}: missing")
+            continue
+        count, digest = read_back(path)
+        if count != entry['count'] or digest != entry['sha256']:
+            problems.append(f"{entry['file']}: {count} documents, expected {entry['count']}")
+    return {'partitions': len(partitions), 'documents': sum(p['count'] for p in partitions), 'problems': problems}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Archive old audit_logs documents to daily gzip files')
+    parser.add_argument('command', choices=['archive', 'query', 'verify'])
+    parser.add_argument('--archive-dir', default='./archive')
+    parser.add_argument('--database', default='eprescription_dev')
+    parser.add_argument('--retention-days', type=int, default=365)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Write and verify the partitions, then discard them; nothing is deleted')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--delete-workers', type=int, default=8)
+    parser.add_argument('--from', dest='start', help='query: created_at >= this date or datetime')
+    parser.add_argument('--to', dest='end', help='query: created_at < this date or datetime')
+    parser.add_argument('--user-id')
+    parser.add_argument('--clinic-id')
+    parser.add_argument('--action')
+    parser.add_argument('--resource-type')
+    parser.add_argument('--resource-id')
+    parser.add_argument('--limit', type=int, default=1000)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'archive':
+        archiver = AuditArchiver(create_databases_from_env(), args.archive_dir, args.database,
+                                 page_size=args.page_size, delete_workers=args.delete_workers)
+        print(json.dumps(archiver.archive(args.retention_days, dry_run=args.dry_run), indent=2))
+    elif args.command == 'verify':
+        print(json.dumps(verify_archive(args.archive_dir), indent=2))
+    else:
+        filters = {key: getattr(args, key) for key in ('user_id', 'clinic_id', 'action', 'resource_type',
+                                                       'resource_id') if getattr(args, key)}
+        for document in query_archive(args.archive_dir, args.start, args.end, filters, limit=args.limit):
+            print(json.dumps(document))
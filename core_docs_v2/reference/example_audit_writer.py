@@ -0,0 +1,397 @@
+"""
+Buffered background writer for audit_logs and security_events.
+
+Recording an event only appends it to a bounded in-memory queue (a few
+microseconds); a flusher thread hands batches to a worker pool when
+batch_size events are waiting or flush_interval has passed. Batches go
+through create_documents (one create_document per event on servers
+without bulk endpoints) with retries on 429/5xx and network errors.
+
+When the queue is full the caller blocks (backpressure), or with a
+spill_dir the event is appended to a local JSONL spill file instead.
+Batches that still fail after their retries are spilled too. Spill
+files are replayed when the writer starts and whenever the queue is
+idle. Every event gets its document ID when it is recorded, so a
+replayed or retried batch cannot write an event twice (409 counts as
+already written). Spill lines that cannot be read back (a line torn by
+a crash) are moved to rejected.jsonl in the spill dir.
+
+close() stops intake, flushes the queue, waits for in-flight batches
+and returns the stats.
+
+Usage:
+    writer = AuditWriter(databases, spill_dir='/var/spool/audit')
+    writer.log_audit('prescription.sign', 'prescription', user_id=user_id, resource_id=rx_id)
+    writer.log_security_event('login_failed', 'warning', user_id=user_id)
+    writer.close()
+"""
+
+import glob
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from appwrite.exception import AppwriteException
+
+from example_dev_set_up import DevelopmentDatabaseSetup, write_documents
+
+
+AUDIT_COLLECTIONS = ('audit_logs', 'security_events')
+RETRYABLE_CODES = {0, 429, 500, 502, 503, 504}
+
+
+class AuditWriter:
+    """Asynchronous, batched writer for audit events"""
+
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_DELAY = 0.2  # Doubled per attempt, with jitter
+    REPLAY_INTERVAL = 30.0  # Seconds between spill replays while the queue is idle
+    MAX_ERRORS_KEPT = 20
+
+    def __init__(self, databases, database_id: str = 'eprescription_dev', max_queue: int = 10000,
+                 batch_size: int = 100, flush_interval: float = 1.0, workers: int = 4,
+                 spill_dir: str = None, block_timeout: float = None):
+        self.databases = databases
+        self.database_id = database_id
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.block_timeout = block_timeout
+        self.bulk_supported = {'create': hasattr(databases, 'create_documents')}
+
+        # Document IDs: a random per-writer prefix plus a counter (uuid4 per event is too slow)
+        self.id_prefix = uuid.uuid4().hex[:16]
+        self.sequence = itertools.count()
+
+        config = {info['id']: info for info in DevelopmentDatabaseSetup.get_collections_config()}
+        self.sizes = {collection_id: {attr['key']: attr['size'] for attr in config[collection_id]['attributes']
+                                      if attr['attr_type'] == 'string'}
+                      for collection_id in AUDIT_COLLECTIONS}
+        self.validators = DevelopmentDatabaseSetup.document_validators()
+
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.all_done = threading.Condition(self.lock)
+        self.unfinished = 0  # Events queued or in flight
+        self.recorded = 0
+        self.max_queue_depth = 0
+        self.spill_lock = threading.Lock()
+        self.closed = False
+
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            'written': 0, 'existing': 0, 'batches': 0, 'retries': 0, 'spilled': 0, 'replayed': 0,
+            'rejected': 0, 'blocked': 0, 'blocked_seconds': 0.0,
+        }
+        self.errors = []
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)  # Bounds in-flight batches
+        self.last_replay = 0.0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self.flusher = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+        self.flusher.start()
+
+    # Hot path
+
+    def log_audit(self, action: str, resource_type: str, user_id: str = None, clinic_id: str = None,
+                  resource_id: str = None, request_data=None, changes=None):
+        """Record an audit_logs event (request_data / changes may be dicts)"""
+        self.record('audit_logs', {
+            'user_id': user_id, 'clinic_id': clinic_id, 'action': action, 'resource_type': resource_type,
+            'resource_id': resource_id, 'request_data': request_data, 'changes': changes,
+        })
+
+    def log_security_event(self, event_type: str, severity: str = 'info', user_id: str = None,
+                           description: str = None, request_data=None):
+        """Record a security_events event"""
+        self.record('security_events', {
+            'user_id': user_id, 'event_type': event_type, 'severity': severity,
+            'description': description, 'request_data': request_data,
+        })
+
+    def record(self, collection_id: str, data: dict):
+        """Queue one event; blocks (or spills) only when the queue is full"""
+        event = (collection_id, f"{self.id_prefix}{next(self.sequence):x}", time.time(), data)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("AuditWriter is closed")
+            if len(self.queue) >= self.max_queue and not self.spill_dir:
+                self.wait_for_room()
+            if len(self.queue) < self.max_queue:
+                self.queue.append(event)
+                self.unfinished += 1
+                self.recorded += 1
+                depth = len(self.queue)
+                if depth >= self.batch_size:
+                    self.not_empty.notify()
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+                return
+
+        # Queue full: keep the event on disk rather than block the caller
+        self.spill([event])
+        with self.lock:
+            self.recorded += 1
+
+    def wait_for_room(self):
+        """Backpressure: wait until the flusher takes events; call with the lock held"""
+        started = time.monotonic()
+        while len(self.queue) >= self.max_queue:
+            remaining = None
+            if self.block_timeout is not None:
+                remaining = self.block_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise TimeoutError(f"Audit queue full for {self.block_timeout}s")
+            self.not_empty.notify()
+            self.not_full.wait(remaining)
+        with self.stats_lock:
+            self.counters['blocked'] += 1
+            self.counters['blocked_seconds'] += time.monotonic() - started
+
+    # Flushing
+
+    def run(self):
+        """Flusher thread: cut batches on size or interval"""
+        try:
+            self.replay_spill()
+        except Exception as e:
+            self.record_error('spill replay', e)
+        while True:
+            try:
+                with self.lock:
+                    if len(self.queue) < self.batch_size and not self.closed:
+                        self.not_empty.wait(self.flush_interval)
+                    events = [self.queue.popleft() for _ in range(min(len(self.queue), self.batch_size))]
+                    self.not_full.notify_all()
+                    done = self.closed and not self.queue and not events
+
+                if done:
+                    return
+                if events:
+                    self.submit(events)
+                elif time.monotonic() - self.last_replay > self.REPLAY_INTERVAL:
+                    self.replay_spill()
+            except Exception as e:
+                # An unreadable spill file or a full disk must not stop the flusher
+                self.record_error('flusher', e)
+
+    def submit(self, events: list):
+        """Hand a batch to the worker pool, grouped per collection"""
+        by_collection = {}
+        for event in events:
+            by_collection.setdefault(event[0], []).append(event)
+        for collection_events in by_collection.values():
+            self.slots.acquire()  # Backpressure when every worker is busy
+            future = self.executor.submit(self.write_events, collection_events)
+            future.add_done_callback(lambda _: self.slots.release())
+
+    def write_events(self, events: list):
+        """Write one collection's batch (worker thread)"""
+        try:
+            self.write_or_spill(events)
+        finally:
+            with self.lock:
+                self.unfinished -= len(events)
+                if self.unfinished <= 0:
+                    self.all_done.notify_all()
+
+    def write_or_spill(self, events: list):
+        """Write a batch with retries; spill it if it keeps failing"""
+        collection_id = events[0][0]
+        documents, valid = [], []
+        for event in events:
+            document = self.to_document(event)
+            errors = self.validators[collection_id].errors(document)
+            if errors:
+                self.reject(event, errors)
+            else:
+                documents.append(document)
+                valid.append(event)
+        if not documents:
+            return
+
+        self.count('batches')
+        for attempt in range(self.MAX_ATTEMPTS):
+            try:
+                self.write_documents(collection_id, documents)
+                return
+            except AppwriteException as e:
+                if e.code not in RETRYABLE_CODES:
+                    self.record_error(collection_id, e)
+                    break
+                if attempt + 1 < self.MAX_ATTEMPTS:
+                    self.count('retries')
+                    time.sleep(self.RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+                else:
+                    self.record_error(collection_id, e)
+
+        if self.spill_dir:
+            self.spill(valid)
+        else:
+            self.count('rejected', len(documents))
+
+    def write_documents(self, collection_id: str, documents: list):
+        """Create the batch with the setup's bulk-then-row-by-row rules; a failing row raises"""
+        write_documents(self.databases, self.database_id, 'create', collection_id, documents,
+                        self.bulk_supported, self.count)
+
+    def to_document(self, event: tuple) -> dict:
+        """Event tuple -> document: JSON-encode dict fields, trim strings to the schema sizes"""
+        collection_id, document_id, recorded_at, data = event
+        sizes = self.sizes[collection_id]
+        created_at = datetime.fromtimestamp(recorded_at, timezone.utc).isoformat().replace('+00:00', 'Z')
+        document = {'$id': document_id, 'created_at': created_at}
+        for key, value in data.items():
+            if value is None:
+                continue
+            if not isinstance(value, str) and key in ('request_data', 'changes'):
+                value = json.dumps(value, default=str)
+            if isinstance(value, str) and key in sizes and len(value) > sizes[key]:
+                value = value[:sizes[key]]
+            document[key] = value
+        return document
+
+    # Spilling
+
+    def spill_path(self, collection_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{collection_id}.spill.jsonl")
+
+    def spill(self, events: list):
+        """Append events to the local spill file of their collection"""
+        with self.spill_lock:
+            for collection_id in {event[0] for event in events}:
+                with open(self.spill_path(collection_id), 'a', encoding='utf-8') as f:
+                    for event in events:
+                        if event[0] == collection_id:
+                            f.write(json.dumps(event, default=str) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.count('spilled', len(events))
+
+    def replay_spill(self):
+        """Write spilled events back (flusher thread); failures spill them again"""
+        self.last_replay = time.monotonic()
+        if not self.spill_dir:
+            return
+        with self.spill_lock:
+            # Take the files over so new spills go to fresh ones
+            pending = []
+            for path in glob.glob(os.path.join(self.spill_dir, '*.spill.jsonl')):
+                replay_path = f"{path}.{uuid.uuid4().hex[:8]}.replay"
+                os.replace(path, replay_path)
+                pending.append(replay_path)
+            pending.extend(p for p in glob.glob(os.path.join(self.spill_dir, '*.replay')) if p not in pending)
+
+        for path in pending:
+            batch = []
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                        if not isinstance(event, list) or len(event) != 4 or event[0] not in self.sizes:
+                            raise ValueError("not an audit event")
+                    except ValueError as e:  # A line torn by a crash while spilling
+                        self.reject_line(path, line, e)
+                        continue
+                    batch.append(tuple(event))
+                    if len(batch) >= self.batch_size:
+                        self.submit_replayed(batch)
+                        batch = []
+            if batch:
+                self.submit_replayed(batch)
+            os.remove(path)
+
+    def submit_replayed(self, events: list):
+        with self.lock:
+            self.unfinished += len(events)
+        self.count('replayed', len(events))
+        self.submit(events)
+
+    # Shutdown and stats
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued event is written (or spilled); False on timeout"""
+        with self.lock:
+            self.not_empty.notify()
+            return self.all_done.wait_for(lambda: self.unfinished <= 0, timeout)
+
+    def close(self) -> dict:
+        """Stop intake, drain the queue and in-flight batches, return stats"""
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify()
+            self.not_full.notify_all()
+        self.flusher.join()
+
+        # Events left behind by a flusher that died: spill them, or write them here
+        with self.lock:
+            leftover = list(self.queue)
+            self.queue.clear()
+        if leftover and self.spill_dir:
+            self.spill(leftover)
+            with self.lock:
+                self.unfinished -= len(leftover)
+                self.all_done.notify_all()
+        elif leftover:
+            self.submit(leftover)
+        self.executor.shutdown(wait=True)
+        return self.stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def count(self, counter: str, amount: int = 1):
+        with self.stats_lock:
+            self.counters[counter] += amount
+
+    def reject(self, event: tuple, errors: list):
+        """An event the server would never accept: keep it in the spill dir if there is one"""
+        self.count('rejected')
+        with self.stats_lock:
+            if len(self.errors) < self.MAX_ERRORS_KEPT:
+                self.errors.append(f"{event[0]} {event[1]}: {'; '.join(errors)}")
+        if self.spill_dir:
+            with self.spill_lock:
+                with open(os.path.join(self.spill_dir, 'rejected.jsonl'), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'event': event, 'errors': errors}, default=str) + '\n')
+
+    def reject_line(self, path: str, line: str, error: Exception):
+        """A spill line that cannot be read back: move it to rejected.jsonl"""
+        self.count('rejected')
+        self.record_error(os.path.basename(path), error)
+        with self.spill_lock:
+            with open(os.path.join(self.spill_dir, 'rejected.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'spill_file': os.path.basename(path), 'line': line.rstrip('\n'),
+                                    'errors': [str(error)]}) + '\n')
+
+    def record_error(self, collection_id: str, error: Exception):
+        with self.stats_lock:
+            if len(self.errors) < self.MAX_ERRORS_KEPT:
+                self.errors.append(f"{collection_id}: {getattr(error, 'message', None) or error}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            depth = len(self.queue)
+            recorded, max_queue_depth = self.recorded, self.max_queue_depth
+        with self.stats_lock:
+            counters = {'recorded': recorded, 'max_queue_depth': max_queue_depth, **self.counters}
+            counters['blocked_seconds'] = round(counters['blocked_seconds'], 3)
+            return {**counters, 'queue_depth': depth, 'errors': list(self.errors)}
@@ -0,0 +1,311 @@
+"""
+Snapshot export and restore of a whole provisioned database.
+
+export writes the schema (read from the server, in the same format as
+get_collections_config()) and every document into one archive:
+
+    snapshot.tar
+        manifest.json                    schema, document counts, checksums
+        documents/<collection_id>.jsonl.gz
+
+Collections are exported in parallel, each paged with cursor pagination
+while the previous page is compressed, and streamed to disk, so memory
+does not grow with collection size.
+
+restore creates the database and collections through the setup's
+pipelined path (attributes submitted back-to-back, indexes as soon as
+their attributes are ready) and bulk-loads every collection as soon as
+its attributes are available, several collections at a time. Rebuilding
+a seeded environment this way replaces execute_complete_setup plus
+seeding. Re-running a restore is safe: collections that already hold
+all their documents are skipped, existing documents are counted, not
+duplicated.
+
+Only document IDs and attribute values are kept; $createdAt,
+$updatedAt and per-document permissions are set anew on restore. The
+export is not a point-in-time snapshot of a database that is being
+written to.
+
+Usage:
+    python example_db_snapshot.py export snapshot.tar
+    python example_db_snapshot.py restore snapshot.tar --database-id eprescription_test
+    python example_db_snapshot.py info snapshot.tar
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from appwrite.query import Query
+
+from example_dev_set_up import (BatchedDocumentWriter, DevelopmentDatabaseSetup, create_databases_from_env,
+                                iter_documents)
+from example_setup_benchmark import QuietContext
+
+
+SNAPSHOT_VERSION = 1
+MANIFEST = 'manifest.json'
+COMPRESS_LEVEL = 6  # Within a few percent of level 9 on JSON, at well under half the CPU
+
+
+def config_attribute(attr: dict) -> dict:
+    """An attribute read from the server, as a get_collections_config() entry"""
+    attr_type = attr['type']
+    if attr_type == 'string' and attr.get('format') in ('email', 'url'):
+        attr_type = attr['format']
+    elif attr_type == 'double':
+        attr_type = 'float'
+
+    entry = {'key': attr['key'], 'attr_type': attr_type, 'required': bool(attr.get('required'))}
+    if attr_type == 'string':
+        entry['size'] = attr.get('size') or 255
+    if attr.get('default') is not None:
+        entry['default'] = attr['default']
+    return entry
+
+
+def config_index(index: dict) -> dict:
+    return {'key': index['key'], 'index_type': index['type'], 'attributes': list(index['attributes'])}
+
+
+def read_ahead(iterable, depth: int):
+    """Iterate in a background thread, keeping up to depth items ready"""
+    items = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def read_manifest(path: str) -> dict:
+    with tarfile.open(path, 'r') as archive:
+        return json.load(archive.extractfile(MANIFEST))
+
+
+class DatabaseSnapshot:
+    """Export a database to a snapshot archive and restore it"""
+
+    ATTRIBUTE_READY_TIMEOUT = 120.0
+
+    def __init__(self, databases, database_id: str = 'eprescription_dev', workers: int = 4,
+                 page_size: int = 1000, batch_size: int = 100, write_workers: int = 8, log=print):
+        """
+        Args:
+            workers: collections exported or restored at the same time
+            page_size: documents per list_documents page on export
+            write_workers: concurrent bulk writes per collection on restore
+        """
+        self.databases = databases
+        self.database_id = database_id
+        self.workers = workers
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.write_workers = write_workers
+        self.log = log
+
+    def new_setup(self, database_id: str) -> DevelopmentDatabaseSetup:
+        return DevelopmentDatabaseSetup(QuietContext(), self.databases, database_id)
+
+    # Export
+
+    def export(self, path: str) -> dict:
+        """Write the schema and every document to the archive at path"""
+        started = time.perf_counter()
+        setup = self.new_setup(self.database_id)
+        live_schema = setup.read_live_schema()
+        if live_schema is None:
+            raise ValueError(f"Database {self.database_id} does not exist")
+        database_name = self.databases.get(self.database_id)['name']
+
+        schema = [{
+            'id': collection_id,
+            'name': collection['name'] or collection_id,
+            'attributes': [config_attribute(attr) for attr in collection['attributes'].values()
+                           if attr.get('status', 'available') == 'available'],
+            'indexes': [config_index(index) for index in collection['indexes'].values()
+                        if index.get('status', 'available') == 'available'],
+        } for collection_id, collection in live_schema.items()]
+
+        work_dir = tempfile.mkdtemp(prefix='.snapshot-', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                exported = dict(zip([info['id'] for info in schema],
+                                    pool.map(lambda info: self.export_collection(info['id'], work_dir), schema)))
+
+            manifest = {
+                'version': SNAPSHOT_VERSION,
+                'database_id': self.database_id,
+                'database_name': database_name,
+                'created_at': datetime.utcnow().isoformat() + "Z",
+                'schema': schema,
+                'collections': exported,
+            }
+            temp_path = path + '.tmp'
+            with tarfile.open(temp_path, 'w') as archive:
+                body = json.dumps(manifest, indent=2).encode()
+                info = tarfile.TarInfo(MANIFEST)
+                info.size, info.mtime = len(body), int(time.time())
+                archive.addfile(info, io.BytesIO(body))
+                for collection_id in exported:
+                    archive.add(os.path.join(work_dir, f'{collection_id}.jsonl.gz'),
+                                arcname=f'documents/{collection_id}.jsonl.gz')
+            os.replace(temp_path, path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        documents = sum(entry['documents'] for entry in exported.values())
+        seconds = round(time.perf_counter() - started, 3)
+        self.log(f"Exported {documents} documents from {len(schema)} collections to {path} in {seconds}s")
+        return {'path': path, 'collections': len(schema), 'documents': documents,
+                'bytes': os.path.getsize(path), 'seconds': seconds}
+
+    def export_collection(self, collection_id: str, work_dir: str) -> dict:
+        """Stream one collection to <work_dir>/<collection_id>.jsonl.gz"""
+        count = 0
+        digest = hashlib.sha256()
+        documents = read_ahead(iter_documents(self.databases, self.database_id, collection_id,
+                                              page_size=self.page_size), self.page_size)
+        with gzip.open(os.path.join(work_dir, f'{collection_id}.jsonl.gz'), 'wt', encoding='utf-8',
+                       compresslevel=COMPRESS_LEVEL) as out:
+            for document in documents:
+                data = {key: value for key, value in document.items() if not key.startswith('$')}
+                line = json.dumps({'$id': document['$id'], **data}, separators=(',', ':')) + '\n'
+                out.write(line)
+                digest.update(line.encode())
+                count += 1
+        return {'documents': count, 'sha256': digest.hexdigest()}
+
+    # Restore
+
+    def restore(self, path: str, database_id: str = None) -> dict:
+        """Recreate the schema and documents of a snapshot (in database_id, default the original)"""
+        started = time.perf_counter()
+        manifest = read_manifest(path)
+        if manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {manifest.get('version')}")
+
+        database_id = database_id or manifest['database_id']
+        setup = self.new_setup(database_id)
+        setup.database_name = manifest['database_name']
+        if not setup.create_database():
+            raise ValueError(f"Could not create database {database_id}")
+
+        # Largest collections first so they are not the last ones still loading
+        schema = sorted(manifest['schema'], key=lambda info: -manifest['collections'][info['id']]['documents'])
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = dict(zip([info['id'] for info in schema],
+                               pool.map(lambda info: self.restore_collection(setup, path, info, manifest), schema)))
+
+        incomplete = [collection_id for collection_id, result in results.items() if not result['complete']]
+        documents = sum(result['written'] + result['existing'] for result in results.values())
+        seconds = round(time.perf_counter() - started, 3)
+        self.log(f"Restored {documents} documents into {len(schema)} collections of {database_id} in {seconds}s")
+        for collection_id in incomplete:
+            self.log(f"Restore of {collection_id} incomplete: {results[collection_id]}")
+        return {'database_id': database_id, 'collections': results, 'documents': documents,
+                'incomplete': incomplete, 'seconds': seconds}
+
+    def restore_collection(self, setup: DevelopmentDatabaseSetup, path: str, collection_info: dict,
+                           manifest: dict) -> dict:
+        collection_id = collection_info['id']
+        expected = manifest['collections'][collection_id]['documents']
+        result = {'expected': expected, 'written': 0, 'existing': 0, 'failed': 0, 'complete': False}
+
+        if not setup.setup_collection_pipelined(collection_info):
+            result['error'] = 'collection could not be created'
+            return result
+        if expected and not self.wait_for_attributes(setup, collection_info):
+            result['error'] = 'attributes not available'
+            return result
+        if expected and self.count_documents(setup.database_id, collection_id) == expected:
+            # Restored by an earlier run
+            result.update({'existing': expected, 'complete': True})
+            return result
+
+        writer = BatchedDocumentWriter(self.databases, setup.database_id, self.batch_size, self.write_workers)
+        with tarfile.open(path, 'r') as archive:
+            with gzip.open(archive.extractfile(f'documents/{collection_id}.jsonl.gz'), 'rt',
+                           encoding='utf-8') as lines:
+                for line in lines:
+                    document = json.loads(line)
+                    writer.add(collection_id, document.pop('$id'), document)
+        stats = writer.close()
+
+        result.update({key: stats[key] for key in ('written', 'existing', 'failed')})
+        result['complete'] = stats['written'] + stats['existing'] == expected
+        if stats['errors']:
+            result['errors'] = stats['errors']
+        return result
+
+    def count_documents(self, database_id: str, collection_id: str) -> int:
+        response = self.databases.list_documents(database_id=database_id, collection_id=collection_id,
+                                                 queries=[Query.limit(1)])
+        return response['total']
+
+    def wait_for_attributes(self, setup: DevelopmentDatabaseSetup, collection_info: dict) -> bool:
+        """Wait until every attribute of a collection can take writes"""
+        keys = [attr['key'] for attr in collection_info['attributes']]
+        delay = setup.ATTRIBUTE_POLL_INITIAL
+        deadline = time.monotonic() + self.ATTRIBUTE_READY_TIMEOUT
+        while True:
+            statuses = setup.get_attribute_statuses(collection_info['id'])
+            if all(statuses.get(key) == 'available' for key in keys):
+                return True
+            if any(statuses.get(key) in ('failed', 'stuck') for key in keys) or time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * setup.ATTRIBUTE_POLL_BACKOFF, setup.ATTRIBUTE_POLL_MAX)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export or restore a database snapshot")
+    parser.add_argument('command', choices=['export', 'restore', 'info'])
+    parser.add_argument('path', help="Snapshot archive (.tar)")
+    parser.add_argument('--database-id', default=None,
+                        help="Database to export (default eprescription_dev) or restore into "
+                             "(default the snapshot's)")
+    parser.add_argument('--workers', type=int, default=4, help="Collections processed in parallel")
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--write-workers', type=int, default=8, help="Bulk writes in flight per collection")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'info':
+        manifest = read_manifest(args.path)
+        print(json.dumps({key: manifest[key] for key in ('version', 'database_id', 'database_name',
+                                                         'created_at', 'collections')}, indent=2))
+    else:
+        snapshot = DatabaseSnapshot(create_databases_from_env(), args.database_id or 'eprescription_dev',
+                                    workers=args.workers, page_size=args.page_size,
+                                    write_workers=args.write_workers)
+        if args.command == 'export':
+            print(json.dumps(snapshot.export(args.path), indent=2))
+        else:
+            print(json.dumps(snapshot.restore(args.path, args.database_id), indent=2))
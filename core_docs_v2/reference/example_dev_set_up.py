@@ -1,16 +1,125 @@
+import base64
+import csv
+import functools
+import hashlib
+import itertools
 import json
+import math
 import os
+import random
+import threading
 import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
 from datetime import datetime
-from appwrite.client import Client
 from appwrite.services.databases import Databases
 from appwrite.exception import AppwriteException
 from appwrite.permission import Permission
 from appwrite.role import Role
 from appwrite.id import ID
+from appwrite.query import Query
 
+from example_document_validator import compile_validators
+from example_execution_profiler import ExecutionProfiler
+from example_http_transport import PooledClient
 
-def main(context):
+
+def request_body(context) -> dict:
+    """Parsed JSON body of a POST request ({} for GET or an unparseable body)"""
+    if context.req.method == 'POST' and context.req.body:
+        try:
+            return json.loads(context.req.body)
+        except json.JSONDecodeError:
+            return {}
+    return {}
+
+
+# Typed request fields; numbers may also be sent as strings
+REQUEST_FIELDS = {
+    'concurrency': int, 'max_concurrency': int, 'seed_workers': int, 'log_entries': int,
+    'database_count': int, 'database_parallelism': int, 'rate_burst': int,
+    'rate_limit': float, 'time_budget_seconds': float,
+    'database_id': str, 'database_prefix': str, 'continuation_token': str, 'fixtures_dir': str, 'log_level': str,
+    'database_ids': list, 'continuation_tokens': dict, 'index_plan': dict, 'log_sample': dict,
+    'pipelined': bool, 'plan': bool, 'dry_run': bool, 'prometheus': bool,
+}
+TYPE_NAMES = {int: 'an integer', float: 'a number', str: 'a string', list: 'a list', dict: 'an object',
+              bool: 'true or false'}
+
+
+def request_options(body) -> dict:
+    """
+    The request body with its typed fields checked and numbers converted.
+
+    Raises ValueError naming the first bad field, so the caller can answer
+    400 before any work starts.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    options = dict(body)
+    for field, kind in REQUEST_FIELDS.items():
+        value = body.get(field)
+        if value is None:
+            options.pop(field, None)  # Same as leaving it out
+            continue
+        if kind in (int, float):
+            try:
+                if isinstance(value, bool):
+                    raise TypeError(field)
+                value = kind(value)
+                if not math.isfinite(value):
+                    raise ValueError(field)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"Invalid {field}: expected {TYPE_NAMES[kind]}, got {value!r}")
+            options[field] = value
+        elif not isinstance(value, kind):
+            raise ValueError(f"Invalid {field}: expected {TYPE_NAMES[kind]}, got {type(value).__name__}")
+
+    if not all(isinstance(database_id, str) for database_id in body.get('database_ids') or []):
+        raise ValueError("Invalid database_ids: expected a list of strings")
+    if body.get('log_level') and body['log_level'].lower() not in SetupLogger.LEVELS:
+        raise ValueError(f"Invalid log_level: expected one of {', '.join(SetupLogger.LEVELS)}, "
+                         f"got {body['log_level']!r}")
+    for level, rate in (body.get('log_sample') or {}).items():
+        if level.lower() not in SetupLogger.LEVELS:
+            raise ValueError(f"Invalid log_sample: unknown level '{level}'")
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)):
+            raise ValueError(f"Invalid log_sample: rate of '{level}' must be a number, got {rate!r}")
+    return options
+
+
+def main(context, databases=None):
+    """
+    Appwrite function entry point.
+
+    {"profile": true} (or an object of ExecutionProfiler options) runs the
+    execution under cProfile and tracemalloc and adds the top hotspots and
+    peak memory to the response as 'profile'.
+    """
+    try:
+        body = request_options(request_body(context))
+    except ValueError as e:
+        return context.res.json({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }, 400)
+    try:
+        profiler = ExecutionProfiler.from_option(body.get('profile'))
+    except (TypeError, ValueError) as e:
+        return context.res.json({
+            'success': False,
+            'error': f"Invalid profile option: {e}",
+            'timestamp': datetime.utcnow().isoformat()
+        }, 400)
+    if profiler is None:
+        return handle_request(context, databases, body)
+    return profiler.run(handle_request, context, databases, body)
+
+
+def handle_request(context, databases=None, body: dict = None):
     """
     Development Database Setup Function - Updated for Latest Appwrite
 
@@ -18,6 +127,10 @@ def main(context):
 
     Args:
         context: Appwrite context object with req, res, log, error
+        databases: Optional Databases service to use instead of a client
+            built from the environment (e.g. FakeDatabases for local runs)
+        body: Request body checked by request_options() (parsed from the
+            request when not given)
 
     Returns:
         JSON response with setup results
@@ -37,39 +150,214 @@ def main(context):
                 'timestamp': start_time.isoformat()
             }, 405)
 
-        # Parse request body (if POST)
-        body = {}
-        if context.req.method == 'POST' and context.req.body:
-            try:
-                body = json.loads(context.req.body)
-            except json.JSONDecodeError:
-                body = {}
+        # Parse request body (if POST); main() has already checked it
+        if body is None:
+            body = request_options(request_body(context))
 
-        # Check for force recreate flag
+        # Reset before provisioning: true / "fast" (delete documents) or "full" (drop the schema)
         force_recreate = body.get('force_recreate', False)
+        try:
+            DevelopmentDatabaseSetup.reset_strategy(force_recreate)
+        except ValueError as e:
+            return context.res.json({
+                'success': False,
+                'error': str(e),
+                'timestamp': start_time.isoformat()
+            }, 400)
+
+        # Pipelined mode polls attribute readiness instead of sleeping
+        pipelined = body.get('pipelined', True)
+
+        # Number of collections provisioned in parallel (1 = sequential)
+        concurrency = max(1, body.get('concurrency', 4))
+
+        # Diff against the live schema and only issue missing create calls
+        use_plan = body.get('plan', True)
+        dry_run = body.get('dry_run', False)
+
+        # Also return API metrics in Prometheus text format
+        prometheus = body.get('prometheus', False)
+
+        # Flow control shared by every Databases call: optional calls per
+        # second cap, adaptive concurrency starting at max_concurrency / 8
+        max_concurrency = max(1, body.get('max_concurrency', 128))
+        governor = RateGovernor(body.get('rate_limit') or None,
+                                body.get('rate_burst'), max(1, max_concurrency // 8), 1, max_concurrency)
+
+        # Optional fixture set: the name of a subdirectory of the bundled fixtures/
+        fixtures_dir = None
+        if body.get('fixtures_dir'):
+            try:
+                fixtures_dir = DevelopmentDatabaseSetup.fixture_set_dir(body['fixtures_dir'])
+            except ValueError as e:
+                return context.res.json({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': start_time.isoformat()
+                }, 400)
+
+        if body.get('index_plan'):
+            try:
+                DevelopmentDatabaseSetup.check_index_plan(body['index_plan'])
+            except ValueError as e:
+                return context.res.json({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': start_time.isoformat()
+                }, 400)
+
+        def configure(db_setup):
+            # Optional seed overrides
+            if fixtures_dir:
+                db_setup.fixtures_dir = fixtures_dir
+            if body.get('seed_workers'):
+                db_setup.SEED_WORKERS = max(1, body['seed_workers'])
+
+            # Index changes recommended by example_index_advisor.py, in place of
+            # the deployed index_plan.json (merged into the config, drops applied;
+            # checked up front)
+            if body.get('index_plan'):
+                db_setup.index_plan = body['index_plan']
+
+            # Optional log overrides: minimum level, per-level sampling, entries returned
+            if body.get('log_level') or body.get('log_sample'):
+                db_setup.logger = SetupLogger(context, db_setup.LOG_CAPACITY, body.get('log_level', 'info'),
+                                              body.get('log_sample'))
+            if 'log_entries' in body:
+                db_setup.log_entries = max(0, body['log_entries'])
+
+            # Resumable execution: stop before the time budget runs out and
+            # continue from the returned token on the next invocation
+            if body.get('time_budget_seconds'):
+                db_setup.set_time_budget(body['time_budget_seconds'])
+
+        # Fan-out: several databases from the same config (test shards, tenants)
+        database_ids = body.get('database_ids')
+        try:
+            if not database_ids and body.get('database_count'):
+                if body['database_count'] > DevelopmentDatabaseSetup.MAX_DATABASE_COUNT:
+                    raise ValueError(f"database_count is limited to {DevelopmentDatabaseSetup.MAX_DATABASE_COUNT}")
+                prefix = body.get('database_prefix', DevelopmentDatabaseSetup.TEST_DATABASE_PREFIX)
+                database_ids = [f"{prefix}{n:02d}" for n in range(1, body['database_count'] + 1)]
+            DevelopmentDatabaseSetup.check_database_ids(
+                database_ids or [body.get('database_id') or DevelopmentDatabaseSetup.DEVELOPMENT_DATABASE_ID])
+        except ValueError as e:
+            return context.res.json({
+                'success': False,
+                'error': str(e),
+                'timestamp': start_time.isoformat()
+            }, 400)
+        if database_ids:
+            try:
+                fan_out = provision_databases(
+                    context, database_ids, databases, body.get('database_parallelism'), governor, configure,
+                    body.get('continuation_tokens'), force_recreate, pipelined, concurrency, use_plan, dry_run)
+            except ValueError as e:
+                return context.res.json({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.utcnow().isoformat()
+                }, 400)
+
+            end_time = datetime.utcnow()
+            duration = (end_time - start_time).total_seconds()
+            statuses = [result['status'] for result in fan_out['databases'].values()]
+            context.log(f"Provisioned {len(database_ids)} databases in {duration:.2f} seconds")
+            return context.res.json({
+                'success': fan_out['success'],
+                'status': ('failed' if not fan_out['success'] else
+                           'resumable' if 'resumable' in statuses else statuses[0]),
+                'message': f"Provisioned {len(database_ids)} databases",
+                'environment': 'development',
+                'database_ids': database_ids,
+                'databases': fan_out['databases'],
+                'plans_computed': fan_out['plans_computed'],
+                'rate_governor': fan_out['rate_governor'],
+                'api_metrics': fan_out['api_metrics'],
+                'duration_seconds': duration,
+                'timestamp': end_time.isoformat()
+            }, 200 if fan_out['success'] else 500)
 
         # Initialize database setup with context
-        db_setup = DevelopmentDatabaseSetup(context)
+        db_setup = DevelopmentDatabaseSetup(context, databases, body.get('database_id'), governor=governor)
+        configure(db_setup)
+        if body.get('continuation_token'):
+            try:
+                db_setup.load_checkpoint(body['continuation_token'])
+            except ValueError as e:
+                return context.res.json({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.utcnow().isoformat()
+                }, 400)
 
         # Execute setup
-        setup_result = db_setup.execute_complete_setup(force_recreate)
+        setup_result = db_setup.execute_complete_setup(force_recreate, pipelined, concurrency,
+                                                       use_plan, dry_run)
 
         end_time = datetime.utcnow()
         duration = (end_time - start_time).total_seconds()
 
         context.log(f"Setup completed in {duration:.2f} seconds")
 
-        if setup_result['success']:
+        api_metrics = db_setup.api_metrics.summary()
+        report_fields = {'api_metrics': api_metrics, 'rate_governor': governor.summary(),
+                         'log_summary': db_setup.logger.summary()}
+        if prometheus:
+            report_fields['prometheus_metrics'] = db_setup.api_metrics.to_prometheus()
+        context.log(f"API calls: {api_metrics['total_calls']} ({api_metrics['errors']} errors, "
+                    f"{api_metrics['conflicts']} conflicts, {api_metrics['seconds_in_calls']}s in calls)")
+
+        if setup_result['success'] and setup_result.get('dry_run'):
             return context.res.json({
                 'success': True,
+                'message': 'Dry run - no changes made',
+                'environment': 'development',
+                'database_id': db_setup.database_id,
+                'plan': setup_result.get('plan', {}),
+                **report_fields,
+                'duration_seconds': duration,
+                'setup_log': setup_result.get('log', []),
+                'timestamp': end_time.isoformat()
+            }, 200)
+        elif setup_result['success'] and setup_result.get('status') == 'resumable':
+            return context.res.json({
+                'success': True,
+                'status': 'resumable',
+                'message': 'Time budget used up - call again with continuation_token to continue',
+                'environment': 'development',
+                'database_id': db_setup.database_id,
+                'continuation_token': setup_result['continuation_token'],
+                'progress': setup_result.get('progress', {}),
+                'reset': setup_result.get('reset'),
+                'deferred': setup_result.get('deferred', []),
+                'seed_stats': setup_result.get('seed_stats', {}),
+                'duration_seconds': duration,
+                'collection_timings': setup_result.get('collection_timings', {}),
+                'phase_timings': setup_result.get('phase_timings', {}),
+                **report_fields,
+                'setup_log': setup_result.get('log', []),
+                'timestamp': end_time.isoformat()
+            }, 200)
+        elif setup_result['success']:
+            return context.res.json({
+                'success': True,
+                'status': 'complete',
                 'message': 'Development database setup completed successfully',
                 'environment': 'development',
-                'database_id': 'eprescription_dev',
-                'database_name': 'E-Prescription Platform - Development',
+                'database_id': db_setup.database_id,
+                'database_name': db_setup.database_name,
+                'progress': setup_result.get('progress', {}),
+                'reset': setup_result.get('reset'),
                 'collections_created': setup_result.get('collections_created', 0),
                 'indexes_created': setup_result.get('indexes_created', 0),
+                'index_plan': setup_result.get('index_plan'),
                 'default_data_inserted': setup_result.get('default_data_inserted', False),
+                'seed_stats': setup_result.get('seed_stats', {}),
                 'duration_seconds': duration,
+                'collection_timings': setup_result.get('collection_timings', {}),
+                'phase_timings': setup_result.get('phase_timings', {}),
+                **report_fields,
                 'setup_log': setup_result.get('log', []),
                 'timestamp': end_time.isoformat()
             }, 200)
@@ -78,6 +366,7 @@ def main(context):
                 'success': False,
                 'error': 'Development database setup failed',
                 'details': setup_result.get('error', 'Unknown error'),
+                **report_fields,
                 'setup_log': setup_result.get('log', []),
                 'duration_seconds': duration,
                 'timestamp': end_time.isoformat()
@@ -97,17 +386,133 @@ def main(context):
         }, 500)
 
 
+class DeadlineReached(Exception):
+    """Raised when a setup step is deferred because the time budget is used up"""
+
+
+def timed_phase(name: str):
+    """Account a setup method's wall time to a phase (see DevelopmentDatabaseSetup.phase)"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
 class DevelopmentDatabaseSetup:
     """
     Development Database Setup - Updated for Latest Appwrite Function Context
     """
 
-    def __init__(self, context):
+    # Attribute readiness polling (pipelined mode)
+    ATTRIBUTE_POLL_INITIAL = 0.1  # First poll delay in seconds
+    ATTRIBUTE_POLL_MAX = 2.0  # Upper bound for the backoff delay
+    ATTRIBUTE_POLL_BACKOFF = 1.5  # Delay multiplier while nothing becomes ready
+    ATTRIBUTE_READY_TIMEOUT = 120.0  # Give up on pending indexes after this long
+
+    # Page size for list_collections / list_attributes / list_indexes
+    LIST_PAGE_SIZE = 100
+
+    # Seed loading: natural keys for collections without a single-attribute
+    # unique index, and the size of the upsert worker pool
+    SEED_NATURAL_KEYS = {
+        'subscription_plans': 'name',
+        'notification_templates': 'name',
+        'system_settings': 'setting_key'
+    }
+    SEED_WORKERS = 8
+
+    # Databases a request may provision, reset or drop: the development
+    # database, test shards by prefix and the comma-separated ids in the
+    # SETUP_DATABASE_ALLOWLIST environment variable; at most
+    # MAX_DATABASE_COUNT per request
+    DEVELOPMENT_DATABASE_ID = 'eprescription_dev'
+    TEST_DATABASE_PREFIX = 'eprescription_test_'
+    DATABASE_ALLOWLIST_ENV = 'SETUP_DATABASE_ALLOWLIST'
+    MAX_DATABASE_COUNT = 32
+
+    # Index advisor plan (example_index_advisor.py --out) deployed with the function
+    INDEX_PLAN_FILE = 'index_plan.json'
+
+    # force_recreate: documents deleted per page when the server has no bulk
+    # delete, collections reset in parallel, and how long a full reset waits
+    # for the database deletion to finish
+    RESET_PAGE_SIZE = 100
+    RESET_WORKERS = 8
+    RESET_TIMEOUT = 60.0
+
+    # Keep-alive connection pool of the Appwrite client (HTTP/2 needs httpx)
+    HTTP_POOL_SIZE = 32
+    HTTP2 = False
+
+    # Stop starting new work this long before the time budget runs out, so
+    # the checkpoint can still be returned (seconds)
+    DEADLINE_MARGIN = 5.0
+    CHECKPOINT_VERSION = 1
+
+    # Log ring buffer size and how many of the latest entries responses carry
+    LOG_CAPACITY = 1000
+    LOG_RESPONSE_ENTRIES = 100
+
+    def __init__(self, context, databases=None, database_id: str = None, database_name: str = None,
+                 governor=None, api_metrics=None):
         # Store context for logging
         self.context = context
 
-        # Initialize Appwrite client with correct environment variables
-        self.client = Client()
+        # An injected Databases service (e.g. FakeDatabases) skips the client
+        if databases is not None:
+            self.client = None
+        else:
+            databases = self.connect()
+
+        # Every Databases call is timed and counted, and goes through the
+        # rate governor (shared when several setups run side by side)
+        self.api_metrics = api_metrics or ApiMetrics()
+        self.governor = governor or RateGovernor()
+        self.databases = InstrumentedDatabases(databases, self.api_metrics, self.count_phase_call, self.governor)
+
+        # Development database configuration (other ids for test shards or tenants)
+        self.database_id = database_id or "eprescription_dev"
+        self.database_name = database_name or "E-Prescription Platform - Development"
+
+        # Setup tracking
+        self.logger = SetupLogger(context, self.LOG_CAPACITY)
+        self.log_prefix = ''  # Tells interleaved fan-out logs apart
+        self.log_entries = self.LOG_RESPONSE_ENTRIES
+        self.collections_created = 0
+        self.indexes_created = 0
+        self.collection_timings = {}
+        self.default_data_inserted = False
+        self.seed_stats = {}
+        self.list_calls = 0
+
+        # Development seed fixtures (<collection_id>.jsonl / .csv)
+        self.fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+        # Applied index advisor plan, deployed next to this file; merged into
+        # the collections config so plans and resets keep its changes
+        self._collections_config = None
+        self._config_hash = None
+        self.index_plan = self.load_index_plan(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), self.INDEX_PLAN_FILE))
+
+        # Guards counters updated from scheduler worker threads
+        self._lock = threading.Lock()
+
+        # Resumable execution: optional deadline and the progress checkpoint
+        self.deadline = None
+        self.checkpoint = self.new_checkpoint()
+
+        # Per-phase wall time, idle time and API calls; the current phase is per thread
+        self.phase_stats = {}
+        self._phase = threading.local()
+
+    def connect(self) -> Databases:
+        """Build the Databases service from the function environment"""
+        # Initialize a pooled Appwrite client with correct environment variables
+        self.client = PooledClient(self.HTTP_POOL_SIZE, self.HTTP2)
 
         # Get environment variables with proper error handling
         endpoint = os.getenv('APPWRITE_FUNCTION_API_ENDPOINT')
@@ -127,8 +532,8 @@ class DevelopmentDatabaseSetup:
 
         # Use dynamic API key from headers (recommended) or environment variable
         api_key = None
-        if hasattr(context.req, 'headers') and 'x-appwrite-key' in context.req.headers:
-            api_key = context.req.headers['x-appwrite-key']
+        if hasattr(self.context.req, 'headers') and 'x-appwrite-key' in self.context.req.headers:
+            api_key = self.context.req.headers['x-appwrite-key']
             self.context.log("Using dynamic API key from headers")
         else:
             api_key = os.getenv('APPWRITE_FUNCTION_API_KEY')
@@ -138,80 +543,311 @@ class DevelopmentDatabaseSetup:
             raise Exception("API key not found in headers or environment variables")
 
         self.client.set_key(api_key)
-        self.databases = Databases(self.client)
-
-        # Development database configuration
-        self.database_id = "eprescription_dev"
-        self.database_name = "E-Prescription Platform - Development"
-
-        # Setup tracking
-        self.setup_log = []
-        self.collections_created = 0
-        self.indexes_created = 0
-
-    def log(self, message: str, level: str = "info"):
-        """Enhanced logging using context.log()"""
-        timestamp = datetime.utcnow().isoformat()
-        log_entry = {
-            'timestamp': timestamp,
-            'level': level.upper(),
-            'message': message
+        return Databases(self.client)
+
+    @contextmanager
+    def phase(self, name: str, timed: bool = True):
+        """
+        Attribute the enclosed work to a setup phase.
+
+        Nested phases count towards the outermost one, so phase seconds
+        never overlap within a thread. timed=False only labels the thread
+        (API calls made by pool workers of an already timed phase).
+        """
+        if getattr(self._phase, 'name', None) is not None:
+            yield
+            return
+        self._phase.name = name
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._phase.name = None
+            if timed:
+                self.record_phase(name, seconds=time.monotonic() - started)
+
+    def current_phase(self) -> str:
+        return getattr(self._phase, 'name', None) or 'other'
+
+    def record_phase(self, name: str, seconds: float = 0.0, idle_seconds: float = 0.0, calls: int = 0):
+        with self._lock:
+            stats = self.phase_stats.setdefault(name, {'seconds': 0.0, 'idle_seconds': 0.0, 'calls': 0})
+            stats['seconds'] += seconds
+            stats['idle_seconds'] += idle_seconds
+            stats['calls'] += calls
+
+    def count_phase_call(self, operation: str):
+        """InstrumentedDatabases hook: count an API call towards the current phase"""
+        self.record_phase(self.current_phase(), calls=1)
+
+    def idle(self, seconds: float, phase: str):
+        """time.sleep, accounted as idle time of a phase"""
+        time.sleep(seconds)
+        self.record_phase(phase, seconds=seconds, idle_seconds=seconds)
+
+    def get_phase_timings(self) -> dict:
+        """Rounded copy of phase_stats"""
+        with self._lock:
+            return {name: {key: round(value, 3) for key, value in stats.items()}
+                    for name, stats in self.phase_stats.items()}
+
+    def set_time_budget(self, seconds: float):
+        """Defer remaining work once less than DEADLINE_MARGIN of the budget is left"""
+        self.deadline = time.monotonic() + max(0.0, seconds - self.DEADLINE_MARGIN)
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check_deadline(self):
+        if self.out_of_time():
+            raise DeadlineReached("Time budget used up")
+
+    def new_checkpoint(self) -> dict:
+        return {
+            'version': self.CHECKPOINT_VERSION,
+            'database_id': self.database_id,
+            'config_hash': self.config_hash(),
+            'invocations': 0,
+            'database_created': False,
+            'collections_started': [],
+            'collections_done': [],
+            'attributes': {},
+            'indexes': {},
+            'seed_files_done': [],
+            'seed_rows': {},
+            'seed_done': False,
+            'reset_done': False,
         }
-        self.setup_log.append(log_entry)
 
-        # Use context logging methods
-        if level.lower() == "error":
-            self.context.error(message)
-        else:
-            self.context.log(message)
+    def config_hash(self) -> str:
+        """Fingerprint of the collections config with the index plan applied; tokens from another are rejected"""
+        if self._config_hash is None:
+            encoded = json.dumps(self.collections_config(), sort_keys=True, default=str)
+            self._config_hash = hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:16]
+        return self._config_hash
+
+    def mark_done(self, section: str, collection_id: str = None, key: str = None):
+        """Record finished work in the checkpoint"""
+        with self._lock:
+            if collection_id is None:
+                self.checkpoint[section] = True
+            elif key is None:
+                if collection_id not in self.checkpoint[section]:
+                    self.checkpoint[section].append(collection_id)
+            else:
+                keys = self.checkpoint[section].setdefault(collection_id, [])
+                if key not in keys:
+                    keys.append(key)
+
+    def encode_checkpoint(self) -> str:
+        """Continuation token: the checkpoint as compressed, URL-safe JSON"""
+        with self._lock:
+            # The index plan may have been replaced since the checkpoint was created
+            encoded = json.dumps({**self.checkpoint, 'config_hash': self.config_hash()}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(zlib.compress(encoded.encode('utf-8'), 9)).decode('ascii')
+
+    def load_checkpoint(self, token: str):
+        """Resume from a continuation token returned by an earlier run"""
+        try:
+            checkpoint = json.loads(zlib.decompress(base64.urlsafe_b64decode(token.encode('ascii'))))
+        except (ValueError, zlib.error) as e:
+            raise ValueError(f"Invalid continuation token: {str(e)}")
+        if checkpoint.get('version') != self.CHECKPOINT_VERSION:
+            raise ValueError("Continuation token has an unsupported version")
+        if checkpoint.get('database_id') != self.database_id:
+            raise ValueError(f"Continuation token is for database {checkpoint.get('database_id')}")
+        if checkpoint.get('config_hash') != self.config_hash():
+            raise ValueError("Continuation token was created with a different collections config")
+        self.checkpoint = checkpoint
+
+    def apply_checkpoint(self, collections_config: list) -> list:
+        """Drop collections, attributes and indexes the checkpoint records as done"""
+        remaining = []
+        for info in collections_config:
+            collection_id = info['id']
+            if collection_id in self.checkpoint['collections_done']:
+                continue
+            attributes_done = set(self.checkpoint['attributes'].get(collection_id, []))
+            indexes_done = set(self.checkpoint['indexes'].get(collection_id, []))
+            remaining.append({
+                **info,
+                'collection_exists': (info.get('collection_exists')
+                                      or collection_id in self.checkpoint['collections_started']),
+                'existing_attributes': sorted(set(info.get('existing_attributes', [])) | attributes_done),
+                'attributes': [a for a in info['attributes'] if a['key'] not in attributes_done],
+                'indexes': [i for i in info.get('indexes', []) if i['key'] not in indexes_done],
+            })
+        return remaining
+
+    def checkpoint_progress(self) -> dict:
+        with self._lock:
+            return {
+                'invocations': self.checkpoint['invocations'],
+                'collections_done': len(self.checkpoint['collections_done']),
+                'collections_total': len(self.collections_config()),
+                'attributes_created': sum(len(keys) for keys in self.checkpoint['attributes'].values()),
+                'indexes_created': sum(len(keys) for keys in self.checkpoint['indexes'].values()),
+                'seed_done': self.checkpoint['seed_done'],
+                'seed_rows': dict(self.checkpoint['seed_rows']),
+            }
 
-    def execute_complete_setup(self, force_recreate: bool = False) -> dict:
-        """Execute complete development database setup"""
+    def log(self, message: str, level: str = "info", event: str = None):
+        """Log through the bounded SetupLogger (forwarded to context.log/context.error)"""
+        self.logger.log(self.log_prefix + message, level, event)
+
+    @property
+    def setup_log(self) -> list:
+        """The most recent log entries, as returned in responses"""
+        return self.logger.tail(self.log_entries)
+
+    def execute_complete_setup(self, force_recreate: bool = False, pipelined: bool = True,
+                               concurrency: int = 1, use_plan: bool = True,
+                               dry_run: bool = False, schema_plan: dict = None) -> dict:
+        """
+        Execute complete development database setup.
+
+        force_recreate resets the database first (True or 'fast': delete
+        every document, 'full': drop and rebuild the schema); the seed task
+        then reseeds it. schema_plan skips reading the live schema when the
+        caller already planned this database (see provision_databases).
+        """
         try:
             self.log("Starting development database setup...")
             self.log(f"Database ID: {self.database_id}")
             self.log(f"Database Name: {self.database_name}")
             self.log(f"Force Recreate: {force_recreate}")
+            self.log(f"Pipelined: {pipelined}")
+            self.log(f"Concurrency: {concurrency}")
+            self.log(f"Use Plan: {use_plan}")
+            self.log(f"Dry Run: {dry_run}")
+
+            with self._lock:
+                self.checkpoint['invocations'] += 1
+            if self.checkpoint['invocations'] > 1:
+                self.log(f"Resuming from checkpoint (invocation {self.checkpoint['invocations']})")
+
+            collections_config = self.collections_config()
+            all_collection_ids = {info['id'] for info in collections_config}
+            database_exists = False
+
+            # Reset once, not again when resuming from a continuation token
+            reset = None
+            reset_strategy = self.reset_strategy(force_recreate)
+            if reset_strategy and dry_run:
+                self.log(f"Dry run: would reset the database ({reset_strategy})", "warning")
+            elif reset_strategy and not self.checkpoint.get('reset_done'):
+                reset = self.reset_database(reset_strategy)
+                self.mark_done('reset_done')
+                schema_plan = None  # Planned before the reset
+
+            # Diff the live schema against the config and keep only the delta
+            if use_plan or dry_run:
+                if schema_plan is None:
+                    schema_plan = self.build_schema_plan(collections_config)
+                self.log_schema_plan(schema_plan)
+
+                if dry_run:
+                    return {
+                        'success': True,
+                        'dry_run': True,
+                        'plan': schema_plan,
+                        'log': self.setup_log
+                    }
 
-            # Create database
-            if not self.create_database():
-                return {
-                    'success': False,
-                    'error': 'Failed to create database',
-                    'log': self.setup_log
-                }
-
-            # Setup collections in optimized order
-            collections_config = self.get_collections_config()
+                database_exists = schema_plan['database_exists']
+                collections_config = schema_plan['collections']
 
-            for collection_info in collections_config:
-                collection_id = collection_info['id']
-                self.log(f"Setting up collection: {collection_id}")
+            # Skip work an earlier invocation already finished
+            collections_config = self.apply_checkpoint(collections_config)
+            database_exists = database_exists or self.checkpoint['database_created']
 
-                if not self.setup_collection(collection_info):
+            # Create database
+            if not database_exists:
+                if not self.create_database():
                     return {
                         'success': False,
-                        'error': f'Failed to setup collection: {collection_id}',
+                        'error': 'Failed to create database',
                         'log': self.setup_log
                     }
+                self.mark_done('database_created')
+
+            # Setup collections in optimized order, independent ones in parallel
+            scheduled_ids = {info['id'] for info in collections_config}
+
+            def pending_dependencies(depends_on):
+                # Dependencies already satisfied by the live schema are dropped
+                unknown = set(depends_on) - all_collection_ids
+                if unknown:
+                    raise ValueError(f"Unknown collection dependencies: {', '.join(sorted(unknown))}")
+                return [dep for dep in depends_on if dep in scheduled_ids]
+
+            tasks = [{
+                'id': collection_info['id'],
+                'depends_on': pending_dependencies(collection_info.get('depends_on', [])),
+                'run': lambda info=collection_info: self.run_collection_task(info, pipelined)
+            } for collection_info in collections_config]
+
+            # Development-specific default data only needs its own collections
+            if not self.checkpoint['seed_done']:
+                tasks.append({
+                    'id': 'seed_data',
+                    'depends_on': pending_dependencies(
+                        [collection_id for collection_id, _ in self.find_fixture_files()]),
+                    'run': self.run_seed_task
+                })
+
+            schedule = self.run_dependency_schedule(tasks, concurrency)
+            self.collection_timings = schedule['timings']
+
+            if schedule['deferred'] and not schedule['failed']:
+                self.log(f"Time budget used up, deferred: {', '.join(schedule['deferred'])}", "warning")
+                return {
+                    'success': True,
+                    'status': 'resumable',
+                    'continuation_token': self.encode_checkpoint(),
+                    'progress': self.checkpoint_progress(),
+                    'deferred': schedule['deferred'],
+                    'reset': reset,
+                    'collections_created': self.collections_created,
+                    'indexes_created': self.indexes_created,
+                    'seed_stats': self.seed_stats,
+                    'collection_timings': self.collection_timings,
+                    'phase_timings': self.get_phase_timings(),
+                    'log': self.setup_log
+                }
 
-                self.collections_created += 1
-                time.sleep(0.5)  # Brief pause between collections
+            if schedule['failed']:
+                return {
+                    'success': False,
+                    'error': f"Failed to setup collection: {schedule['failed']}",
+                    'collection_timings': self.collection_timings,
+                    'log': self.setup_log
+                }
 
-            # Insert development-specific default data
-            self.log("Inserting development default data...")
-            default_data_success = self.insert_development_data()
+            # The plan's indexes were created with the config; drop the ones it retires
+            index_plan = None
+            if self.index_plan and self.index_plan.get('drop'):
+                index_plan = self.apply_index_plan({'drop': self.index_plan['drop']})
 
             self.log(f"Development database setup completed successfully!")
             self.log(f"Collections created: {self.collections_created}")
             self.log(f"Indexes created: {self.indexes_created}")
-            self.log(f"Default data inserted: {default_data_success}")
+            self.log(f"Default data inserted: {self.default_data_inserted}")
+            self.log(f"Seed rows: {sum(stats['rows'] for stats in self.seed_stats.values())}")
 
             return {
                 'success': True,
+                'status': 'complete',
+                'progress': self.checkpoint_progress(),
+                'reset': reset,
                 'collections_created': self.collections_created,
                 'indexes_created': self.indexes_created,
-                'default_data_inserted': default_data_success,
+                'default_data_inserted': self.default_data_inserted,
+                'index_plan': index_plan,
+                'seed_stats': self.seed_stats,
+                'collection_timings': self.collection_timings,
+                'phase_timings': self.get_phase_timings(),
+                'api_metrics': self.api_metrics.summary(),
                 'log': self.setup_log
             }
 
@@ -223,6 +859,402 @@ class DevelopmentDatabaseSetup:
                 'log': self.setup_log
             }
 
+    @staticmethod
+    def reset_strategy(force_recreate):
+        """Normalize force_recreate (bool or strategy name) to None, 'fast' or 'full'"""
+        if not force_recreate:
+            return None
+        if force_recreate is True:
+            return 'fast'
+        if force_recreate in ('fast', 'full'):
+            return force_recreate
+        raise ValueError(f"Unknown force_recreate strategy: {force_recreate} (use true, 'fast' or 'full')")
+
+    @timed_phase('reset')
+    def reset_database(self, strategy: str = 'fast') -> dict:
+        """
+        Return the database to a clean state before provisioning.
+
+        'fast' keeps the schema and deletes every document, collection by
+        collection in parallel, so no attribute or index is rebuilt.
+        'full' deletes the database and waits until it is gone; the
+        provisioning that follows rebuilds everything.
+        Only databases that check_database_ids() allows are reset.
+        """
+        started = time.monotonic()
+        self.check_database_ids([self.database_id])  # Never drop or empty a database outside the allowlist
+        self.log(f"Resetting database {self.database_id} ({strategy})", "warning", event='reset')
+
+        if strategy == 'full':
+            try:
+                self.databases.delete(database_id=self.database_id)
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+            self.wait_for_database_deleted()
+            return {'strategy': strategy, 'seconds': round(time.monotonic() - started, 3)}
+
+        live_schema = self.read_live_schema() or {}
+        deleted = {}
+        for collection_id, count in self.bounded_map(
+                lambda collection_id: (collection_id, self.delete_all_documents(collection_id)),
+                sorted(live_schema), self.RESET_WORKERS):
+            deleted[collection_id] = count
+        self.log(f"Deleted {sum(deleted.values())} documents from {len(deleted)} collections", event='reset_done')
+        return {'strategy': strategy, 'deleted': deleted, 'seconds': round(time.monotonic() - started, 3)}
+
+    def delete_all_documents(self, collection_id: str) -> int:
+        """Delete every document of a collection; returns how many were deleted"""
+        deleted = 0
+        if hasattr(self.databases, 'delete_documents'):
+            try:
+                # Without queries the server deletes all documents; repeat until nothing is left
+                while True:
+                    count = self.databases.delete_documents(database_id=self.database_id,
+                                                            collection_id=collection_id)['total']
+                    deleted += count
+                    if not count:
+                        return deleted
+            except AppwriteException as e:
+                if e.code not in (404, 405, 501):
+                    raise
+                # Older server without bulk endpoints: delete row by row
+
+        def delete(document):
+            try:
+                self.databases.delete_document(database_id=self.database_id, collection_id=collection_id,
+                                               document_id=document['$id'])
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+
+        while True:
+            page = self.databases.list_documents(
+                database_id=self.database_id,
+                collection_id=collection_id,
+                queries=[Query.select(['$id']), Query.limit(self.RESET_PAGE_SIZE)]
+            )['documents']
+            if not page:
+                return deleted
+            # No cursor: the first page is always what is left
+            for _ in self.bounded_map(delete, page, self.RESET_WORKERS):
+                deleted += 1
+
+    def wait_for_database_deleted(self):
+        """Poll until the server has finished deleting the database"""
+        delay = self.ATTRIBUTE_POLL_INITIAL
+        deadline = time.monotonic() + self.RESET_TIMEOUT
+        while True:
+            try:
+                self.databases.get(database_id=self.database_id)
+            except AppwriteException as e:
+                if e.code == 404:
+                    return
+                raise
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Database {self.database_id} still exists {self.RESET_TIMEOUT}s after deletion")
+            time.sleep(delay)
+            delay = min(delay * self.ATTRIBUTE_POLL_BACKOFF, self.ATTRIBUTE_POLL_MAX)
+
+    def run_collection_task(self, collection_info: dict, pipelined: bool) -> bool:
+        """Scheduler task: setup one collection"""
+        collection_id = collection_info['id']
+        self.log(f"Setting up collection: {collection_id}", event='collection_setup')
+
+        if not self.setup_collection(collection_info, pipelined):
+            return False
+
+        self.mark_done('collections_done', collection_id)
+        with self._lock:
+            self.collections_created += 1
+        if not pipelined:
+            self.idle(0.5, 'throttle')  # Brief pause between collections
+        return True
+
+    def run_seed_task(self) -> bool:
+        """Scheduler task: insert development default data"""
+        self.log("Inserting development default data...")
+        self.default_data_inserted = self.insert_development_data()
+        self.mark_done('seed_done')
+        return True  # Seed failures are reported, not fatal
+
+    def run_dependency_schedule(self, tasks: list, max_workers: int) -> dict:
+        """
+        Run tasks on a bounded thread pool, respecting declared dependencies.
+
+        Each task is a dict with 'id', 'depends_on' (list of task ids) and
+        'run' (callable returning bool). Ready tasks start in declaration
+        order, so max_workers=1 reproduces the sequential setup. After the
+        first failure, or once the time budget is used up, no new tasks are
+        started; a task raising DeadlineReached is deferred, not failed.
+
+        Returns:
+            dict with 'completed' ids, the first 'failed' id (or None),
+            'deferred' ids (not run or interrupted) and per-task 'timings'
+            in seconds
+        """
+        task_ids = {task['id'] for task in tasks}
+        for task in tasks:
+            unknown = set(task['depends_on']) - task_ids
+            if unknown:
+                raise ValueError(f"Task {task['id']} depends on unknown tasks: {', '.join(sorted(unknown))}")
+
+        waiting = list(tasks)
+        running = {}
+        completed = []
+        deferred = []
+        timings = {}
+        failed = None
+
+        def timed(task):
+            started = time.monotonic()
+            try:
+                ok = task['run']()
+            except DeadlineReached:
+                ok = None
+            except Exception as e:
+                self.log(f"Task {task['id']} raised: {str(e)}", "error")
+                ok = False
+            return ok, time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while waiting or running:
+                if failed is None and not self.out_of_time():
+                    for task in list(waiting):
+                        if len(running) >= max_workers:
+                            break
+                        if all(dep in completed for dep in task['depends_on']):
+                            waiting.remove(task)
+                            running[executor.submit(timed, task)] = task
+
+                if not running:
+                    if failed is None and not self.out_of_time():
+                        stuck = ', '.join(task['id'] for task in waiting)
+                        raise ValueError(f"Circular task dependencies: {stuck}")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    ok, elapsed = future.result()
+                    timings[task['id']] = round(elapsed, 3)
+                    self.log(f"Task {task['id']} finished in {elapsed:.2f}s")
+                    if ok:
+                        completed.append(task['id'])
+                    elif ok is None:
+                        deferred.append(task['id'])
+                    elif failed is None:
+                        failed = task['id']
+
+        deferred.extend(task['id'] for task in waiting)
+        return {'completed': completed, 'failed': failed, 'deferred': deferred, 'timings': timings}
+
+    def list_all(self, method, result_key: str, **kwargs) -> list:
+        """Read every item of a paginated list call"""
+        items = []
+        offset = 0
+        while True:
+            response = method(queries=[Query.limit(self.LIST_PAGE_SIZE), Query.offset(offset)], **kwargs)
+            with self._lock:
+                self.list_calls += 1
+            page = response[result_key]
+            items.extend(page)
+            if len(page) < self.LIST_PAGE_SIZE:
+                return items
+            offset += len(page)
+
+    def read_live_schema(self):
+        """
+        Read the live schema of the development database.
+
+        Returns:
+            dict of collection_id -> {'name', 'attributes': {key: attr}, 'indexes': {key: index}},
+            or None when the database does not exist yet
+        """
+        try:
+            collections = self.list_all(self.databases.list_collections, 'collections',
+                                        database_id=self.database_id)
+        except AppwriteException as e:
+            if e.code == 404:
+                return None
+            raise
+
+        schema = {}
+        for collection in collections:
+            collection_id = collection['$id']
+
+            # Collection payloads normally embed attributes and indexes
+            attributes = collection.get('attributes')
+            if attributes is None:
+                attributes = self.list_all(self.databases.list_attributes, 'attributes',
+                                           database_id=self.database_id, collection_id=collection_id)
+            indexes = collection.get('indexes')
+            if indexes is None:
+                indexes = self.list_all(self.databases.list_indexes, 'indexes',
+                                        database_id=self.database_id, collection_id=collection_id)
+
+            schema[collection_id] = {
+                'name': collection.get('name'),
+                'attributes': {attr['key']: attr for attr in attributes},
+                'indexes': {index['key']: index for index in indexes}
+            }
+        return schema
+
+    @classmethod
+    def schema_fingerprint(cls, live_schema) -> str:
+        """Digest of what the schema plan depends on; equal digests get equal plans"""
+        if live_schema is None:
+            return 'no-database'
+        reduced = {
+            collection_id: {
+                'attributes': {key: [cls.live_attribute_signature(attr), attr.get('status')]
+                               for key, attr in live['attributes'].items()},
+                'indexes': {key: [index.get('type'), list(index.get('attributes', []))]
+                            for key, index in live['indexes'].items()},
+            }
+            for collection_id, live in live_schema.items()
+        }
+        return hashlib.sha256(json.dumps(reduced, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def attribute_signature(attr_type: str, size: int = None) -> tuple:
+        """Comparable (type, detail) pair for a configured attribute"""
+        if attr_type in ('email', 'url'):
+            return 'string', attr_type
+        if attr_type == 'string':
+            return 'string', size or 255
+        if attr_type == 'float':
+            return 'double', None
+        return attr_type, None
+
+    @staticmethod
+    def live_attribute_signature(attr: dict) -> tuple:
+        """Comparable (type, detail) pair for an attribute read from the server"""
+        attr_type = attr.get('type')
+        if attr_type == 'string':
+            if attr.get('format') in ('email', 'url'):
+                return 'string', attr['format']
+            return 'string', attr.get('size')
+        if attr_type == 'float':
+            return 'double', None
+        return attr_type, None
+
+    @staticmethod
+    def attribute_options_changed(attr: dict, live_attr: dict) -> bool:
+        """Whether a live attribute's required flag or default differs from its config"""
+        required = bool(attr.get('required', False))
+        if bool(live_attr.get('required')) != required:
+            return True
+        return not required and live_attr.get('default') != attr.get('default')
+
+    @timed_phase('plan')
+    def build_schema_plan(self, collections_config: list) -> dict:
+        """
+        Diff the configured schema against the live database.
+
+        Returns:
+            dict with 'database_exists', 'collections' (config entries reduced
+            to the missing attributes/indexes, plus 'collection_exists',
+            'existing_attributes' and 'changed_attributes': attributes whose
+            required flag or default differs from the config), 'actions',
+            'drift' and 'api_calls'
+        """
+        list_calls_before = self.list_calls
+        live_schema = self.read_live_schema()
+        return self.plan_from_live_schema(collections_config, live_schema,
+                                          max(1, self.list_calls - list_calls_before))
+
+    def plan_from_live_schema(self, collections_config: list, live_schema, read_calls: int = 1) -> dict:
+        """The schema plan for an already read live schema (None: no database)"""
+        database_exists = live_schema is not None
+        live_schema = live_schema or {}
+
+        planned = []
+        actions = []
+        drift = []
+
+        if not database_exists:
+            actions.append({'op': 'create_database', 'database_id': self.database_id})
+
+        for collection_info in collections_config:
+            collection_id = collection_info['id']
+            live = live_schema.get(collection_id, {'attributes': {}, 'indexes': {}})
+            collection_exists = collection_id in live_schema
+
+            missing_attributes = []
+            changed_attributes = []
+            for attr in collection_info['attributes']:
+                live_attr = live['attributes'].get(attr['key'])
+                if live_attr is None:
+                    missing_attributes.append(attr)
+                    continue
+                expected = self.attribute_signature(attr['attr_type'], attr.get('size'))
+                actual = self.live_attribute_signature(live_attr)
+                if expected != actual:
+                    drift.append(f"{collection_id}.{attr['key']}: expected {expected}, found {actual}")
+                elif self.attribute_options_changed(attr, live_attr):
+                    changed_attributes.append(attr)
+                if live_attr.get('status') in ('failed', 'stuck'):
+                    drift.append(f"{collection_id}.{attr['key']}: attribute status is {live_attr['status']}")
+
+            missing_indexes = []
+            for index in collection_info.get('indexes', []):
+                live_index = live['indexes'].get(index['key'])
+                if live_index is None:
+                    missing_indexes.append(index)
+                elif (live_index.get('type') != index['index_type']
+                      or list(live_index.get('attributes', [])) != list(index['attributes'])):
+                    drift.append(f"{collection_id}.{index['key']}: index definition differs from config")
+
+            if collection_exists and not missing_attributes and not changed_attributes and not missing_indexes:
+                continue
+
+            if not collection_exists:
+                actions.append({'op': 'create_collection', 'collection_id': collection_id})
+            actions.extend({'op': 'create_attribute', 'collection_id': collection_id, 'key': attr['key']}
+                           for attr in missing_attributes)
+            actions.extend({'op': 'update_attribute', 'collection_id': collection_id, 'key': attr['key']}
+                           for attr in changed_attributes)
+            actions.extend({'op': 'create_index', 'collection_id': collection_id, 'key': index['key']}
+                           for index in missing_indexes)
+
+            planned.append({
+                **collection_info,
+                'attributes': missing_attributes,
+                'indexes': missing_indexes,
+                'collection_exists': collection_exists,
+                'existing_attributes': list(live['attributes']),
+                'changed_attributes': changed_attributes
+            })
+
+        return {
+            'database_exists': database_exists,
+            'collections': planned,
+            'actions': actions,
+            'drift': drift,
+            'api_calls': {
+                'read': read_calls,
+                'write': len(actions),
+                'total': read_calls + len(actions)
+            }
+        }
+
+    def log_schema_plan(self, schema_plan: dict):
+        """Log the schema plan in a readable form"""
+        for action in schema_plan['actions']:
+            target = action.get('collection_id', action.get('database_id'))
+            if 'key' in action:
+                target = f"{target}.{action['key']}"
+            self.log(f"Plan: {action['op']} {target}", event=f"plan_{action['op']}")
+        for message in schema_plan['drift']:
+            self.log(f"Schema drift (not changed): {message}", "warning")
+
+        api_calls = schema_plan['api_calls']
+        self.log(f"Schema plan: {len(schema_plan['actions'])} actions, "
+                 f"{api_calls['total']} API calls ({api_calls['read']} read, {api_calls['write']} write), "
+                 f"{len(schema_plan['collections'])} collections to update")
+
+    @timed_phase('create_database')
     def create_database(self) -> bool:
         """Create the development database"""
         try:
@@ -240,31 +1272,134 @@ class DevelopmentDatabaseSetup:
                 self.log(f"Error creating database: {e.message}", "error")
                 return False
 
-    def setup_collection(self, collection_info: dict) -> bool:
+    def setup_collection(self, collection_info: dict, pipelined: bool = False) -> bool:
         """Setup a single collection with attributes and indexes"""
+        if pipelined:
+            return self.setup_collection_pipelined(collection_info)
+
         collection_id = collection_info['id']
         collection_name = collection_info['name']
 
-        # Create collection
-        if not self.create_collection(collection_id, collection_name):
+        # Create collection (unless the schema plan found it already)
+        self.check_deadline()
+        if not collection_info.get('collection_exists') and not self.create_collection(collection_id, collection_name):
             return False
+        self.mark_done('collections_started', collection_id)
 
         # Create attributes
         for attr in collection_info['attributes']:
-            if not self.create_attribute(collection_id, **attr):
+            self.check_deadline()
+            if self.create_attribute(collection_id, **attr):
+                self.mark_done('attributes', collection_id, attr['key'])
+            else:
                 self.log(f"Failed to create attribute {attr['key']} in {collection_id}", "error")
                 # Continue with other attributes
+        for attr in collection_info.get('changed_attributes', []):
+            self.check_deadline()
+            self.update_attribute(collection_id, **attr)
 
         # Small delay for attribute processing
-        time.sleep(1)
+        self.idle(1, 'attribute_wait')
 
         # Create indexes
         for index in collection_info.get('indexes', []):
+            self.check_deadline()
             if self.create_index(collection_id, **index):
-                self.indexes_created += 1
+                self.mark_done('indexes', collection_id, index['key'])
+                with self._lock:
+                    self.indexes_created += 1
 
         return True
 
+    def setup_collection_pipelined(self, collection_info: dict) -> bool:
+        """
+        Setup a collection without fixed sleeps.
+
+        All attributes are submitted back-to-back, then attribute status is
+        polled with adaptive backoff and each index is created as soon as
+        every attribute it references is available.
+        """
+        collection_id = collection_info['id']
+        collection_name = collection_info['name']
+
+        # Create collection (unless the schema plan found it already)
+        self.check_deadline()
+        if not collection_info.get('collection_exists') and not self.create_collection(collection_id, collection_name):
+            return False
+        self.mark_done('collections_started', collection_id)
+
+        # Submit all attributes without waiting for them to be processed
+        submitted = set(collection_info.get('existing_attributes', []))
+        for attr in collection_info['attributes']:
+            self.check_deadline()
+            if self.create_attribute(collection_id, **attr):
+                submitted.add(attr['key'])
+                self.mark_done('attributes', collection_id, attr['key'])
+            else:
+                self.log(f"Failed to create attribute {attr['key']} in {collection_id}", "error")
+        for attr in collection_info.get('changed_attributes', []):
+            self.check_deadline()
+            self.update_attribute(collection_id, **attr)
+
+        pending = list(collection_info.get('indexes', []))
+        delay = self.ATTRIBUTE_POLL_INITIAL
+        deadline = time.monotonic() + self.ATTRIBUTE_READY_TIMEOUT
+
+        while pending:
+            statuses = self.get_attribute_statuses(collection_id)
+            progressed = False
+
+            for index in list(pending):
+                index_attributes = index['attributes']
+                blocked = [a for a in index_attributes
+                           if a not in submitted or statuses.get(a) in ('failed', 'stuck')]
+                if blocked:
+                    self.log(f"Skipping index {collection_id}.{index['key']}: "
+                             f"attributes not usable: {', '.join(blocked)}", "error")
+                    pending.remove(index)
+                    continue
+
+                if all(statuses.get(a) == 'available' for a in index_attributes):
+                    if self.create_index(collection_id, **index):
+                        self.mark_done('indexes', collection_id, index['key'])
+                        with self._lock:
+                            self.indexes_created += 1
+                    pending.remove(index)
+                    progressed = True
+
+            if not pending:
+                break
+
+            # Pending indexes are picked up again by the next invocation
+            self.check_deadline()
+
+            if time.monotonic() >= deadline:
+                for index in pending:
+                    self.log(f"Timed out waiting for attributes of index {collection_id}.{index['key']}", "error")
+                # Not done: a resumed run retries the indexes still missing
+                return False
+
+            # Poll quickly while attributes are becoming ready, back off otherwise
+            if progressed:
+                delay = self.ATTRIBUTE_POLL_INITIAL
+            else:
+                delay = min(delay * self.ATTRIBUTE_POLL_BACKOFF, self.ATTRIBUTE_POLL_MAX)
+            self.idle(delay, 'attribute_wait')
+
+        return True
+
+    @timed_phase('attribute_wait')
+    def get_attribute_statuses(self, collection_id: str) -> dict:
+        """Get a key -> status map for every attribute of a collection"""
+        try:
+            attributes = self.list_all(self.databases.list_attributes, 'attributes',
+                                       database_id=self.database_id, collection_id=collection_id)
+            return {attr['key']: attr['status'] for attr in attributes}
+        except AppwriteException as e:
+            self.log(f"Error listing attributes for {collection_id}: {e.message}", "error")
+            return {}
+
+    @timed_phase('create_collection')
     def create_collection(self, collection_id: str, name: str) -> bool:
         """Create a collection"""
         try:
@@ -282,16 +1417,17 @@ class DevelopmentDatabaseSetup:
                 permissions=permissions,
                 document_security=True
             )
-            self.log(f"Collection created: {name}")
+            self.log(f"Collection created: {name}", event='collection_created')
             return True
         except AppwriteException as e:
             if e.code == 409:
-                self.log(f"Collection already exists: {name}")
+                self.log(f"Collection already exists: {name}", event='collection_exists')
                 return True
             else:
                 self.log(f"Error creating collection {name}: {e.message}", "error")
                 return False
 
+    @timed_phase('attributes')
     def create_attribute(self, collection_id: str, key: str, attr_type: str,
                          size: int = None, required: bool = False,
                          default: any = None, **kwargs) -> bool:
@@ -358,11 +1494,31 @@ class DevelopmentDatabaseSetup:
             return True
         except AppwriteException as e:
             if e.code == 409:
-                return True  # Already exists
+                self.log(f"Attribute already exists: {collection_id}.{key}", event='attribute_exists')
+                return True
             else:
                 self.log(f"Error creating attribute {collection_id}.{key}: {e.message}", "error")
                 return False
 
+    @timed_phase('attributes')
+    def update_attribute(self, collection_id: str, key: str, attr_type: str,
+                         required: bool = False, default: any = None, **kwargs) -> bool:
+        """Bring an existing attribute's required flag and default in line with the config"""
+        try:
+            getattr(self.databases, f"update_{attr_type}_attribute")(
+                database_id=self.database_id,
+                collection_id=collection_id,
+                key=key,
+                required=required,
+                default=None if required else default
+            )
+            self.log(f"Attribute updated: {collection_id}.{key}", event='attribute_updated')
+            return True
+        except AppwriteException as e:
+            self.log(f"Error updating attribute {collection_id}.{key}: {e.message}", "error")
+            return False
+
+    @timed_phase('indexes')
     def create_index(self, collection_id: str, key: str, index_type: str,
                      attributes: list, **kwargs) -> bool:
         """Create an index"""
@@ -374,18 +1530,141 @@ class DevelopmentDatabaseSetup:
                 type=index_type,
                 attributes=attributes
             )
-            self.log(f"Index created: {collection_id}.{key}")
+            self.log(f"Index created: {collection_id}.{key}", event='index_created')
             return True
         except AppwriteException as e:
             if e.code == 409:
-                self.log(f"Index already exists: {collection_id}.{key}")
+                self.log(f"Index already exists: {collection_id}.{key}", event='index_exists')
                 return True
             else:
                 self.log(f"Error creating index {collection_id}.{key}: {e.message}", "error")
                 return False
 
-    def get_collections_config(self) -> list:
-        """Get complete collections configuration for development environment"""
+    def apply_index_plan(self, plan: dict) -> dict:
+        """
+        Apply an index plan from example_index_advisor.py.
+
+        plan['create'] holds {'collection_id', 'key', 'index_type',
+        'attributes'} entries and plan['drop'] {'collection_id', 'key'}.
+        New indexes are created before old ones are dropped, so queries
+        always have an index to use.
+        """
+        self.check_index_plan(plan)
+        result = {'created': 0, 'dropped': 0, 'failed': 0}
+        for index in plan.get('create', []):
+            if self.create_index(index['collection_id'], index['key'], index['index_type'], index['attributes']):
+                result['created'] += 1
+            else:
+                result['failed'] += 1
+
+        for index in plan.get('drop', []):
+            try:
+                self.databases.delete_index(
+                    database_id=self.database_id,
+                    collection_id=index['collection_id'],
+                    key=index['key']
+                )
+                self.log(f"Index dropped: {index['collection_id']}.{index['key']}", event='index_dropped')
+                result['dropped'] += 1
+            except AppwriteException as e:
+                if e.code == 404:
+                    continue
+                self.log(f"Error dropping index {index['collection_id']}.{index['key']}: {e.message}", "error")
+                result['failed'] += 1
+        return result
+
+    @classmethod
+    def check_index_plan(cls, plan):
+        """
+        Raise ValueError unless plan is a well-formed index plan: creates on
+        attributes of the config, drops only of indexes the config defines.
+        """
+        if not isinstance(plan, dict):
+            raise ValueError("index_plan must be an object")
+        config = {info['id']: info for info in cls.get_collections_config()}
+        for section in ('create', 'drop'):
+            entries = plan.get(section, [])
+            if not isinstance(entries, list) or not all(isinstance(index, dict) for index in entries):
+                raise ValueError(f"index_plan.{section} must be a list of objects")
+            for index in entries:
+                collection_info = config.get(index.get('collection_id'))
+                if collection_info is None:
+                    raise ValueError(f"index_plan.{section}: unknown collection {index.get('collection_id')!r}")
+                key = index.get('key')
+                if not isinstance(key, str) or not key or len(key) > 36:
+                    raise ValueError(f"index_plan.{section}: invalid index key {key!r}")
+
+                if section == 'drop':
+                    if key not in {existing['key'] for existing in collection_info.get('indexes', [])}:
+                        raise ValueError(f"index_plan.drop: {collection_info['id']}.{key} is not an index "
+                                         f"of the collections config")
+                    continue
+                if index.get('index_type') not in ('key', 'unique', 'fulltext'):
+                    raise ValueError(f"index_plan.create: {collection_info['id']}.{key} has invalid index_type "
+                                     f"{index.get('index_type')!r}")
+                known = {attr['key'] for attr in collection_info['attributes']} | {'$id', '$createdAt', '$updatedAt'}
+                attributes = index.get('attributes')
+                if not isinstance(attributes, list) or not attributes or \
+                        not all(isinstance(attribute, str) and attribute in known for attribute in attributes):
+                    raise ValueError(f"index_plan.create: {collection_info['id']}.{key} has invalid attributes "
+                                     f"{attributes!r}")
+
+    @classmethod
+    def load_index_plan(cls, path: str):
+        """An index plan written by example_index_advisor.py --out (None when there is none)"""
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            plan = json.load(f)
+        try:
+            cls.check_index_plan(plan)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}")
+        return plan
+
+    @staticmethod
+    def with_index_plan(collections_config: list, plan: dict) -> list:
+        """The collections config with an index plan's drops removed and creates added"""
+        dropped = {(index['collection_id'], index['key']) for index in plan.get('drop', [])}
+        created = {}
+        for index in plan.get('create', []):
+            created.setdefault(index['collection_id'], []).append(
+                {'key': index['key'], 'index_type': index['index_type'], 'attributes': list(index['attributes'])})
+
+        patched = []
+        for collection_info in collections_config:
+            collection_id = collection_info['id']
+            indexes = [index for index in collection_info.get('indexes', [])
+                       if (collection_id, index['key']) not in dropped]
+            keys = {index['key'] for index in indexes}
+            indexes += [index for index in created.get(collection_id, []) if index['key'] not in keys]
+            patched.append(dict(collection_info, indexes=indexes))
+        return patched
+
+    @property
+    def index_plan(self) -> dict:
+        return self._index_plan
+
+    @index_plan.setter
+    def index_plan(self, plan: dict):
+        self._index_plan = plan
+        self._collections_config = self._config_hash = None  # Rebuilt with the new plan
+
+    def collections_config(self) -> list:
+        """The collections config to provision, with the index plan applied (built once per plan)"""
+        if self._collections_config is None:
+            config = self.get_collections_config()
+            self._collections_config = self.with_index_plan(config, self.index_plan) if self.index_plan else config
+        return self._collections_config
+
+    @staticmethod
+    def get_collections_config() -> list:
+        """
+        Get complete collections configuration for development environment
+
+        A collection may declare 'depends_on': [collection ids] to be
+        provisioned only after those collections are set up.
+        """
         return [
             {
                 'id': 'user_profiles',
@@ -780,6 +2059,7 @@ class DevelopmentDatabaseSetup:
                 {'key': 'pricing_info', 'attr_type': 'string', 'size': 1000, 'required': False},
                 {'key': 'classification', 'attr_type': 'string', 'size': 500, 'required': False},
                 {'key': 'release_id', 'attr_type': 'string', 'size': 50, 'required': True},
+                {'key': 'content_hash', 'attr_type': 'string', 'size': 40, 'required': False},  # SHA-1 of product fields, for delta sync
                 {'key': 'created_at', 'attr_type': 'datetime', 'required': True},
                 {'key': 'updated_at', 'attr_type': 'datetime', 'required': True}
             ],
@@ -846,7 +2126,7 @@ class DevelopmentDatabaseSetup:
             'name': 'Clinic Token Balances',
             'attributes': [
                 {'key': 'clinic_id', 'attr_type': 'string', 'size': 255, 'required': True},
-                {'key': 'current_balance', 'attr_type': 'integer', 'required': True, 'default': 0},
+                {'key': 'current_balance', 'attr_type': 'integer', 'required': False, 'default': 0},
                 {'key': 'reserved_balance', 'attr_type': 'integer', 'required': False, 'default': 0},
                 {'key': 'lifetime_purchased', 'attr_type': 'integer', 'required': False, 'default': 0},
                 {'key': 'lifetime_consumed', 'attr_type': 'integer', 'required': False, 'default': 0},
@@ -909,152 +2189,1099 @@ class DevelopmentDatabaseSetup:
         }
         ]
 
-    def insert_development_data(self) -> bool:
-        """Insert development-specific default data"""
+    @timed_phase('seed')
+    def insert_development_data(self, fixtures_dir: str = None, workers: int = None) -> bool:
+        """
+        Insert development-specific default data from fixture files.
+
+        Every <collection_id>.jsonl or <collection_id>.csv file in the
+        fixtures directory is streamed into that collection. Rows are
+        upserted on their natural key, so re-running the seed is safe.
+        """
         try:
+            fixtures_dir = fixtures_dir or self.fixtures_dir
+            workers = workers or self.SEED_WORKERS
+            config_by_id = {info['id']: info for info in self.get_collections_config()}
+            success = True
+
+            for collection_id, path in self.find_fixture_files(fixtures_dir):
+                if collection_id in self.checkpoint['seed_files_done']:
+                    continue
+                for problem in self.document_validators()[collection_id].config_errors:
+                    self.log(f"Collection config: {problem}", "warning")
+                skip_rows = self.checkpoint['seed_rows'].get(collection_id, 0)
+                stats = self.load_fixture_file(config_by_id[collection_id], path, workers, skip_rows)
+                self.seed_stats[collection_id] = stats
+
+                if stats['deferred']:
+                    with self._lock:
+                        self.checkpoint['seed_rows'][collection_id] = skip_rows + stats['rows']
+                    self.log(f"Seeding {collection_id} deferred after row {skip_rows + stats['rows']}")
+                    raise DeadlineReached(f"Seeding {collection_id} deferred")
+                self.mark_done('seed_files_done', collection_id)
+                with self._lock:
+                    self.checkpoint['seed_rows'].pop(collection_id, None)
+
+                self.log(f"Seeded {collection_id}: {stats['created']} created, {stats['updated']} updated, "
+                         f"{stats['unchanged']} unchanged, {stats['failed']} failed ({stats['invalid']} invalid) "
+                         f"({stats['rows_per_second']} rows/sec)")
+                if stats['failed']:
+                    success = False
+
+            self.log("Development default data insertion completed")
+            return success
+
+        except DeadlineReached:
+            raise
+        except Exception as e:
+            self.log(f"Error inserting development data: {str(e)}", "error")
+            return False
+
+    @classmethod
+    def check_database_ids(cls, database_ids: list):
+        """Raise ValueError unless every id may be managed by this function"""
+        if len(database_ids) > cls.MAX_DATABASE_COUNT:
+            raise ValueError(f"At most {cls.MAX_DATABASE_COUNT} databases per request, got {len(database_ids)}")
+        allowlist = {database_id.strip() for database_id in os.getenv(cls.DATABASE_ALLOWLIST_ENV, '').split(',')}
+        for database_id in database_ids:
+            if database_id == cls.DEVELOPMENT_DATABASE_ID or (database_id and database_id in allowlist):
+                continue
+            name = database_id[len(cls.TEST_DATABASE_PREFIX):]
+            if (database_id.startswith(cls.TEST_DATABASE_PREFIX) and name and len(database_id) <= 36
+                    and all(c.isascii() and (c.isalnum() or c in '._-') for c in name)):
+                continue
+            raise ValueError(f"Database '{database_id}' is not managed by this function (use "
+                             f"{cls.DEVELOPMENT_DATABASE_ID}, {cls.TEST_DATABASE_PREFIX}<name> or an id in "
+                             f"{cls.DATABASE_ALLOWLIST_ENV})")
+
+    @staticmethod
+    def fixture_set_dir(name: str) -> str:
+        """Path of a fixture set: only subdirectories of the bundled fixtures/ can be selected"""
+        base = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+        if not isinstance(name, str) or name in ('', '.', '..') or os.path.basename(name) != name \
+                or (os.altsep and os.altsep in name):
+            raise ValueError(f"fixtures_dir must be the name of a directory under fixtures/, got {name!r}")
+        path = os.path.realpath(os.path.join(base, name))
+        if os.path.dirname(path) != base or not os.path.isdir(path):
+            raise ValueError(f"Unknown fixture set '{name}'")
+        return path
+
+    def find_fixture_files(self, fixtures_dir: str = None) -> list:
+        """List (collection_id, path) for every fixture file, in config order"""
+        fixtures_dir = fixtures_dir or self.fixtures_dir
+        if not os.path.isdir(fixtures_dir):
+            return []
+
+        config_ids = [info['id'] for info in self.get_collections_config()]
+        found = {}
+        for filename in sorted(os.listdir(fixtures_dir)):
+            collection_id, extension = os.path.splitext(filename)
+            if extension not in ('.jsonl', '.csv'):
+                continue
+            if collection_id not in config_ids:
+                raise ValueError(f"Fixture file {filename} does not match any collection")
+            found[collection_id] = os.path.join(fixtures_dir, filename)
+
+        return [(collection_id, found[collection_id]) for collection_id in config_ids if collection_id in found]
+
+    def iter_fixture_rows(self, path: str, collection_info: dict):
+        """Stream rows from a JSONL or CSV fixture file"""
+        if path.endswith('.jsonl'):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+
+        # CSV cells are strings; coerce them using the attribute types
+        attr_types = {attr['key']: attr['attr_type'] for attr in collection_info['attributes']}
+        with open(path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield {key: self.coerce_csv_value(value, attr_types.get(key, 'string'))
+                       for key, value in row.items() if value != ''}
+
+    @staticmethod
+    def coerce_csv_value(value: str, attr_type: str):
+        """Convert a CSV cell to the attribute's type"""
+        if attr_type == 'boolean':
+            return value.strip().lower() in ('true', '1', 'yes')
+        if attr_type == 'integer':
+            return int(value)
+        if attr_type == 'float':
+            return float(value)
+        return value
+
+    def natural_key(self, collection_info: dict) -> str:
+        """Attribute that identifies a seed row across runs"""
+        collection_id = collection_info['id']
+        if collection_id in self.SEED_NATURAL_KEYS:
+            return self.SEED_NATURAL_KEYS[collection_id]
+
+        for index in collection_info.get('indexes', []):
+            if index['index_type'] == 'unique' and len(index['attributes']) == 1:
+                return index['attributes'][0]
+
+        raise ValueError(f"No natural key for seeding {collection_id}")
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def document_validators(cls) -> dict:
+        """collection id -> DocumentValidator, compiled once from the config"""
+        return compile_validators(cls.get_collections_config())
+
+    @staticmethod
+    def seed_document_id(collection_id: str, key_value, prefix: str = 'seed') -> str:
+        """Deterministic document ID for a natural key (36 chars max)"""
+        digest = hashlib.sha1(f"{collection_id}:{key_value}".encode('utf-8')).hexdigest()
+        return f"{prefix}_{digest[:35 - len(prefix)]}"
+
+    @staticmethod
+    def row_digest(collection_info: dict, row: dict) -> str:
+        """Hash of a row's content, ignoring timestamps, with defaults applied"""
+        content = {attr['key']: row.get(attr['key'], attr.get('default'))
+                   for attr in collection_info['attributes']
+                   if attr['key'] not in ('created_at', 'updated_at')}
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def iter_documents(self, collection_id: str, queries: list = None, page_size: int = 100):
+        """Stream every document of a collection using cursor pagination"""
+        return iter_documents(self.databases, self.database_id, collection_id, queries, page_size)
+
+    def bounded_map(self, fn, items, workers: int):
+        """
+        Apply fn to items on a thread pool, yielding results as they finish.
+
+        At most 2 * workers items are in flight, so items can be a
+        generator over a file of any size.
+        """
+        # Work done on the pool counts towards the caller's phase
+        phase = self.current_phase()
+
+        def run(item):
+            with self.phase(phase, timed=False):
+                return fn(item)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            for item in items:
+                in_flight.add(executor.submit(run, item))
+                if len(in_flight) >= workers * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        yield future.result()
+            for future in in_flight:
+                yield future.result()
+
+    def load_fixture_file(self, collection_info: dict, path: str, workers: int, skip_rows: int = 0) -> dict:
+        """
+        Upsert every row of a fixture file into its collection.
+
+        The first skip_rows rows are skipped (resuming a deferred load).
+        Reading stops when the time budget is used up; stats['deferred']
+        is then True and stats['rows'] counts the rows handled.
+        """
+        collection_id = collection_info['id']
+        key = self.natural_key(collection_info)
+        started = time.monotonic()
+
+        # One paginated read tells us which rows exist and whether they changed
+        existing = {}
+        for document in self.iter_documents(collection_id):
+            if document.get(key) is not None:
+                existing[document[key]] = (document['$id'], self.row_digest(collection_info, document))
+
+        def upsert(row):
+            key_value = row.get(key)
+            if key_value is None:
+                self.log(f"Skipping {collection_id} row without {key}", "error", event='seed_row_skipped')
+                return 'failed'
+
+            digest = self.row_digest(collection_info, row)
             current_time = datetime.utcnow().isoformat() + "Z"
 
-            # Development subscription plans
-            dev_plans = [
-                {
-                    "name": "Development Starter",
-                    "description": "Development testing plan",
-                    "plan_type": "development",
-                    "pricing": '{"monthly": 0.00, "annual": 0.00, "currency": "GBP"}',
-                    "limits": '{"max_prescriptions": 1000, "max_users": 10, "max_clinics": 5}',
-                    "features": '["unlimited_testing", "debug_mode", "sample_data", "rapid_iteration"]',
-                    "is_active": True,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "name": "Professional Dev",
-                    "description": "Development advanced testing",
-                    "plan_type": "professional_dev",
-                    "pricing": '{"monthly": 10.00, "annual": 100.00, "currency": "GBP"}',
-                    "limits": '{"max_prescriptions": 5000, "max_users": 25, "max_clinics": 10}',
-                    "features": '["advanced_testing", "performance_profiling", "load_testing", "integration_testing"]',
-                    "is_active": True,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                }
-            ]
+            if key_value in existing:
+                document_id, existing_digest = existing[key_value]
+                if digest == existing_digest:
+                    return 'unchanged'
+                return self.update_seed_document(collection_id, document_id, {**row, 'updated_at': current_time})
 
-            for plan in dev_plans:
-                try:
-                    self.databases.create_document(
-                        database_id=self.database_id,
-                        collection_id="subscription_plans",
-                        document_id=ID.unique(),
-                        data=plan
-                    )
-                    self.log(f"Inserted development plan: {plan['name']}")
-                except AppwriteException as e:
-                    self.log(f"Error inserting plan {plan['name']}: {e.message}", "error")
-
-            # Development notification templates
-            dev_templates = [
-                {
-                    "name": "dev_prescription_ready",
-                    "type": "email",
-                    "subject": "[DEV] Your test prescription is ready",
-                    "template_body": "[DEVELOPMENT MODE] Dear {{patient_name}}, your test prescription {{prescription_code}} is ready for testing. This is a development environment.",
-                    "variables": '["patient_name", "prescription_code"]',
-                    "is_active": True,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "name": "dev_test_notification",
-                    "type": "sms",
-                    "subject": None,
-                    "template_body": "[DEV] Test notification {{test_id}}. This is a development environment message.",
-                    "variables": '["test_id"]',
-                    "is_active": True,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                }
-            ]
+            document_id = self.seed_document_id(collection_id, key_value)
+            data = {'created_at': current_time, 'updated_at': current_time, **row}
+            try:
+                self.databases.create_document(
+                    database_id=self.database_id,
+                    collection_id=collection_id,
+                    document_id=document_id,
+                    data=data
+                )
+                return 'created'
+            except AppwriteException as e:
+                if e.code == 409:
+                    # Written concurrently since the existing-rows read
+                    data.pop('created_at', None)
+                    return self.update_seed_document(collection_id, document_id, data)
+                self.log(f"Error inserting {collection_id} row {key_value}: {e.message}", "error",
+                         event='seed_row_error')
+                return 'failed'
+
+        stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'invalid': 0,
+                 'deferred': False}
+        validator = self.document_validators()[collection_id]
+        placeholder_time = datetime.utcnow().isoformat() + "Z"
+
+        def rows_before_deadline():
+            rows = itertools.islice(self.iter_fixture_rows(path, collection_info), skip_rows, None)
+            for row_number, row in enumerate(rows, skip_rows + 1):
+                if self.out_of_time():
+                    stats['deferred'] = True
+                    return
+                # Rows the server would reject never leave the process
+                errors = validator.errors({'created_at': placeholder_time, 'updated_at': placeholder_time, **row})
+                if errors:
+                    self.log(f"Rejected {collection_id} row {row_number}: {'; '.join(errors)}", "error",
+                             event='seed_row_invalid')
+                    stats['rows'] += 1
+                    stats['invalid'] += 1
+                    stats['failed'] += 1
+                    continue
+                yield row
+
+        for outcome in self.bounded_map(upsert, rows_before_deadline(), workers):
+            stats['rows'] += 1
+            stats[outcome] += 1
+
+        elapsed = time.monotonic() - started
+        stats['duration_seconds'] = round(elapsed, 3)
+        stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed > 0 else 0.0
+        return stats
+
+    def update_seed_document(self, collection_id: str, document_id: str, data: dict) -> str:
+        """Update an existing seed row, keeping its original created_at"""
+        data = {k: v for k, v in data.items() if k != 'created_at'}
+        try:
+            self.databases.update_document(
+                database_id=self.database_id,
+                collection_id=collection_id,
+                document_id=document_id,
+                data=data
+            )
+            return 'updated'
+        except AppwriteException as e:
+            self.log(f"Error updating {collection_id} document {document_id}: {e.message}", "error",
+                     event='seed_row_error')
+            return 'failed'
+
+
+def iter_documents(databases, database_id: str, collection_id: str, queries: list = None,
+                   page_size: int = 100):
+    """Stream every document of a collection using cursor pagination"""
+    cursor = None
+    while True:
+        page_queries = list(queries or []) + [Query.limit(page_size)]
+        if cursor:
+            page_queries.append(Query.cursor_after(cursor))
+
+        response = databases.list_documents(
+            database_id=database_id,
+            collection_id=collection_id,
+            queries=page_queries
+        )
+        documents = response['documents']
+        yield from documents
+
+        if len(documents) < page_size:
+            return
+        cursor = documents[-1]['$id']
+
+
+def create_databases_from_env() -> Databases:
+    """
+    Build a Databases service from environment variables.
 
-            for template in dev_templates:
-                try:
-                    self.databases.create_document(
-                        database_id=self.database_id,
-                        collection_id="notification_templates",
-                        document_id=ID.unique(),
-                        data=template
-                    )
-                    self.log(f"Inserted development template: {template['name']}")
-                except AppwriteException as e:
-                    self.log(f"Error inserting template {template['name']}: {e.message}", "error")
-
-            # Development system settings
-            dev_settings = [
-                {
-                    "setting_key": "environment",
-                    "setting_value": "development",
-                    "setting_type": "string",
-                    "description": "Current environment mode",
-                    "is_encrypted": False,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "setting_key": "debug_mode",
-                    "setting_value": "true",
-                    "setting_type": "boolean",
-                    "description": "Enable debug logging and features",
-                    "is_encrypted": False,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "setting_key": "prescription_validity_days",
-                    "setting_value": "30",
-                    "setting_type": "integer",
-                    "description": "Shorter validity for development testing",
-                    "is_encrypted": False,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "setting_key": "max_login_attempts",
-                    "setting_value": "10",
-                    "setting_type": "integer",
-                    "description": "Higher limit for development testing",
-                    "is_encrypted": False,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                },
-                {
-                    "setting_key": "api_rate_limit",
-                    "setting_value": "10000",
-                    "setting_type": "integer",
-                    "description": "Higher rate limit for development",
-                    "is_encrypted": False,
-                    "created_at": current_time,
-                    "updated_at": current_time
-                }
-            ]
+    Used by the standalone tools that run outside a function execution
+    (APPWRITE_FUNCTION_API_ENDPOINT, APPWRITE_FUNCTION_PROJECT_ID and
+    APPWRITE_FUNCTION_API_KEY).
+    """
+    endpoint = os.getenv('APPWRITE_FUNCTION_API_ENDPOINT')
+    project_id = os.getenv('APPWRITE_FUNCTION_PROJECT_ID')
+    api_key = os.getenv('APPWRITE_FUNCTION_API_KEY')
 
-            for setting in dev_settings:
-                try:
-                    self.databases.create_document(
-                        database_id=self.database_id,
-                        collection_id="system_settings",
-                        document_id=ID.unique(),
-                        data=setting
-                    )
-                    self.log(f"Inserted development setting: {setting['setting_key']}")
-                except AppwriteException as e:
-                    self.log(f"Error inserting setting {setting['setting_key']}: {e.message}", "error")
+    if not endpoint:
+        raise Exception("APPWRITE_FUNCTION_API_ENDPOINT environment variable not found")
+    if not project_id:
+        raise Exception("APPWRITE_FUNCTION_PROJECT_ID environment variable not found")
+    if not api_key:
+        raise Exception("APPWRITE_FUNCTION_API_KEY environment variable not found")
 
-            self.log("Development default data insertion completed")
-            return True
+    client = PooledClient()
+    client.set_endpoint(endpoint)
+    client.set_project(project_id)
+    client.set_key(api_key)
+    return Databases(client)
 
-        except Exception as e:
-            self.log(f"Error inserting development data: {str(e)}", "error")
+
+class SetupLogger:
+    """
+    Bounded, leveled log for a setup run.
+
+    Entries go into a fixed-size ring buffer, so memory and response size
+    stay flat however many messages a run produces. Messages below
+    min_level are only counted. sample_rates keeps a deterministic
+    fraction of a level's messages (e.g. {'info': 0.1} keeps every tenth);
+    warnings and errors are never sampled out. Messages tagged with an
+    event name are aggregated: the first EVENT_ENTRY_LIMIT occurrences
+    are kept as entries, the rest only counted.
+    """
+
+    LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+    EVENT_ENTRY_LIMIT = 3
+
+    def __init__(self, context, capacity: int = 1000, min_level: str = 'info', sample_rates: dict = None):
+        self.context = context
+        self.min_level = self.LEVELS.get(min_level.lower(), 20)
+        self.sample_rates = {level.lower(): rate for level, rate in (sample_rates or {}).items()}
+        self.entries = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.level_counts = Counter()
+        self.sampled_out = Counter()
+        self.events = Counter()
+        self.overwritten = 0
+
+    def log(self, message: str, level: str = 'info', event: str = None):
+        level = level.lower()
+        severity = self.LEVELS.get(level, 20)
+
+        with self.lock:
+            self.level_counts[level] += 1
+            if event is not None:
+                self.events[event] += 1
+                if self.events[event] > self.EVENT_ENTRY_LIMIT:
+                    return
+            if severity < self.min_level:
+                return
+
+            rate = self.sample_rates.get(level, 1.0) if severity < self.LEVELS['warning'] else 1.0
+            if rate < 1.0:
+                # Keep message n when floor(n * rate) advances
+                seen = self.level_counts[level]
+                if int(seen * rate) == int((seen - 1) * rate):
+                    self.sampled_out[level] += 1
+                    return
+
+            if len(self.entries) == self.entries.maxlen:
+                self.overwritten += 1
+            self.entries.append((time.time(), level, message))
+
+        # Use context logging methods
+        if severity >= self.LEVELS['error']:
+            self.context.error(message)
+        else:
+            self.context.log(message)
+
+    def tail(self, count: int = None) -> list:
+        """The last count entries (all buffered entries if None)"""
+        with self.lock:
+            entries = list(self.entries)
+        if count is not None:
+            entries = entries[-count:] if count > 0 else []
+        return [{
+            'timestamp': datetime.utcfromtimestamp(timestamp).isoformat(),
+            'level': level.upper(),
+            'message': message
+        } for timestamp, level, message in entries]
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                'messages': dict(self.level_counts),
+                'sampled_out': dict(self.sampled_out),
+                'overwritten': self.overwritten,
+                'buffered': len(self.entries),
+                'events': dict(self.events.most_common(20)),
+            }
+
+
+class ApiMetrics:
+    """
+    Thread-safe per-operation metrics for Databases calls.
+
+    Tracks calls, errors by status code (409 conflicts separately),
+    retries, bytes sent and a latency histogram per operation.
+    """
+
+    # Histogram bucket upper bounds in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def operation(self, name: str) -> dict:
+        """Stats for one operation; call with the lock held"""
+        stats = self.operations.get(name)
+        if stats is None:
+            stats = self.operations[name] = {
+                'calls': 0, 'errors': 0, 'conflicts': 0, 'retries': 0, 'bytes_sent': 0,
+                'seconds': 0.0, 'max_seconds': 0.0, 'errors_by_code': {},
+                'buckets': [0] * (len(self.BUCKETS) + 1),
+            }
+        return stats
+
+    def record_call(self, name: str, seconds: float, bytes_sent: int = 0, error_code=None):
+        bucket = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        with self.lock:
+            stats = self.operation(name)
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['bytes_sent'] += bytes_sent
+            stats['buckets'][bucket] += 1
+            if error_code is not None:
+                stats['errors'] += 1
+                stats['errors_by_code'][str(error_code)] = stats['errors_by_code'].get(str(error_code), 0) + 1
+                if error_code == 409:
+                    stats['conflicts'] += 1
+
+    def record_retry(self, name: str):
+        with self.lock:
+            self.operation(name)['retries'] += 1
+
+    def percentile(self, buckets: list, fraction: float):
+        """Upper bucket bound below which the fraction of calls falls (None past the last bucket)"""
+        target = sum(buckets) * fraction
+        seen = 0
+        for bound, count in zip(self.BUCKETS + (None,), buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def summary(self) -> dict:
+        """Compact totals plus per-operation latency figures"""
+        with self.lock:
+            operations = {name: dict(stats, buckets=list(stats['buckets']),
+                                     errors_by_code=dict(stats['errors_by_code']))
+                          for name, stats in self.operations.items()}
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+
+        summary = {
+            'total_calls': sum(stats['calls'] for stats in operations.values()),
+            'errors': sum(stats['errors'] for stats in operations.values()),
+            'conflicts': sum(stats['conflicts'] for stats in operations.values()),
+            'retries': sum(stats['retries'] for stats in operations.values()),
+            'bytes_sent': sum(stats['bytes_sent'] for stats in operations.values()),
+            'seconds_in_calls': round(sum(stats['seconds'] for stats in operations.values()), 3),
+            'operations': {},
+        }
+        for name, stats in sorted(operations.items()):
+            summary['operations'][name] = {
+                'calls': stats['calls'],
+                'errors': stats['errors_by_code'],
+                'retries': stats['retries'],
+                'bytes_sent': stats['bytes_sent'],
+                'mean_ms': ms(stats['seconds'] / stats['calls']) if stats['calls'] else 0.0,
+                'p50_ms': ms(self.percentile(stats['buckets'], 0.5)),
+                'p95_ms': ms(self.percentile(stats['buckets'], 0.95)),
+                'max_ms': ms(stats['max_seconds']),
+            }
+        return summary
+
+    def to_prometheus(self, prefix: str = 'appwrite_setup') -> str:
+        """Prometheus text exposition format"""
+        with self.lock:
+            operations = sorted((name, dict(stats, buckets=list(stats['buckets']),
+                                            errors_by_code=dict(stats['errors_by_code'])))
+                                for name, stats in self.operations.items())
+
+        lines = [
+            f"# HELP {prefix}_api_call_duration_seconds Databases API call latency",
+            f"# TYPE {prefix}_api_call_duration_seconds histogram",
+        ]
+        for name, stats in operations:
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + ('+Inf',), stats['buckets']):
+                cumulative += count
+                lines.append(f'{prefix}_api_call_duration_seconds_bucket{{operation="{name}",le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'{prefix}_api_call_duration_seconds_sum{{operation="{name}"}} {stats["seconds"]:.6f}')
+            lines.append(f'{prefix}_api_call_duration_seconds_count{{operation="{name}"}} {stats["calls"]}')
+
+        counters = [
+            ('api_errors_total', 'Databases API calls that raised, by status code'),
+            ('api_retries_total', 'Databases API calls retried'),
+            ('api_bytes_sent_total', 'Approximate request payload bytes sent'),
+        ]
+        for metric, description in counters:
+            lines.append(f"# HELP {prefix}_{metric} {description}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, stats in operations:
+                if metric == 'api_errors_total':
+                    for code, count in sorted(stats['errors_by_code'].items()):
+                        lines.append(f'{prefix}_{metric}{{operation="{name}",code="{code}"}} {count}')
+                else:
+                    value = stats['retries'] if metric == 'api_retries_total' else stats['bytes_sent']
+                    lines.append(f'{prefix}_{metric}{{operation="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class RateBudget:
+    """
+    Token bucket shared by every thread, and every setup, drawing on it.
+
+    acquire() blocks until the next call fits in rate calls per second;
+    up to burst calls go out back-to-back after an idle period.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take the token now and sleep off the debt outside the lock, so waiters stay in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.calls += 1
+            self.waited_seconds += wait
+        if wait:
+            time.sleep(wait)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {'rate': self.rate, 'burst': self.capacity, 'calls': self.calls,
+                    'waited_seconds': round(self.waited_seconds, 3)}
+
+
+class RateGovernor:
+    """
+    Shared flow control for Databases calls.
+
+    Every call waits for a token of the optional RateBudget and for a
+    concurrency slot. The slot limit follows AIMD: it grows by about one
+    per round trip while calls succeed at their usual latency, is halved
+    on 429 and cut by 10% when a call is much slower than usual (at most
+    once per round trip, so a burst of throttled calls counts once).
+    Transient failures (429, 5xx, network errors) are retried with full
+    jitter backoff. After failure_threshold consecutive 5xx/network
+    failures the circuit opens: calls fail fast with a 503 for
+    open_seconds, then a single probe decides whether it closes again.
+    """
+
+    RETRYABLE_CODES = {None, 0, 429, 500, 502, 503, 504}
+    DECREASE_ON_THROTTLE = 0.5
+    DECREASE_ON_LATENCY = 0.9
+    LATENCY_FACTOR = 3.0  # "Much slower than usual" for an operation
+    LATENCY_FLOOR = 0.05  # Seconds; faster calls never count as slow
+
+    def __init__(self, rate: float = None, burst: int = None, concurrency: int = 16, min_concurrency: int = 1,
+                 max_concurrency: int = 128, max_attempts: int = 5, base_delay: float = 0.2,
+                 max_delay: float = 10.0, failure_threshold: int = 10, open_seconds: float = 10.0):
+        self.rate_budget = RateBudget(rate, burst) if rate else None
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self.lock = threading.Lock()
+        self.slot_free = threading.Condition(self.lock)
+        self.in_flight = 0
+        self.typical = {}  # operation -> EWMA of its latency
+        self.round_trip = 0.0  # EWMA over all operations
+        self.last_decrease = 0.0
+
+        self.circuit = 'closed'
+        self.open_until = 0.0
+        self.failures = 0  # Consecutive 5xx / network failures
+        self.counters = {'calls': 0, 'retries': 0, 'throttled': 0, 'slow': 0, 'decreases': 0,
+                         'circuit_trips': 0, 'rejected': 0, 'max_in_flight': 0}
+
+    def call(self, operation: str, attempt, metrics: ApiMetrics = None):
+        """Run attempt() under flow control, retrying transient failures"""
+        for number in range(1, self.max_attempts + 1):
+            probe = self.admit()
+            started = time.monotonic()
+            try:
+                result = attempt()
+            except Exception as e:
+                code = e.code if isinstance(e, AppwriteException) else (0 if isinstance(e, OSError) else 'other')
+                transient = code in self.RETRYABLE_CODES
+                # Other errors (404, 409, ...) are answers: the backend is fine
+                outcome = ('throttled' if code == 429 else 'failed') if transient else 'ok'
+                self.finish(operation, time.monotonic() - started, outcome, probe)
+                if not transient or number == self.max_attempts or self.circuit == 'open':
+                    raise
+                if metrics is not None:
+                    metrics.record_retry(operation)
+                with self.lock:
+                    self.counters['retries'] += 1
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (number - 1))))
+                continue
+            self.finish(operation, time.monotonic() - started, 'ok', probe)
+            return result
+
+    def admit(self) -> bool:
+        """Wait for a token and a slot; returns whether this call is the half-open probe"""
+        with self.lock:
+            probe = self.check_circuit()
+        if self.rate_budget is not None:
+            self.rate_budget.acquire()
+        with self.lock:
+            while self.in_flight >= int(self.limit):
+                self.slot_free.wait()
+            self.in_flight += 1
+            self.counters['calls'] += 1
+            self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.in_flight)
+        return probe
+
+    def check_circuit(self) -> bool:
+        """Raise while the circuit is open; call with the lock held"""
+        if self.circuit == 'closed':
             return False
+        if self.circuit == 'open' and time.monotonic() >= self.open_until:
+            self.circuit = 'half_open'
+            return True
+        self.counters['rejected'] += 1
+        raise AppwriteException("Backend is failing, call rejected by the circuit breaker", 503, 'circuit_open')
+
+    def finish(self, operation: str, seconds: float, outcome: str, probe: bool):
+        """Release the slot and feed the outcome ('ok', 'throttled', 'failed') to AIMD and the breaker"""
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            self.slot_free.notify()
+
+            if outcome == 'throttled':
+                self.counters['throttled'] += 1
+                self.decrease(self.DECREASE_ON_THROTTLE, now)
+            elif outcome == 'ok':
+                typical = self.typical.get(operation)
+                self.typical[operation] = seconds if typical is None else typical + 0.1 * (seconds - typical)
+                self.round_trip += 0.1 * (seconds - self.round_trip)
+                if typical is not None and seconds > max(typical * self.LATENCY_FACTOR, self.LATENCY_FLOOR):
+                    self.counters['slow'] += 1
+                    self.decrease(self.DECREASE_ON_LATENCY, now)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                    self.slot_free.notify()
+
+            # A 429 still proves the backend is up
+            if outcome != 'failed':
+                self.failures = 0
+                if probe:
+                    self.circuit = 'closed'
+            else:
+                self.failures += 1
+                if probe or (self.circuit == 'closed' and self.failures >= self.failure_threshold):
+                    self.circuit = 'open'
+                    self.open_until = now + self.open_seconds
+                    self.counters['circuit_trips'] += 1
+
+    def decrease(self, factor: float, now: float):
+        """Multiplicative decrease, at most once per round trip; call with the lock held"""
+        if now - self.last_decrease < max(self.round_trip, 0.01):
+            return
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+        self.last_decrease = now
+        self.counters['decreases'] += 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                'concurrency_limit': round(self.limit, 1),
+                'in_flight': self.in_flight,
+                'circuit': self.circuit,
+                **self.counters,
+                'rate_budget': self.rate_budget.summary() if self.rate_budget else None,
+            }
+
+
+class InstrumentedDatabases:
+    """
+    Wrap a Databases service so every call is timed and recorded in ApiMetrics.
+
+    on_call(operation) is invoked before each attempt (used for per-phase
+    call counts); with a governor every call goes through its flow
+    control and retries. Non-callable attributes pass through unchanged.
+    """
+
+    def __init__(self, databases, metrics: ApiMetrics, on_call=None, governor: RateGovernor = None):
+        self.databases = databases
+        self.metrics = metrics
+        self.on_call = on_call
+        self.governor = governor
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.databases, name)
+        if not callable(attribute):
+            return attribute
+
+        def attempt(bytes_sent, args, kwargs):
+            if self.on_call is not None:
+                self.on_call(name)
+            started = time.monotonic()
+            try:
+                result = attribute(*args, **kwargs)
+            except AppwriteException as e:
+                self.metrics.record_call(name, time.monotonic() - started, bytes_sent, e.code or 'unknown')
+                raise
+            except Exception:
+                self.metrics.record_call(name, time.monotonic() - started, bytes_sent, 'exception')
+                raise
+            self.metrics.record_call(name, time.monotonic() - started, bytes_sent)
+            return result
+
+        def call(*args, **kwargs):
+            bytes_sent = self.payload_size(kwargs)
+            if self.governor is None:
+                return attempt(bytes_sent, args, kwargs)
+            return self.governor.call(name, lambda: attempt(bytes_sent, args, kwargs), self.metrics)
+
+        return call
+
+    @staticmethod
+    def payload_size(kwargs: dict) -> int:
+        """Approximate JSON body size of a call"""
+        try:
+            return len(json.dumps(kwargs, default=str, separators=(',', ':')))
+        except (TypeError, ValueError):
+            return 0
+
+
+def write_documents(databases, database_id: str, op: str, collection_id: str, documents: list,
+                    bulk_supported: dict, record, on_error=None):
+    """
+    Apply one batch of writes: a bulk call when the server supports it, else one call per row.
+
+    op is 'create', 'upsert' or 'delete' and every document carries its
+    '$id'. A bulk endpoint the server lacks (404, 405, 501) is marked off
+    in bulk_supported; any other bulk failure retries row by row to
+    separate existing or invalid rows from the rest. Counts go to
+    record(counter, amount). A failing row goes to on_error(document,
+    error), or is raised when there is no on_error.
+    """
+    if bulk_supported.get(op):
+        try:
+            if op == 'create':
+                databases.create_documents(
+                    database_id=database_id,
+                    collection_id=collection_id,
+                    documents=documents
+                )
+                record('written', len(documents))
+            elif op == 'upsert':
+                databases.upsert_documents(
+                    database_id=database_id,
+                    collection_id=collection_id,
+                    documents=documents
+                )
+                record('updated', len(documents))
+            else:
+                databases.delete_documents(
+                    database_id=database_id,
+                    collection_id=collection_id,
+                    queries=[Query.equal('$id', [document['$id'] for document in documents])]
+                )
+                record('deleted', len(documents))
+            return
+        except AppwriteException as e:
+            if e.code in (404, 405, 501):
+                bulk_supported[op] = False  # Older server without bulk endpoints
+            # Retry row by row to separate existing or invalid rows from the rest
+
+    for document in documents:
+        try:
+            write_document(databases, database_id, op, collection_id, document, record)
+        except AppwriteException as e:
+            if on_error is None:
+                raise
+            on_error(document, e)
+
+
+def write_document(databases, database_id: str, op: str, collection_id: str, document: dict, record):
+    """Apply a single write, mapping expected conflicts to counters"""
+    document_id = document['$id']
+    data = {k: v for k, v in document.items() if k != '$id'}
+
+    if op == 'delete':
+        try:
+            databases.delete_document(
+                database_id=database_id,
+                collection_id=collection_id,
+                document_id=document_id
+            )
+        except AppwriteException as e:
+            if e.code != 404:
+                raise
+        record('deleted')
+        return
+
+    if op == 'upsert':
+        try:
+            databases.update_document(
+                database_id=database_id,
+                collection_id=collection_id,
+                document_id=document_id,
+                data=data
+            )
+            record('updated')
+            return
+        except AppwriteException as e:
+            if e.code != 404:
+                raise
+            # Not there yet: fall through to create
+
+    try:
+        databases.create_document(
+            database_id=database_id,
+            collection_id=collection_id,
+            document_id=document_id,
+            data=data
+        )
+        record('written')
+    except AppwriteException as e:
+        if e.code != 409:
+            raise
+        record('existing')
+
+
+class BatchedDocumentWriter:
+    """
+    Buffer document writes per collection and apply them in concurrent batches.
+
+    Supports create (add), upsert and delete. Bulk endpoints are used when
+    the server supports them, falling back to one call per row otherwise.
+    A 409 on create counts as already written, so re-running with
+    deterministic document IDs is safe. With validators (collection id ->
+    DocumentValidator) every batch is checked before it is sent and
+    invalid rows are dropped, so one bad row no longer fails a bulk call.
+    """
+
+    MAX_ERRORS_KEPT = 20
+
+    def __init__(self, databases, database_id: str, batch_size: int = 100, workers: int = 8,
+                 validators: dict = None):
+        self.databases = databases
+        self.database_id = database_id
+        self.batch_size = batch_size
+        self.validators = validators or {}
+        self.bulk_supported = {
+            'create': hasattr(databases, 'create_documents'),
+            'upsert': hasattr(databases, 'upsert_documents'),
+            'delete': hasattr(databases, 'delete_documents'),
+        }
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)  # Bounds buffered batches
+        self.buffers = {}
+        self.buffer_lock = threading.Lock()  # Callers queue from several threads
+        self.lock = threading.Lock()
+        self.stats = {'written': 0, 'updated': 0, 'deleted': 0, 'existing': 0, 'failed': 0, 'invalid': 0,
+                      'batches': 0}
+        self.errors = []
+
+    def add(self, collection_id: str, document_id: str, data: dict):
+        """Queue a document to create"""
+        self.queue('create', collection_id, {'$id': document_id, **data})
+
+    def upsert(self, collection_id: str, document_id: str, data: dict):
+        """Queue a document to create or replace"""
+        self.queue('upsert', collection_id, {'$id': document_id, **data})
+
+    def delete(self, collection_id: str, document_id: str):
+        """Queue a document to delete"""
+        self.queue('delete', collection_id, {'$id': document_id})
+
+    def queue(self, op: str, collection_id: str, document: dict):
+        with self.buffer_lock:
+            buffer = self.buffers.setdefault((op, collection_id), [])
+            buffer.append(document)
+            full = len(buffer) >= self.batch_size
+        if full:
+            self.flush((op, collection_id))
+
+    def flush(self, buffer_key: tuple = None):
+        """Submit buffered writes (of one (op, collection) buffer, or all)"""
+        with self.buffer_lock:
+            buffer_keys = [buffer_key] if buffer_key else list(self.buffers)
+        for key in buffer_keys:
+            with self.buffer_lock:
+                documents = self.buffers.pop(key, [])
+            if documents:
+                self.slots.acquire()  # Backpressure when every worker is busy
+                future = self.executor.submit(self.write_batch, key[0], key[1], documents)
+                future.add_done_callback(functools.partial(self.batch_done, key[1], len(documents)))
+
+    def batch_done(self, collection_id: str, count: int, future):
+        """A batch that raised (anything write_documents does not handle) counts as failed"""
+        self.slots.release()
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            self.record('failed', count)
+            self.record_error(collection_id, error)
+
+    def close(self) -> dict:
+        """Flush everything, wait for in-flight batches and return stats"""
+        self.flush()
+        self.executor.shutdown(wait=True)
+        return {**self.stats, 'errors': self.errors}
+
+    def write_batch(self, op: str, collection_id: str, documents: list):
+        """Write one batch (runs on a worker thread)"""
+        self.record('batches')
+
+        validator = self.validators.get(collection_id)
+        if validator is not None and op != 'delete':
+            # Upserts may update existing documents, so required fields are not enforced
+            documents, rejected = validator.validate(documents, partial=op == 'upsert')
+            for _, document, errors in rejected:
+                self.record('failed')
+                self.record('invalid')
+                self.record_error(collection_id, AppwriteException(
+                    f"Invalid document {document['$id']}: {'; '.join(errors)}", 400, 'document_invalid_structure'))
+            if not documents:
+                return
+
+        def row_failed(document: dict, error: AppwriteException):
+            self.record('failed')
+            self.record_error(collection_id, error)
+
+        write_documents(self.databases, self.database_id, op, collection_id, documents, self.bulk_supported,
+                        self.record, on_error=row_failed)
+
+    def record(self, counter: str, amount: int = 1):
+        with self.lock:
+            self.stats[counter] += amount
+
+    def record_error(self, collection_id: str, error: Exception):
+        with self.lock:
+            if len(self.errors) < self.MAX_ERRORS_KEPT:
+                self.errors.append(f"{collection_id}: {getattr(error, 'message', None) or error}")
+
+
+def provision_databases(context, database_ids: list, databases=None, parallelism: int = None,
+                        governor: RateGovernor = None, configure=None, continuation_tokens: dict = None,
+                        force_recreate: bool = False, pipelined: bool = True, concurrency: int = 4,
+                        use_plan: bool = True, dry_run: bool = False) -> dict:
+    """
+    Provision several databases from the same collections config at once.
+
+    Every target gets its own DevelopmentDatabaseSetup; all of them share
+    one Databases service (one connection pool), one ApiMetrics and one
+    RateGovernor. Live schemas are read in parallel and a schema plan is
+    computed once per distinct live schema, so N fresh databases share
+    one plan. configure(setup) applies per-request overrides.
+
+    Returns:
+        dict with 'success', per-database 'databases' results,
+        'plans_computed', 'rate_governor' and 'api_metrics'
+    """
+    if len(set(database_ids)) != len(database_ids):
+        raise ValueError("database_ids must be unique")
+    DevelopmentDatabaseSetup.check_database_ids(database_ids)
+
+    api_metrics = ApiMetrics()
+    governor = governor or RateGovernor()
+    setups = []
+    for database_id in database_ids:
+        setup = DevelopmentDatabaseSetup(
+            context, databases, database_id,
+            None if database_id == 'eprescription_dev' else f"E-Prescription Platform - {database_id}",
+            governor, api_metrics)
+        databases = setup.databases.databases  # Connect once, share the pool
+        setup.log_prefix = f"[{database_id}] "
+        if configure is not None:
+            configure(setup)
+        if continuation_tokens and database_id in continuation_tokens:
+            setup.load_checkpoint(continuation_tokens[database_id])
+        setups.append(setup)
+
+    parallelism = max(1, int(parallelism or min(len(setups), 16)))
+    collections_config = setups[0].collections_config()
+
+    # Reset every target first, so the plans below see the reset schemas
+    resets = {}
+    reset_strategy = DevelopmentDatabaseSetup.reset_strategy(force_recreate)
+    if reset_strategy and not dry_run:
+        def reset(setup):
+            if setup.checkpoint.get('reset_done'):
+                return None
+            result = setup.reset_database(reset_strategy)
+            setup.mark_done('reset_done')
+            return result
+
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            resets = dict(zip(database_ids, pool.map(reset, setups)))
+
+    def read_schema(setup):
+        list_calls_before = setup.list_calls
+        try:
+            return setup.read_live_schema(), max(1, setup.list_calls - list_calls_before)
+        except AppwriteException as e:
+            setup.log(f"Could not read live schema, planning during setup: {e.message}", "warning")
+            return False, 0
+
+    plans = {}
+    target_plans = {}
+    if use_plan or dry_run:
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            live_schemas = list(pool.map(read_schema, setups))
+        for setup, (live_schema, read_calls) in zip(setups, live_schemas):
+            if live_schema is False:
+                continue
+            fingerprint = setup.schema_fingerprint(live_schema)
+            if fingerprint not in plans:
+                plans[fingerprint] = setup.plan_from_live_schema(collections_config, live_schema, read_calls)
+            plan = plans[fingerprint]
+            target_plans[setup.database_id] = {
+                **plan,
+                'actions': [dict(action, database_id=setup.database_id) if 'database_id' in action else action
+                            for action in plan['actions']]
+            }
+
+    def run(setup):
+        started = time.monotonic()
+        result = setup.execute_complete_setup(force_recreate, pipelined, concurrency, use_plan, dry_run,
+                                              target_plans.get(setup.database_id))
+        summary = {
+            'success': result['success'],
+            'status': result.get('status', 'dry_run' if result.get('dry_run') else 'failed'),
+            'duration_seconds': round(time.monotonic() - started, 3),
+            'collections_created': result.get('collections_created', 0),
+            'indexes_created': result.get('indexes_created', 0),
+            'seed_rows': sum(stats['rows'] for stats in result.get('seed_stats', {}).values()),
+            'reset': resets.get(setup.database_id),
+        }
+        if result.get('dry_run'):
+            summary['plan_actions'] = len(result['plan']['actions'])
+        for key in ('continuation_token', 'deferred', 'error'):
+            if key in result:
+                summary[key] = result[key]
+        return summary
+
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        results = dict(zip(database_ids, pool.map(run, setups)))
+
+    return {
+        'success': all(result['success'] for result in results.values()),
+        'databases': results,
+        'plans_computed': len(plans),
+        'rate_governor': governor.summary(),
+        'api_metrics': api_metrics.summary(),
+    }
 
 
 # Function execution entry point for local testing
@@ -1078,7 +3305,7 @@ if __name__ == "__main__":
     class MockRequest:
         def __init__(self):
             self.method = "POST"
-            self.body = '{"confirm_setup": true}'
+            self.body = json.dumps({"confirm_setup": True, "profile": "profile" in sys.argv[2:]})
             self.headers = {}
 
 
@@ -1089,9 +3316,14 @@ if __name__ == "__main__":
             return data
 
 
-    # Test locally
+    # Test locally; without an endpoint, run against the in-memory fake
+    # ("test profile" also profiles the run)
     if len(sys.argv) > 1 and sys.argv[1] == "test":
-        result = main(MockContext())
+        databases = None
+        if not os.getenv('APPWRITE_FUNCTION_API_ENDPOINT'):
+            from example_fake_databases import FakeDatabases
+            databases = FakeDatabases(latency=0.005, attribute_delay=0.01)
+        result = main(MockContext(), databases)
         print("Local test completed")
     else:
         print("This is an Appwrite Function. Deploy it to Appwrite to use.")
@@ -0,0 +1,422 @@
+"""
+Streaming dm+d importer for the nhs_medicines collection.
+
+Reads a locally supplied TRUD dm+d release (zip of XML files, nested zips
+included) with incremental parsing, maps VTM/VMP/AMP records into
+nhs_medicines rows, writes them in concurrent batches and records the
+run in nhs_trud_sync.
+
+Each row carries a content_hash. The current hashes are read once
+(keyed by snomed_code) and products missing from the release are
+deleted in both modes. A full import rewrites every product (upserting
+the ones already stored), so release_id records the release imported
+last. With --delta only new or changed products are written, and
+release_id records the release that last changed a product.
+
+Memory stays bounded by the size of the lookup tables (codes, ingredient
+names and a small per-VMP summary that AMPs inherit), never by the size
+of the XML: every record element is dropped as soon as it is mapped.
+Each batch is checked against the nhs_medicines schema before it is
+sent; invalid rows are counted and reported without a request.
+
+Usage:
+    python example_dmd_import.py nhsbsa_dmd_3.4.0_20251103000001.zip
+    python example_dmd_import.py nhsbsa_dmd_3.4.0_20251110000001.zip --delta
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from datetime import datetime
+
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+
+from example_dev_set_up import (DevelopmentDatabaseSetup, BatchedDocumentWriter, create_databases_from_env,
+                                iter_documents)
+
+
+# dm+d file name patterns inside the release zip
+DMD_FILES = {
+    'lookup': re.compile(r'f_lookup2_\w*\.xml$', re.IGNORECASE),
+    'ingredient': re.compile(r'f_ingredient2_\w*\.xml$', re.IGNORECASE),
+    'vtm': re.compile(r'f_vtm2_\w*\.xml$', re.IGNORECASE),
+    'vmp': re.compile(r'f_vmp2_\w*\.xml$', re.IGNORECASE),
+    'amp': re.compile(r'f_amp2_\w*\.xml$', re.IGNORECASE),
+}
+
+# Lookup tables needed for mapping
+LOOKUP_SECTIONS = {
+    'FORM', 'SUPPLIER', 'CONTROL_DRUG_CATEGORY', 'AVAILABILITY_RESTRICTION',
+    'VIRTUAL_PRODUCT_NON_AVAIL', 'UNIT_OF_MEASURE',
+}
+
+PRESCRIBABLE_STATUS = '0001'  # "Valid as a prescribable product"
+NO_CONTROLLED_DRUG = '0000'  # "No Controlled Drug Status"
+
+RELEASE_PATTERN = re.compile(r'(\d+\.\d+\.\d+)_(\d{8})')
+
+# Fields that change on every release without the product changing
+UNHASHED_FIELDS = {'release_id', 'content_hash', 'created_at', 'updated_at'}
+
+
+def local_name(tag: str) -> str:
+    """Strip any XML namespace from a tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_records(stream, record_tags: set):
+    """
+    Incrementally parse an XML stream, yielding (tag, parent_tag, fields).
+
+    fields maps child tag -> text for each record element. Every element
+    that ends outside a record (records once yielded, and the records and
+    sections this pass skips) is detached from its parent and cleared, so
+    memory does not grow with the file.
+    """
+    stack = []
+    open_records = 0  # Record elements on the stack; their fields are kept until they end
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        tag = local_name(elem.tag)
+        if event == 'start':
+            stack.append(elem)
+            if tag in record_tags:
+                open_records += 1
+            continue
+
+        stack.pop()
+        if tag in record_tags:
+            open_records -= 1
+            parent_tag = local_name(stack[-1].tag) if stack else None
+            yield tag, parent_tag, {local_name(child.tag): (child.text or '').strip() for child in elem}
+        elif open_records:
+            continue
+        if stack:
+            stack[-1].remove(elem)
+        elem.clear()
+
+
+class DmdRelease:
+    """Locate dm+d XML files in a release zip, including nested zips"""
+
+    def __init__(self, zip_path: str):
+        self.zip_path = zip_path
+        self.zip_file = zipfile.ZipFile(zip_path)
+        self.members = {}  # kind -> (zip file, member info)
+        self.nested = []
+        self.index(self.zip_file)
+
+    def index(self, archive: zipfile.ZipFile):
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if name.lower().endswith('.zip'):
+                nested = zipfile.ZipFile(archive.open(info))  # Streamed, not read into memory
+                self.nested.append(nested)
+                self.index(nested)
+                continue
+            for kind, pattern in DMD_FILES.items():
+                if pattern.search(name):
+                    self.members[kind] = (archive, info)
+
+    def open(self, kind: str):
+        archive, info = self.members[kind]
+        return archive.open(info)
+
+    def xml_files(self) -> list:
+        return [info.filename for _, info in self.members.values()]
+
+    def total_xml_bytes(self) -> int:
+        return sum(info.file_size for _, info in self.members.values())
+
+    def close(self):
+        for nested in self.nested:
+            nested.close()
+        self.zip_file.close()
+
+
+class DmdImporter:
+    """Map a dm+d release into nhs_medicines rows and load them in batches"""
+
+    def __init__(self, databases, database_id: str = 'eprescription_dev', batch_size: int = 100,
+                 workers: int = 8, log=print):
+        self.databases = databases
+        self.database_id = database_id
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log
+
+        config = {info['id']: info for info in DevelopmentDatabaseSetup.get_collections_config()}
+        self.medicine_sizes = {attr['key']: attr.get('size') for attr in config['nhs_medicines']['attributes']}
+
+        self.lookups = {}
+        self.ingredients = {}
+        self.vmp_summary = {}
+
+    def import_release(self, zip_path: str, release_id: str = None, delta: bool = False) -> dict:
+        """Import a release (in full, or only its delta) and record it in nhs_trud_sync"""
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        release_id, release_date = self.release_info(zip_path, release_id)
+        self.log(f"Importing dm+d release {release_id} from {zip_path} ({'delta' if delta else 'full'})")
+
+        # snomed_code -> (document id, content hash) for the current contents
+        existing = self.read_current_hashes()
+        self.log(f"Read {len(existing)} current product hashes")
+
+        release = DmdRelease(zip_path)
+        missing = [kind for kind in ('lookup', 'vtm', 'vmp', 'amp') if kind not in release.members]
+        if missing:
+            release.close()
+            raise ValueError(f"Release is missing dm+d files: {', '.join(missing)}")
+
+        writer = BatchedDocumentWriter(self.databases, self.database_id, self.batch_size, self.workers,
+                                       DevelopmentDatabaseSetup.document_validators())
+        counts = {'VTM': 0, 'VMP': 0, 'AMP': 0}
+        changes = {'new': 0, 'changed': 0, 'unchanged': 0, 'withdrawn': 0}
+        errors = []
+        try:
+            for row in self.iter_medicine_rows(release, release_id):
+                counts[row['type']] += 1
+                current = existing.pop(row['snomed_code'], None)
+                if current is None:
+                    writer.add('nhs_medicines', row['snomed_code'], row)
+                    changes['new'] += 1
+                else:
+                    changed = current[1] != row['content_hash']
+                    if changed or not delta:
+                        writer.upsert('nhs_medicines', current[0],
+                                      {k: v for k, v in row.items() if k != 'created_at'})
+                    changes['changed' if changed else 'unchanged'] += 1
+
+            # Whatever is left was withdrawn from the release. Only reached
+            # when the whole release parsed, so a bad file never deletes data.
+            for document_id, _ in existing.values():
+                writer.delete('nhs_medicines', document_id)
+                changes['withdrawn'] += 1
+        except Exception as e:
+            errors.append(str(e))
+            self.log(f"dm+d import aborted: {str(e)}")
+        finally:
+            writer_stats = writer.close()
+            xml_files = release.xml_files()
+            total_xml_bytes = release.total_xml_bytes()
+            release.close()
+
+        duration = time.monotonic() - started
+        total = sum(counts.values())
+        errors.extend(writer_stats['errors'])
+        result = {
+            'release_id': release_id,
+            'products': counts,
+            'total_products': total,
+            'changes': changes,
+            'written': writer_stats['written'],
+            'updated': writer_stats['updated'],
+            'deleted': writer_stats['deleted'],
+            'existing': writer_stats['existing'],
+            'failed': writer_stats['failed'],
+            'invalid': writer_stats['invalid'],
+            'duration_seconds': round(duration, 2),
+            'products_per_second': round(total / duration, 1) if duration > 0 else 0.0,
+            'xml_mb_per_second': round(total_xml_bytes / 1024 / 1024 / duration, 2) if duration > 0 else 0.0,
+        }
+        self.log(f"Imported {total} products in {duration:.1f}s ({result['products_per_second']} products/sec)")
+
+        self.record_sync({
+            'release_id': release_id,
+            'release_date': release_date,
+            'release_name': os.path.basename(zip_path)[:255],
+            'total_products': total,
+            'products_updated': writer_stats['written'] + writer_stats['updated'] + writer_stats['deleted'],
+            'products_failed': writer_stats['failed'],
+            'sync_started': started_at.isoformat() + 'Z',
+            'sync_completed': datetime.utcnow().isoformat() + 'Z',
+            'download_size_mb': round(os.path.getsize(zip_path) / 1024 / 1024, 2),
+            'files_extracted': len(xml_files),
+            'total_xml_size_mb': round(total_xml_bytes / 1024 / 1024, 2),
+            'extracted_files': json.dumps(xml_files)[:10000],
+            'duration_seconds': round(duration, 2),
+            'status': 'failed' if errors and not total else ('partial' if errors else 'completed'),
+            'errors': json.dumps(errors)[:5000] if errors else None,
+            'file_size_mb': round(os.path.getsize(zip_path) / 1024 / 1024, 2),
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+        })
+        result['errors'] = errors
+        return result
+
+    def read_current_hashes(self) -> dict:
+        """Read snomed_code -> (document id, content_hash) for every stored product"""
+        hashes = {}
+        documents = iter_documents(self.databases, self.database_id, 'nhs_medicines',
+                                   [Query.select(['$id', 'snomed_code', 'content_hash'])], page_size=1000)
+        for document in documents:
+            hashes[document['snomed_code']] = (document['$id'], document.get('content_hash'))
+        return hashes
+
+    @staticmethod
+    def content_hash(row: dict) -> str:
+        """SHA-1 over a row's product fields"""
+        content = {k: v for k, v in row.items() if k not in UNHASHED_FIELDS}
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def release_info(zip_path: str, release_id: str = None) -> tuple:
+        """Derive (release_id, release_date) from a TRUD file name"""
+        name = os.path.splitext(os.path.basename(zip_path))[0]
+        match = RELEASE_PATTERN.search(name)
+        release_date = datetime.utcnow()
+        if match:
+            release_date = datetime.strptime(match.group(2), '%Y%m%d')
+            release_id = release_id or f"{match.group(1)}_{match.group(2)}"
+        return (release_id or name)[:50], release_date.isoformat() + 'Z'
+
+    def iter_medicine_rows(self, release: DmdRelease, release_id: str):
+        """Yield nhs_medicines rows for every valid VTM, VMP and AMP"""
+        self.load_lookups(release)
+        timestamp = datetime.utcnow().isoformat() + 'Z'
+
+        def row(snomed_code, name, product_type, **fields):
+            data = {
+                'snomed_code': snomed_code,
+                'name': name,
+                'type': product_type,
+                'release_id': release_id,
+                'created_at': timestamp,
+                'updated_at': timestamp,
+                **{k: v for k, v in fields.items() if v is not None},
+            }
+            # Trim strings to the schema sizes rather than failing the batch
+            for key, value in data.items():
+                size = self.medicine_sizes.get(key)
+                if size and isinstance(value, str) and len(value) > size:
+                    data[key] = value[:size]
+            data['content_hash'] = self.content_hash(data)
+            return data
+
+        with release.open('vtm') as stream:
+            for _, _, vtm in iter_records(stream, {'VTM'}):
+                if vtm.get('INVALID') != '1' and vtm.get('VTMID'):
+                    yield row(vtm['VTMID'], vtm.get('NM', ''), 'VTM', prescribable=False)
+
+        # VMP details (forms, ingredients, controlled status) follow the VMP
+        # records in the same file, so collect them in a first pass
+        forms, strengths, controlled = {}, {}, {}
+        with release.open('vmp') as stream:
+            for tag, _, fields in iter_records(stream, {'VPI', 'DFORM', 'CONTROL_INFO'}):
+                vpid = fields.get('VPID')
+                if tag == 'DFORM':
+                    forms[vpid] = self.lookup('FORM', fields.get('FORMCD'))
+                elif tag == 'CONTROL_INFO':
+                    controlled[vpid] = fields.get('CATCD', NO_CONTROLLED_DRUG) != NO_CONTROLLED_DRUG
+                else:
+                    strengths.setdefault(vpid, []).append({
+                        'name': self.ingredients.get(fields.get('ISID'), fields.get('ISID')),
+                        'strength': self.format_strength(fields),
+                    })
+
+        with release.open('vmp') as stream:
+            for _, _, vmp in iter_records(stream, {'VMP'}):
+                vpid = vmp.get('VPID')
+                if vmp.get('INVALID') == '1' or not vpid:
+                    continue
+                ingredients = strengths.pop(vpid, [])
+                strength = ', '.join(i['strength'] for i in ingredients if i['strength']) or None
+                summary = {
+                    'form': forms.pop(vpid, None),
+                    'prescribable': vmp.get('PRES_STATCD') == PRESCRIBABLE_STATUS,
+                    'controlled_drug': controlled.pop(vpid, False),
+                    'strength': strength,
+                }
+                self.vmp_summary[vpid] = summary
+                yield row(vpid, vmp.get('NM', ''), 'VMP',
+                          ingredients=json.dumps(ingredients) if ingredients else None,
+                          availability=self.lookup('VIRTUAL_PRODUCT_NON_AVAIL', vmp.get('NON_AVAILCD')),
+                          **summary)
+
+        with release.open('amp') as stream:
+            for _, _, amp in iter_records(stream, {'AMP'}):
+                if amp.get('INVALID') == '1' or not amp.get('APID'):
+                    continue
+                summary = self.vmp_summary.get(amp.get('VPID'), {})
+                yield row(amp['APID'], amp.get('NM') or amp.get('DESC', ''), 'AMP',
+                          manufacturer=self.lookup('SUPPLIER', amp.get('SUPPCD')),
+                          availability=self.lookup('AVAILABILITY_RESTRICTION', amp.get('AVAIL_RESTRICTCD')),
+                          **summary)
+
+    def load_lookups(self, release: DmdRelease):
+        """Load code -> description tables and ingredient names"""
+        with release.open('lookup') as stream:
+            for _, section, info in iter_records(stream, {'INFO'}):
+                if section in LOOKUP_SECTIONS:
+                    self.lookups.setdefault(section, {})[info.get('CD')] = info.get('DESC')
+
+        if 'ingredient' in release.members:
+            with release.open('ingredient') as stream:
+                for _, _, ing in iter_records(stream, {'ING'}):
+                    if ing.get('INVALID') != '1':
+                        self.ingredients[ing.get('ISID')] = ing.get('NM')
+
+    def lookup(self, section: str, code: str):
+        if not code:
+            return None
+        return self.lookups.get(section, {}).get(code, code)
+
+    def format_strength(self, vpi: dict) -> str:
+        """Render a VPI strength, e.g. '500 mg' or '250 mg / 5 ml'"""
+        value = vpi.get('STRNT_NMRTR_VAL')
+        if not value:
+            return ''
+        strength = f"{self.trim_number(value)} {self.lookup('UNIT_OF_MEASURE', vpi.get('STRNT_NMRTR_UOMCD')) or ''}"
+        if vpi.get('STRNT_DNMTR_VAL'):
+            strength += (f" / {self.trim_number(vpi['STRNT_DNMTR_VAL'])} "
+                         f"{self.lookup('UNIT_OF_MEASURE', vpi.get('STRNT_DNMTR_UOMCD')) or ''}")
+        return strength.strip()
+
+    @staticmethod
+    def trim_number(value: str) -> str:
+        return value.rstrip('0').rstrip('.') if '.' in value else value
+
+    def record_sync(self, record: dict):
+        """Create or update the nhs_trud_sync document for this release"""
+        record = {k: v for k, v in record.items() if v is not None}
+        document_id = DevelopmentDatabaseSetup.seed_document_id('nhs_trud_sync', record['release_id'], 'sync')
+        try:
+            self.databases.create_document(
+                database_id=self.database_id,
+                collection_id='nhs_trud_sync',
+                document_id=document_id,
+                data=record
+            )
+        except AppwriteException as e:
+            if e.code != 409:
+                self.log(f"Error recording nhs_trud_sync for {record['release_id']}: {e.message}")
+                return
+            record.pop('created_at', None)
+            self.databases.update_document(
+                database_id=self.database_id,
+                collection_id='nhs_trud_sync',
+                document_id=document_id,
+                data=record
+            )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Import a TRUD dm+d release into nhs_medicines')
+    parser.add_argument('release_zip')
+    parser.add_argument('--release-id', default=None)
+    parser.add_argument('--delta', action='store_true', help='Write only new, changed and withdrawn products')
+    parser.add_argument('--database', default='eprescription_dev')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    importer = DmdImporter(create_databases_from_env(), args.database, args.batch_size, args.workers)
+    print(json.dumps(importer.import_release(args.release_zip, args.release_id, args.delta), indent=2))
@@ -0,0 +1,193 @@
+"""
+Client-side document validation compiled from get_collections_config().
+
+Every collection's attribute list is compiled once into a table of
+per-attribute checks (type, string size, integer range, email/url
+format), the required keys and the defaults. Rows are then checked
+locally, one at a time or a whole batch in one pass, so a row the
+server would reject (an oversized settings string, a missing required
+created_at, a string where an integer belongs) is rejected before any
+network I/O instead of costing a round trip and a failed request.
+
+Problems in the config itself (a required attribute with a default, a
+default that fails its own check) are collected in config_errors.
+
+Usage:
+    validators = compile_validators(DevelopmentDatabaseSetup.get_collections_config())
+    valid, rejected = validators['clinics'].validate(rows)
+"""
+
+import re
+from datetime import datetime
+
+from appwrite.exception import AppwriteException
+
+
+# Appwrite integer attributes are signed 64-bit unless min/max narrow them
+INTEGER_MIN = -(2 ** 63)
+INTEGER_MAX = 2 ** 63 - 1
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+URL_PATTERN = re.compile(r'^[a-z][a-z0-9+.-]*://[^\s/?#]+\S*$', re.IGNORECASE)
+
+MAX_ERRORS_PER_ROW = 5
+
+
+def check_string(size: int):
+    def check(value):
+        if not isinstance(value, str):
+            return 'must be a string'
+        if len(value) > size:
+            return f'must be no longer than {size} chars (got {len(value)})'
+        return None
+    return check
+
+
+def check_integer(minimum: int = INTEGER_MIN, maximum: int = INTEGER_MAX):
+    def check(value):
+        if not isinstance(value, int) or isinstance(value, bool):
+            return 'must be an integer'
+        if not minimum <= value <= maximum:
+            return f'must be between {minimum} and {maximum}'
+        return None
+    return check
+
+
+def check_float(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return 'must be a number'
+    if value != value or value in (float('inf'), float('-inf')):
+        return 'must be a finite number'
+    return None
+
+
+def check_boolean(value):
+    return None if isinstance(value, bool) else 'must be a boolean'
+
+
+def check_datetime(value):
+    if not isinstance(value, str):
+        return 'must be an ISO 8601 datetime string'
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return 'must be an ISO 8601 datetime string'
+    return None
+
+
+def check_pattern(pattern: re.Pattern, description: str, size: int = 255):
+    def check(value):
+        if not isinstance(value, str) or len(value) > size or not pattern.match(value):
+            return f'must be a valid {description}'
+        return None
+    return check
+
+
+def compile_check(attribute: dict):
+    """The value check for one attribute config entry"""
+    attr_type = attribute['attr_type']
+    if attr_type == 'string':
+        return check_string(attribute.get('size') or 255)
+    if attr_type == 'integer':
+        return check_integer(attribute.get('min', INTEGER_MIN), attribute.get('max', INTEGER_MAX))
+    if attr_type == 'float':
+        return check_float
+    if attr_type == 'boolean':
+        return check_boolean
+    if attr_type == 'datetime':
+        return check_datetime
+    if attr_type == 'email':
+        return check_pattern(EMAIL_PATTERN, 'email address')
+    if attr_type == 'url':
+        return check_pattern(URL_PATTERN, 'URL')
+    raise ValueError(f"Unsupported attribute type {attr_type} for {attribute['key']}")
+
+
+class DocumentValidator:
+    """Compiled checks for the documents of one collection"""
+
+    def __init__(self, collection_info: dict):
+        self.collection_id = collection_info['id']
+        self.checks = {}
+        self.required = []
+        self.defaults = {}
+        self.config_errors = []
+
+        for attribute in collection_info['attributes']:
+            key = attribute['key']
+            check = compile_check(attribute)
+            self.checks[key] = check
+            if attribute.get('required'):
+                self.required.append(key)
+
+            default = attribute.get('default')
+            if default is None:
+                continue
+            if attribute.get('required'):
+                # The server refuses to create such an attribute
+                self.config_errors.append(f"{self.collection_id}.{key}: required attribute cannot have a default")
+            problem = check(default)
+            if problem:
+                self.config_errors.append(f"{self.collection_id}.{key}: default {problem}")
+            else:
+                self.defaults[key] = default
+
+    def errors(self, data: dict, partial: bool = False) -> list:
+        """
+        Problems the server would report for data (empty when valid).
+
+        partial=True checks an update: only the given keys, no required
+        fields.
+        """
+        errors = []
+        checks = self.checks
+        for key, value in data.items():
+            check = checks.get(key)
+            if check is None:
+                if not key.startswith('$'):
+                    errors.append(f'Unknown attribute "{key}"')
+            elif value is None:
+                if not partial and key in self.required:
+                    errors.append(f'Missing required attribute "{key}"')
+            else:
+                problem = check(value)
+                if problem:
+                    errors.append(f'Attribute "{key}" {problem}')
+        if not partial:
+            for key in self.required:
+                if key not in data:
+                    errors.append(f'Missing required attribute "{key}"')
+        return errors[:MAX_ERRORS_PER_ROW]
+
+    def validate(self, rows: list, partial: bool = False) -> tuple:
+        """
+        Check a batch of rows in one pass.
+
+        Returns (valid rows, rejected) where rejected holds
+        (position, row, errors) for every invalid row.
+        """
+        valid, rejected = [], []
+        for position, row in enumerate(rows):
+            errors = self.errors(row, partial)
+            if errors:
+                rejected.append((position, row, errors))
+            else:
+                valid.append(row)
+        return valid, rejected
+
+    def check(self, data: dict, partial: bool = False):
+        """Raise the AppwriteException the server would raise for invalid data"""
+        errors = self.errors(data, partial)
+        if errors:
+            raise AppwriteException(f"Invalid document structure: {'; '.join(errors)}", 400,
+                                    'document_invalid_structure')
+
+    def with_defaults(self, data: dict) -> dict:
+        """data with the configured defaults filled in for missing keys"""
+        return {**self.defaults, **data}
+
+
+def compile_validators(collections_config: list) -> dict:
+    """collection id -> DocumentValidator for every collection in the config"""
+    return {info['id']: DocumentValidator(info) for info in collections_config}
+
@@ -0,0 +1,266 @@
+"""
+CPU and memory profiling of one function execution.
+
+ExecutionProfiler runs a handler under cProfile and tracemalloc and
+reports the top-N functions by CPU time, peak traced memory and the
+largest allocation sites still alive at the end. It works inside a
+deployed execution: the report goes into the JSON response, and the
+full cProfile stats can be returned with it (include_stats) and turned
+into a file for pstats or snakeviz with the CLI below. Writing the stats
+to a server-side file (output) is a constructor argument only, never a
+request option, so a request body cannot choose a path to write to.
+
+Threads started while profiling (the setup's worker pools) are profiled
+too: before Python 3.12 every new thread gets its own cProfile.Profile
+and the stats are merged; from 3.12 one profiler sees every thread.
+Times are per-thread CPU time by default, so threads waiting on the
+server (sleep, lock and queue waits) do not bury the hotspots; use
+clock='wall' to see where the execution waits instead.
+tracemalloc slows allocation-heavy code down by about 2x; pass
+memory=False for CPU figures closer to an unprofiled run.
+
+Usage:
+    POST {"profile": true}
+    POST {"profile": {"top": 40, "sort": "cumulative", "memory": false, "include_stats": true}}
+
+    # Turn the stats of a saved response into a .prof file and print them
+    python example_execution_profiler.py response.json setup.prof
+"""
+
+import argparse
+import base64
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SORT_KEYS = {'tottime': 2, 'cumulative': 3, 'calls': 1}
+CLOCKS = {'cpu': time.thread_time, 'wall': time.perf_counter}
+
+
+def location(filename: str, lineno: int, name: str = None) -> str:
+    """Short source location: file name and line, plus function"""
+    if filename == '~':  # Built-in function
+        return name
+    where = f"{os.path.basename(filename)}:{lineno}" if lineno else filename
+    return f"{where}({name})" if name else where
+
+
+class ProfiledResponse:
+    """
+    Response proxy that keeps the handler's JSON response instead of sending it.
+
+    Encoding the response happens here, inside the profiled region, so its
+    cost shows up in the report.
+    """
+
+    def __init__(self, res):
+        self.res = res
+        self.response = None
+        self.response_bytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.res, name)
+
+    def json(self, data, *args, **kwargs):
+        self.response_bytes = len(json.dumps(data, default=str))
+        self.response = (data, args, kwargs)
+        return self.response
+
+
+class ProfiledContext:
+    """Context proxy whose res is a ProfiledResponse"""
+
+    def __init__(self, context):
+        self.context = context
+        self.res = ProfiledResponse(context.res)
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+
+class ExecutionProfiler:
+    """Profile one execution with cProfile (all threads) and tracemalloc"""
+
+    def __init__(self, top: int = 25, sort: str = 'tottime', memory: bool = True, memory_frames: int = 1,
+                 clock: str = 'cpu', include_stats: bool = False, output: str = None):
+        """
+        Args:
+            top: functions and allocation sites reported
+            sort: 'tottime' (own time), 'cumulative' (including callees) or 'calls'
+            memory: trace allocations (peak and top allocation sites)
+            clock: 'cpu' (per-thread CPU time) or 'wall' (including waits)
+            include_stats: add the full stats, compressed, to the report
+            output: also write the stats to this path (pstats format); not
+                settable from a request
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown profile sort '{sort}' (expected one of {', '.join(SORT_KEYS)})")
+        if clock not in CLOCKS:
+            raise ValueError(f"Unknown profile clock '{clock}' (expected one of {', '.join(CLOCKS)})")
+        self.top = max(1, int(top))
+        self.sort = sort
+        self.memory = memory
+        self.memory_frames = max(1, int(memory_frames))
+        self.clock = clock
+        self.include_stats = include_stats
+        self.output = output
+
+        self.lock = threading.Lock()
+        self.profilers = []
+        self.started_tracing = False
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes = None
+        self.snapshot = None
+
+    @classmethod
+    def from_option(cls, option):
+        """Profiler for a request body's 'profile' value (None when profiling is off); output is not accepted"""
+        if not option:
+            return None
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            unknown = set(option) - {'top', 'sort', 'memory', 'memory_frames', 'clock', 'include_stats'}
+            if unknown:
+                raise ValueError(f"Unknown profile options: {', '.join(sorted(unknown))}")
+            return cls(**option)
+        raise ValueError("profile must be true or an object of options")
+
+    def run(self, handler, context, *args):
+        """Call handler(context, *args) under the profiler and add a 'profile' section to its response"""
+        profiled = ProfiledContext(context)
+        self.start()
+        try:
+            handler(profiled, *args)
+        finally:
+            self.stop()
+
+        data, res_args, res_kwargs = profiled.res.response
+        report = self.report()
+        report['response_bytes'] = profiled.res.response_bytes
+        return context.res.json({**data, 'profile': report}, *res_args, **res_kwargs)
+
+    def start(self):
+        if self.memory:
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start(self.memory_frames)
+            tracemalloc.reset_peak()
+
+        profiler = cProfile.Profile(CLOCKS[self.clock])
+        self.profilers.append(profiler)
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.profile_thread)
+        self.wall_started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        profiler.enable()
+
+    def profile_thread(self, frame, event, arg):
+        """First profile event of a new thread: give the thread its own profiler"""
+        profiler = cProfile.Profile(CLOCKS[self.clock])
+        with self.lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def stop(self):
+        self.profilers[0].disable()
+        self.cpu_seconds = time.process_time() - self.cpu_started
+        self.wall_seconds = time.perf_counter() - self.wall_started
+        threading.setprofile(None)
+
+        if self.memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            self.snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            if self.started_tracing:
+                tracemalloc.stop()
+
+    def stats(self) -> pstats.Stats:
+        """Stats merged over every profiled thread"""
+        with self.lock:
+            profilers = list(self.profilers)
+        return pstats.Stats(*profilers, stream=io.StringIO())
+
+    def report(self) -> dict:
+        stats = self.stats()
+        column = SORT_KEYS[self.sort]
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)
+
+        report = {
+            'wall_seconds': round(self.wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'threads_profiled': len(self.profilers),
+            'function_calls': stats.total_calls,
+            'clock': self.clock,
+            'sort': self.sort,
+            'hotspots': [{
+                'function': location(*func),
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'own_seconds': round(own, 4),
+                'cumulative_seconds': round(cumulative, 4),
+            } for func, (primitive_calls, calls, own, cumulative, _) in ranked[:self.top]],
+        }
+
+        if self.memory:
+            report['memory'] = {
+                'peak_traced_mb': round(self.peak_bytes / 1048576, 2),
+                'retained_traced_mb': round(sum(trace.size for trace in self.snapshot.traces) / 1048576, 2),
+                'top_retained': [{
+                    'location': location(stat.traceback[0].filename, stat.traceback[0].lineno),
+                    'kilobytes': round(stat.size / 1024, 1),
+                    'blocks': stat.count,
+                } for stat in self.snapshot.statistics('lineno')[:self.top]],
+            }
+        if resource is not None:
+            # Whole process since it started, in kilobytes on Linux
+            report['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        if self.output:
+            stats.dump_stats(self.output)
+            report['output'] = self.output
+        if self.include_stats:
+            report['stats'] = base64.b64encode(zlib.compress(marshal.dumps(stats.stats), 6)).decode('ascii')
+        return report
+
+
+def decode_stats(encoded: str, path: str):
+    """Write the 'stats' of a report as a pstats file"""
+    with open(path, 'wb') as out:
+        out.write(zlib.decompress(base64.b64decode(encoded)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract the profile stats of a saved function response")
+    parser.add_argument('response', help="Saved JSON response of a run with include_stats")
+    parser.add_argument('output', help="pstats file to write (open with pstats or snakeviz)")
+    parser.add_argument('--sort', default='tottime', choices=list(SORT_KEYS))
+    parser.add_argument('--top', type=int, default=30)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.response) as f:
+        response = json.load(f)
+    if 'stats' not in response.get('profile', {}):
+        sys.exit("Response has no profile stats (run with {\"profile\": {\"include_stats\": true}})")
+    decode_stats(response['profile']['stats'], args.output)
+    pstats.Stats(args.output).sort_stats(args.sort).print_stats(args.top)
@@ -0,0 +1,740 @@
+"""
+In-memory fake of the Appwrite Databases service.
+
+A drop-in replacement for the Databases service used by
+DevelopmentDatabaseSetup and the standalone tools, so setup, seeding and
+imports can be run and timed with no network. It keeps databases,
+collections, attributes, indexes and documents in memory and mimics the
+server behaviour the code relies on:
+
+- create calls raise AppwriteException 409 for existing items and 404 for
+  missing parents
+- attributes and indexes start as 'processing' and become 'available'
+  once a simulated database worker has processed them (queued in
+  submission order over attribute_workers workers)
+- create_index fails with 400 while any of its attributes is not available
+- documents are checked against the collection's available attributes
+- list calls understand limit, offset, cursorAfter, select, equal,
+  notEqual, lessThan(Equal), greaterThan(Equal), search and order queries
+- with scan_cost, list_documents takes time per document examined: a
+  query served by an available index (equality prefix, then one range
+  or the sort attribute) examines only the matching index range, any
+  other query scans the collection (see explain())
+
+Latency and failures can be injected per method to model a real server.
+All randomness comes from a seeded generator, so runs are repeatable.
+
+Usage:
+    databases = FakeDatabases(latency={'*': 0.02, 'list_documents': (0.01, 0.05)},
+                              errors={'create_document': (0.01, 503)}, attribute_delay=0.2)
+    setup = DevelopmentDatabaseSetup(context, databases=databases)
+    databases.stats()
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from appwrite.exception import AppwriteException
+
+
+ATTRIBUTE_TYPES = {
+    'create_string_attribute': ('string', None),
+    'create_integer_attribute': ('integer', None),
+    'create_float_attribute': ('double', None),
+    'create_boolean_attribute': ('boolean', None),
+    'create_datetime_attribute': ('datetime', None),
+    'create_email_attribute': ('string', 'email'),
+    'create_url_attribute': ('string', 'url'),
+}
+
+
+def timestamp() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class FakeDatabases:
+    """Thread-safe in-memory Databases service with latency and error injection"""
+
+    def __init__(self, latency=None, errors: dict = None, attribute_delay: float = 0.5,
+                 index_delay: float = None, attribute_workers: int = 1, seed: int = 0,
+                 failing_attributes=(), bulk: bool = True, scan_cost: float = 0.0):
+        """
+        Args:
+            latency: seconds added to every call, or a dict of method name
+                (or '*') -> seconds or a (min, max) range
+            errors: dict of method name (or '*') -> (rate, code) for
+                randomly injected AppwriteExceptions
+            attribute_delay: processing time of one attribute
+            index_delay: processing time of one index (attribute_delay if None)
+            attribute_workers: attributes and indexes processed in parallel
+            seed: seed for latency jitter and error injection
+            failing_attributes: 'collection_id.key' names that end up 'failed'
+            bulk: expose create_documents / upsert_documents / delete_documents
+            scan_cost: seconds per document a list_documents query examines
+        """
+        if not isinstance(latency, dict):
+            latency = {'*': latency or 0.0}
+        self.latency = latency
+        self.errors = errors or {}
+        self.attribute_delay = attribute_delay
+        self.index_delay = attribute_delay if index_delay is None else index_delay
+        self.failing_attributes = set(failing_attributes)
+        self.scan_cost = scan_cost
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.worker_free_at = [0.0] * max(1, attribute_workers)
+        self.databases = {}  # database_id -> {'name', 'collections': {collection_id -> collection}}
+        self.calls = Counter()
+        self.injected_errors = Counter()
+        self.scheduled_errors = {}  # method -> [code, ...] raised on the next calls
+
+        if not bulk:
+            # Instance attributes shadow the bulk methods, so hasattr() still
+            # finds them; make them behave like an old server instead
+            for method in ('create_documents', 'upsert_documents', 'delete_documents'):
+                setattr(self, method, self.unsupported(method))
+
+    # Injection
+
+    def fail_next(self, method: str, code: int = 500, times: int = 1):
+        """Make the next calls to a method raise AppwriteException(code)"""
+        with self.lock:
+            self.scheduled_errors.setdefault(method, []).extend([code] * times)
+
+    def call(self, method: str):
+        """Account for a call: inject latency, then maybe an error"""
+        with self.lock:
+            self.calls[method] += 1
+            delay = self.latency.get(method, self.latency.get('*', 0.0))
+            if isinstance(delay, (tuple, list)):
+                delay = self.random.uniform(*delay)
+
+            code = None
+            scheduled = self.scheduled_errors.get(method)
+            if scheduled:
+                code = scheduled.pop(0)
+            else:
+                rate, error_code = self.errors.get(method, self.errors.get('*', (0.0, 500)))
+                if rate and self.random.random() < rate:
+                    code = error_code
+
+        if delay:
+            time.sleep(delay)
+        if code is not None:
+            with self.lock:
+                self.injected_errors[method] += 1
+            raise AppwriteException(f"Injected error for {method}", code, 'injected_error')
+
+    def unsupported(self, method: str):
+        def call(**kwargs):
+            self.call(method)
+            raise AppwriteException("Route not found", 404, 'general_route_not_found')
+        return call
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'total_calls': sum(self.calls.values()),
+                'injected_errors': dict(self.injected_errors),
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.injected_errors.clear()
+
+    # Lookups (call with the lock held)
+
+    def get_database(self, database_id: str) -> dict:
+        database = self.databases.get(database_id)
+        if database is None:
+            raise AppwriteException("Database not found", 404, 'database_not_found')
+        return database
+
+    def get_collection_state(self, database_id: str, collection_id: str) -> dict:
+        collection = self.get_database(database_id)['collections'].get(collection_id)
+        if collection is None:
+            raise AppwriteException("Collection not found", 404, 'collection_not_found')
+        return collection
+
+    def schedule(self, delay: float) -> float:
+        """Queue work on the first free simulated worker; returns its ready time"""
+        now = time.monotonic()
+        worker = min(range(len(self.worker_free_at)), key=self.worker_free_at.__getitem__)
+        ready_at = max(now, self.worker_free_at[worker]) + delay
+        self.worker_free_at[worker] = ready_at
+        return ready_at
+
+    @staticmethod
+    def status(item: dict) -> str:
+        if time.monotonic() < item['ready_at']:
+            return 'processing'
+        return item['final_status']
+
+    def attribute_view(self, attribute: dict) -> dict:
+        view = {key: value for key, value in attribute.items() if key not in ('ready_at', 'final_status')}
+        view['status'] = self.status(attribute)
+        return view
+
+    def index_view(self, index: dict) -> dict:
+        view = {key: value for key, value in index.items() if key not in ('ready_at', 'final_status')}
+        view['status'] = self.status(index)
+        return view
+
+    def collection_view(self, collection: dict) -> dict:
+        return {
+            '$id': collection['$id'],
+            '$createdAt': collection['$createdAt'],
+            '$updatedAt': collection['$updatedAt'],
+            '$permissions': list(collection['$permissions']),
+            'databaseId': collection['databaseId'],
+            'name': collection['name'],
+            'enabled': True,
+            'documentSecurity': collection['documentSecurity'],
+            'attributes': [self.attribute_view(a) for a in collection['attributes'].values()],
+            'indexes': [self.index_view(i) for i in collection['indexes'].values()],
+        }
+
+    # Databases
+
+    def create(self, database_id: str, name: str, enabled: bool = None):
+        self.call('create')
+        with self.lock:
+            if database_id in self.databases:
+                raise AppwriteException("Database already exists", 409, 'database_already_exists')
+            self.databases[database_id] = {'$id': database_id, 'name': name, 'collections': {},
+                                           '$createdAt': timestamp()}
+            return {'$id': database_id, 'name': name, 'enabled': True}
+
+    def get(self, database_id: str):
+        self.call('get')
+        with self.lock:
+            database = self.get_database(database_id)
+            return {'$id': database_id, 'name': database['name'], 'enabled': True}
+
+    def delete(self, database_id: str):
+        self.call('delete')
+        with self.lock:
+            self.get_database(database_id)
+            del self.databases[database_id]
+            return {}
+
+    # Collections
+
+    def create_collection(self, database_id: str, collection_id: str, name: str, permissions: list = None,
+                          document_security: bool = None, enabled: bool = None, **kwargs):
+        self.call('create_collection')
+        with self.lock:
+            collections = self.get_database(database_id)['collections']
+            if collection_id == 'unique()':
+                collection_id = uuid.uuid4().hex[:20]
+            if collection_id in collections:
+                raise AppwriteException("Collection already exists", 409, 'collection_already_exists')
+            created = timestamp()
+            collections[collection_id] = {
+                '$id': collection_id, '$createdAt': created, '$updatedAt': created,
+                '$permissions': permissions or [], 'databaseId': database_id, 'name': name,
+                'documentSecurity': bool(document_security),
+                'attributes': {}, 'indexes': {}, 'documents': {}, 'lookups': {},
+            }
+            return self.collection_view(collections[collection_id])
+
+    def get_collection(self, database_id: str, collection_id: str):
+        self.call('get_collection')
+        with self.lock:
+            return self.collection_view(self.get_collection_state(database_id, collection_id))
+
+    def list_collections(self, database_id: str, queries: list = None, search: str = None, **kwargs):
+        self.call('list_collections')
+        with self.lock:
+            collections = [self.collection_view(c) for c in self.get_database(database_id)['collections'].values()]
+        return {'total': len(collections), 'collections': apply_queries(collections, queries)}
+
+    def delete_collection(self, database_id: str, collection_id: str):
+        self.call('delete_collection')
+        with self.lock:
+            self.get_collection_state(database_id, collection_id)
+            del self.databases[database_id]['collections'][collection_id]
+            return {}
+
+    # Attributes
+
+    def create_attribute(self, method: str, database_id: str, collection_id: str, key: str,
+                         required: bool, default=None, size: int = None, array: bool = None, **kwargs):
+        self.call(method)
+        attr_type, attr_format = ATTRIBUTE_TYPES[method]
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            if key in collection['attributes']:
+                raise AppwriteException("Attribute already exists", 409, 'attribute_already_exists')
+            if required and default is not None:
+                raise AppwriteException("Cannot set default value for required attribute", 400,
+                                        'attribute_default_unsupported')
+
+            attribute = {
+                'key': key, 'type': attr_type, 'required': bool(required), 'array': bool(array),
+                'default': default, 'error': '',
+                'ready_at': self.schedule(self.attribute_delay),
+                'final_status': 'failed' if f"{collection_id}.{key}" in self.failing_attributes else 'available',
+            }
+            if attr_type == 'string':
+                attribute['size'] = int(size or 255)
+            if attr_format:
+                attribute['format'] = attr_format
+            collection['attributes'][key] = attribute
+            return self.attribute_view(attribute)
+
+    def create_string_attribute(self, database_id: str, collection_id: str, key: str, size: int,
+                                required: bool, default=None, array: bool = None, **kwargs):
+        return self.create_attribute('create_string_attribute', database_id, collection_id, key, required,
+                                     default, size, array)
+
+    def create_integer_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                 min=None, max=None, default=None, array: bool = None):
+        return self.create_attribute('create_integer_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def create_float_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                               min=None, max=None, default=None, array: bool = None):
+        return self.create_attribute('create_float_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def create_boolean_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                 default=None, array: bool = None):
+        return self.create_attribute('create_boolean_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def create_datetime_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                  default=None, array: bool = None):
+        return self.create_attribute('create_datetime_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def create_email_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                               default=None, array: bool = None):
+        return self.create_attribute('create_email_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def create_url_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                             default=None, array: bool = None):
+        return self.create_attribute('create_url_attribute', database_id, collection_id, key, required,
+                                     default, array=array)
+
+    def update_attribute(self, method: str, database_id: str, collection_id: str, key: str,
+                         required: bool, default=None, **kwargs):
+        self.call(method)
+        with self.lock:
+            attribute = self.get_collection_state(database_id, collection_id)['attributes'].get(key)
+            if attribute is None or ATTRIBUTE_TYPES[method.replace('update_', 'create_')][0] != attribute['type']:
+                raise AppwriteException("Attribute not found", 404, 'attribute_not_found')
+            if required and default is not None:
+                raise AppwriteException("Cannot set default value for required attribute", 400,
+                                        'attribute_default_unsupported')
+            attribute.update(required=bool(required), default=default)
+            return self.attribute_view(attribute)
+
+    def update_string_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                default=None, size: int = None, new_key: str = None):
+        return self.update_attribute('update_string_attribute', database_id, collection_id, key, required, default)
+
+    def update_integer_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                 default=None, min=None, max=None, new_key: str = None):
+        return self.update_attribute('update_integer_attribute', database_id, collection_id, key, required, default)
+
+    def update_float_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                               default=None, min=None, max=None, new_key: str = None):
+        return self.update_attribute('update_float_attribute', database_id, collection_id, key, required, default)
+
+    def update_boolean_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                 default=None, new_key: str = None):
+        return self.update_attribute('update_boolean_attribute', database_id, collection_id, key, required, default)
+
+    def update_datetime_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                                  default=None, new_key: str = None):
+        return self.update_attribute('update_datetime_attribute', database_id, collection_id, key, required,
+                                     default)
+
+    def update_email_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                               default=None, new_key: str = None):
+        return self.update_attribute('update_email_attribute', database_id, collection_id, key, required, default)
+
+    def update_url_attribute(self, database_id: str, collection_id: str, key: str, required: bool,
+                             default=None, new_key: str = None):
+        return self.update_attribute('update_url_attribute', database_id, collection_id, key, required, default)
+
+    def get_attribute(self, database_id: str, collection_id: str, key: str):
+        self.call('get_attribute')
+        with self.lock:
+            attribute = self.get_collection_state(database_id, collection_id)['attributes'].get(key)
+            if attribute is None:
+                raise AppwriteException("Attribute not found", 404, 'attribute_not_found')
+            return self.attribute_view(attribute)
+
+    def list_attributes(self, database_id: str, collection_id: str, queries: list = None, **kwargs):
+        self.call('list_attributes')
+        with self.lock:
+            attributes = [self.attribute_view(a)
+                          for a in self.get_collection_state(database_id, collection_id)['attributes'].values()]
+        return {'total': len(attributes), 'attributes': apply_queries(attributes, queries)}
+
+    # Indexes
+
+    def create_index(self, database_id: str, collection_id: str, key: str, type, attributes: list,
+                     orders: list = None, lengths: list = None):
+        self.call('create_index')
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            if key in collection['indexes']:
+                raise AppwriteException("Index already exists", 409, 'index_already_exists')
+            for name in attributes:
+                attribute = collection['attributes'].get(name)
+                if attribute is None:
+                    raise AppwriteException(f"Unknown attribute: {name}", 400, 'attribute_unknown')
+                if self.status(attribute) != 'available':
+                    raise AppwriteException(f"Attribute not available: {name}", 400, 'attribute_not_available')
+
+            index = {
+                'key': key, 'type': getattr(type, 'value', type), 'attributes': list(attributes),
+                'orders': list(orders or []), 'error': '',
+                'ready_at': self.schedule(self.index_delay), 'final_status': 'available',
+            }
+            collection['indexes'][key] = index
+            return self.index_view(index)
+
+    def delete_index(self, database_id: str, collection_id: str, key: str):
+        self.call('delete_index')
+        with self.lock:
+            indexes = self.get_collection_state(database_id, collection_id)['indexes']
+            if indexes.pop(key, None) is None:
+                raise AppwriteException("Index not found", 404, 'index_not_found')
+            return {}
+
+    def list_indexes(self, database_id: str, collection_id: str, queries: list = None, **kwargs):
+        self.call('list_indexes')
+        with self.lock:
+            indexes = [self.index_view(i)
+                       for i in self.get_collection_state(database_id, collection_id)['indexes'].values()]
+        return {'total': len(indexes), 'indexes': apply_queries(indexes, queries)}
+
+    # Documents
+
+    def check_document(self, collection: dict, data: dict, partial: bool = False):
+        """Reject data the server would reject: unknown or unavailable attributes, bad sizes"""
+        attributes = collection['attributes']
+        for key, value in data.items():
+            if key.startswith('$'):
+                continue
+            attribute = attributes.get(key)
+            if attribute is None or self.status(attribute) != 'available':
+                raise AppwriteException(f'Invalid document structure: Unknown attribute: "{key}"', 400,
+                                        'document_invalid_structure')
+            if value is None:
+                if attribute['required']:
+                    raise AppwriteException(f'Invalid document structure: Missing required attribute "{key}"',
+                                            400, 'document_invalid_structure')
+                continue
+            if attribute['type'] == 'string' and len(str(value)) > attribute['size']:
+                raise AppwriteException(f'Invalid document structure: Attribute "{key}" has invalid type. '
+                                        f'Value must be a valid string and no longer than {attribute["size"]} '
+                                        f'chars', 400, 'document_invalid_structure')
+        if not partial:
+            for key, attribute in attributes.items():
+                if attribute['required'] and data.get(key) is None:
+                    raise AppwriteException(f'Invalid document structure: Missing required attribute "{key}"',
+                                            400, 'document_invalid_structure')
+
+    def put_document(self, database_id: str, collection_id: str, document_id: str, data: dict,
+                     permissions: list = None, mode: str = 'create') -> dict:
+        """Create, update or upsert one document; call with the lock held"""
+        collection = self.get_collection_state(database_id, collection_id)
+        documents = collection['documents']
+        if document_id == 'unique()':
+            document_id = uuid.uuid4().hex[:20]
+        existing = documents.get(document_id)
+
+        if mode == 'create' and existing is not None:
+            raise AppwriteException("Document with the requested ID already exists", 409,
+                                    'document_already_exists')
+        if mode == 'update' and existing is None:
+            raise AppwriteException("Document with the requested ID could not be found", 404,
+                                    'document_not_found')
+
+        if existing is None:
+            self.check_document(collection, data)
+            now = timestamp()
+            defaults = {key: a['default'] for key, a in collection['attributes'].items() if a['default'] is not None}
+            document = {'$id': document_id, '$collectionId': collection_id, '$databaseId': database_id,
+                        '$createdAt': now, '$updatedAt': now, '$permissions': list(permissions or []),
+                        **defaults}
+        else:
+            self.check_document(collection, data, partial=True)
+            document = dict(existing)
+            document['$updatedAt'] = timestamp()
+            if permissions is not None:
+                document['$permissions'] = list(permissions)
+
+        document.update({key: value for key, value in data.items() if not key.startswith('$')})
+        documents[document_id] = document
+        collection['lookups'] = {}
+        return dict(document)
+
+    def create_document(self, database_id: str, collection_id: str, document_id: str, data: dict,
+                        permissions: list = None, **kwargs):
+        self.call('create_document')
+        with self.lock:
+            return self.put_document(database_id, collection_id, document_id, data, permissions, 'create')
+
+    def update_document(self, database_id: str, collection_id: str, document_id: str, data: dict = None,
+                        permissions: list = None, **kwargs):
+        self.call('update_document')
+        with self.lock:
+            return self.put_document(database_id, collection_id, document_id, data or {}, permissions, 'update')
+
+    def upsert_document(self, database_id: str, collection_id: str, document_id: str, data: dict = None,
+                        permissions: list = None, **kwargs):
+        self.call('upsert_document')
+        with self.lock:
+            return self.put_document(database_id, collection_id, document_id, data or {}, permissions, 'upsert')
+
+    def get_document(self, database_id: str, collection_id: str, document_id: str, queries: list = None,
+                     **kwargs):
+        self.call('get_document')
+        with self.lock:
+            document = self.get_collection_state(database_id, collection_id)['documents'].get(document_id)
+            if document is None:
+                raise AppwriteException("Document with the requested ID could not be found", 404,
+                                        'document_not_found')
+            return apply_queries([dict(document)], queries)[0]
+
+    def list_documents(self, database_id: str, collection_id: str, queries: list = None, **kwargs):
+        self.call('list_documents')
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            indexes = [i for i in collection['indexes'].values() if self.status(i) == 'available']
+            index, used, _ = choose_index(indexes, queries)
+            documents = self.index_lookup(collection, index, used)
+        matched = filter_documents(documents, queries)
+        if self.scan_cost:
+            plan = query_plan(documents, [index] if index else [], queries, len(matched))
+            time.sleep(self.scan_cost * plan['examined'])
+        return {'total': len(matched), 'documents': [dict(d) for d in apply_queries(matched, queries)]}
+
+    @staticmethod
+    def index_lookup(collection: dict, index: dict, used: list) -> list:
+        """
+        Documents a query can touch through an index; call with the lock held.
+
+        Equality filters on the index's leading attributes are answered
+        from a hash of those attributes, built on first use and dropped on
+        every write. Without such filters this is every document.
+        """
+        equal = {}
+        for attribute in (index['attributes'] if index else []):
+            values = [q['values'] for q in used if q.get('attribute') == attribute and q['method'] == 'equal']
+            if not values:
+                break
+            equal[attribute] = values[0]
+        if not equal:
+            return list(collection['documents'].values())
+
+        attributes = tuple(equal)
+        lookup = collection['lookups'].get(attributes)
+        if lookup is None:
+            lookup = collection['lookups'][attributes] = {}
+            for document in collection['documents'].values():
+                lookup.setdefault(tuple(document.get(a) for a in attributes), []).append(document)
+        return [document for values in itertools.product(*equal.values()) for document in lookup.get(values, [])]
+
+    def explain(self, database_id: str, collection_id: str, queries: list = None) -> dict:
+        """How list_documents would run a query: index used and documents examined (not a real API)"""
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            documents = list(collection['documents'].values())
+            indexes = [i for i in collection['indexes'].values() if self.status(i) == 'available']
+        return query_plan(documents, indexes, queries, len(filter_documents(documents, queries)))
+
+    def delete_document(self, database_id: str, collection_id: str, document_id: str, **kwargs):
+        self.call('delete_document')
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            documents = collection['documents']
+            if documents.pop(document_id, None) is None:
+                raise AppwriteException("Document with the requested ID could not be found", 404,
+                                        'document_not_found')
+            collection['lookups'] = {}
+            return {}
+
+    def bulk_put(self, method: str, mode: str, database_id: str, collection_id: str, documents: list) -> dict:
+        self.call(method)
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            # All or nothing, like the server's transaction
+            backup = dict(collection['documents'])
+            try:
+                written = [self.put_document(database_id, collection_id, document.get('$id', 'unique()'),
+                                             document, document.get('$permissions'), mode)
+                           for document in documents]
+            except AppwriteException:
+                collection['documents'] = backup
+                collection['lookups'] = {}
+                raise
+        return {'total': len(written), 'documents': written}
+
+    def create_documents(self, database_id: str, collection_id: str, documents: list, **kwargs):
+        return self.bulk_put('create_documents', 'create', database_id, collection_id, documents)
+
+    def upsert_documents(self, database_id: str, collection_id: str, documents: list, **kwargs):
+        return self.bulk_put('upsert_documents', 'upsert', database_id, collection_id, documents)
+
+    def delete_documents(self, database_id: str, collection_id: str, queries: list = None, **kwargs):
+        self.call('delete_documents')
+        with self.lock:
+            collection = self.get_collection_state(database_id, collection_id)
+            documents = collection['documents']
+            deleted = filter_documents(list(documents.values()), queries)
+            for document in deleted:
+                del documents[document['$id']]
+            collection['lookups'] = {}
+        return {'total': len(deleted), 'documents': deleted}
+
+
+def parse_queries(queries: list) -> list:
+    return [json.loads(query) if isinstance(query, str) else query for query in queries or []]
+
+
+def query_matches(document: dict, query: dict) -> bool:
+    method = query['method']
+    values = query.get('values', [])
+    value = document.get(query.get('attribute'))
+
+    if method == 'equal':
+        return value in values
+    if method == 'notEqual':
+        return value not in values
+    if method == 'isNull':
+        return value is None
+    if method == 'isNotNull':
+        return value is not None
+    if method == 'search':
+        # Fulltext approximation: every search word is a word prefix
+        words = str(value or '').lower().split()
+        return all(any(word.startswith(term) for word in words) for term in str(values[0]).lower().split())
+    if method == 'startsWith':
+        return str(value or '').startswith(values[0])
+    if value is None:
+        return False
+    if method == 'lessThan':
+        return value < values[0]
+    if method == 'lessThanEqual':
+        return value <= values[0]
+    if method == 'greaterThan':
+        return value > values[0]
+    if method == 'greaterThanEqual':
+        return value >= values[0]
+    if method == 'between':
+        return values[0] <= value <= values[1]
+    raise AppwriteException(f"Query method not supported by the fake: {method}", 400, 'general_query_invalid')
+
+
+PAGING_METHODS = {'limit', 'offset', 'cursorAfter', 'cursorBefore', 'select', 'orderAsc', 'orderDesc'}
+RANGE_METHODS = {'lessThan', 'lessThanEqual', 'greaterThan', 'greaterThanEqual', 'between', 'startsWith'}
+
+
+def index_usage(index: dict, filters: list, order_attribute: str = None) -> tuple:
+    """
+    (filters the index narrows on, whether it serves the sort) for a key/unique index.
+
+    Like a B-tree: equality filters on a prefix of the index attributes,
+    then at most one range filter or the sort attribute.
+    """
+    used = []
+    for attribute in index['attributes']:
+        equal = [q for q in filters if q.get('attribute') == attribute and q['method'] == 'equal']
+        if equal:
+            used.extend(equal)
+            continue
+        ranged = [q for q in filters if q.get('attribute') == attribute and q['method'] in RANGE_METHODS]
+        used.extend(ranged)
+        return used, attribute == order_attribute
+    return used, order_attribute is None
+
+
+def choose_index(indexes: list, queries: list) -> tuple:
+    """(index, filters it narrows on, whether it serves the sort) for the index that narrows most"""
+    queries = parse_queries(queries)
+    filters = [q for q in queries if q['method'] not in PAGING_METHODS]
+    orders = [q for q in queries if q['method'] in ('orderAsc', 'orderDesc')]
+    order_attribute = orders[0].get('attribute') if orders else None
+
+    best, best_used, best_sorted = None, [], False
+    for index in indexes:
+        if index['type'] not in ('key', 'unique'):
+            continue
+        used, sorted_by_index = index_usage(index, filters, order_attribute)
+        if (len(used), sorted_by_index) > (len(best_used), best_sorted) and (used or sorted_by_index):
+            best, best_used, best_sorted = index, used, sorted_by_index
+    return best, best_used, best_sorted
+
+
+def query_plan(documents: list, indexes: list, queries: list, matched: int) -> dict:
+    """Pick the index that narrows a query most and count the documents it examines"""
+    queries = parse_queries(queries)
+    filters = [q for q in queries if q['method'] not in PAGING_METHODS]
+    orders = [q for q in queries if q['method'] in ('orderAsc', 'orderDesc')]
+
+    best, best_used, best_sorted = choose_index(indexes, queries)
+    examined = len(filter_documents(documents, best_used)) if best_used else len(documents)
+    if best is not None and (best_sorted or not orders) and len(best_used) == len(filters) and len(orders) <= 1:
+        # Every filter is answered in index order: stop after offset + limit
+        limits = {q['method']: q['values'][0] for q in queries if q['method'] in ('limit', 'offset')}
+        examined = min(examined, limits.get('offset', 0) + limits.get('limit', 25))
+    elif orders:
+        examined += matched  # Sorting the matches
+    return {'index': best['key'] if best else None, 'examined': examined, 'matched': matched,
+            'sorted_by_index': best_sorted}
+
+
+def filter_documents(documents: list, queries: list) -> list:
+    """Apply the filter queries (everything except paging, ordering and select)"""
+    filters = [q for q in parse_queries(queries) if q['method'] not in PAGING_METHODS]
+    return [d for d in documents if all(query_matches(d, q) for q in filters)]
+
+
+def apply_queries(items: list, queries: list) -> list:
+    """Apply ordering, cursor, offset, limit and select to an already filtered list"""
+    queries = parse_queries(queries)
+    limit, offset, select = 25, 0, None
+
+    for query in queries:
+        method = query['method']
+        if method in ('orderAsc', 'orderDesc'):
+            attribute = query.get('attribute') or '$id'
+            items = sorted(items, key=lambda item: (item.get(attribute) is None, item.get(attribute)),
+                           reverse=method == 'orderDesc')
+
+    for query in queries:
+        method = query['method']
+        if method == 'limit':
+            limit = query['values'][0]
+        elif method == 'offset':
+            offset = query['values'][0]
+        elif method == 'select':
+            select = query['values']
+        elif method == 'cursorAfter':
+            ids = [item.get('$id') for item in items]
+            if query['values'][0] not in ids:
+                raise AppwriteException("Document for cursor not found", 400, 'general_cursor_not_found')
+            items = items[ids.index(query['values'][0]) + 1:]
+
+    items = items[offset:offset + limit]
+    if select is not None and '*' not in select:
+        keep = set(select) | {'$id', '$collectionId', '$databaseId'}
+        items = [{key: value for key, value in item.items() if key in keep} for item in items]
+    return items
@@ -0,0 +1,139 @@
+"""
+Pooled HTTP transport for the Appwrite client.
+
+appwrite.client.Client sends every request through requests.request(),
+which opens a new connection (TCP and TLS handshake) per call. PooledClient
+keeps a requests.Session with a sized connection pool instead, so the
+hundreds of small create_* and document calls of a setup or seed run
+reuse keep-alive connections. With http2=True and httpx (with h2)
+installed, requests are multiplexed over HTTP/2 instead; without httpx it
+falls back to the pooled HTTP/1.1 session.
+
+Only JSON calls go through the pool (everything the Databases service
+sends); multipart uploads are left to the stock Client. Concurrent setup
+modes share one PooledClient across their worker threads.
+
+Usage:
+    client = PooledClient(pool_size=32)
+    client.set_endpoint(endpoint).set_project(project_id).set_key(api_key)
+    databases = Databases(client)
+"""
+
+import json
+import sys
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from appwrite.client import Client
+from appwrite.exception import AppwriteException
+
+try:
+    from appwrite.encoders.value_class_encoder import ValueClassEncoder
+except ImportError:  # Older SDKs send plain JSON
+    ValueClassEncoder = json.JSONEncoder
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class PooledClient(Client):
+    """Appwrite Client that reuses keep-alive connections (optionally over HTTP/2)"""
+
+    def __init__(self, pool_size: int = 32, http2: bool = False, timeout: float = 60.0):
+        super().__init__()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http2 = False
+        self.httpx_client = None
+
+        if http2:
+            if httpx is None:
+                print("Warning: http2 requested but httpx is not installed; using HTTP/1.1 keep-alive",
+                      file=sys.stderr)
+            else:
+                try:
+                    self.httpx_client = httpx.Client(
+                        http2=True,
+                        timeout=timeout,
+                        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                    )
+                    self.http2 = True
+                except ImportError:  # httpx without the h2 extra
+                    print("Warning: http2 requested but h2 is not installed; using HTTP/1.1 keep-alive",
+                          file=sys.stderr)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def set_self_signed(self, status=True):
+        # httpx fixes certificate verification when the client is created
+        if self.httpx_client is not None and status:
+            self.httpx_client.close()
+            self.httpx_client = httpx.Client(http2=True, timeout=self.timeout, verify=False,
+                                             limits=httpx.Limits(max_connections=self.pool_size,
+                                                                 max_keepalive_connections=self.pool_size))
+        return super().set_self_signed(status)
+
+    def call(self, method, path='', headers=None, params=None, response_type='json'):
+        merged_headers = {**self._global_headers, **(headers or {})}
+        params = params or {}
+
+        if method != 'get' and not merged_headers.get('content-type', '').startswith('application/json'):
+            # File uploads: leave multipart encoding to the stock client
+            return super().call(method, path, headers, params, response_type)
+
+        query = {}
+        body = None
+        if method == 'get':
+            query = self.flatten(params)
+        else:
+            body = json.dumps(params, cls=ValueClassEncoder)
+
+        response = self.send(method, self._endpoint + path, query, body, merged_headers,
+                             follow_redirects=response_type != 'location')
+
+        if response.status_code >= 400:
+            raise self.error_from(response)
+
+        warnings = response.headers.get('x-appwrite-warning')
+        if warnings:
+            for warning in warnings.split(';'):
+                print(f'Warning: {warning}', file=sys.stderr)
+
+        if response_type == 'location':
+            return response.headers.get('Location')
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            return response.json()
+        return response.content
+
+    def send(self, method: str, url: str, query: dict, body, headers: dict, follow_redirects: bool = True):
+        """One request over the pool"""
+        try:
+            if self.httpx_client is not None:
+                return self.httpx_client.request(method, url, params=query, content=body, headers=headers,
+                                                 follow_redirects=follow_redirects)
+            return self.session.request(method, url, params=query, data=body, headers=headers,
+                                        timeout=self.timeout, verify=not self._self_signed,
+                                        allow_redirects=follow_redirects)
+        except Exception as e:
+            raise AppwriteException(str(e))
+
+    @staticmethod
+    def error_from(response) -> AppwriteException:
+        """AppwriteException with the same fields the stock client sets"""
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            payload = response.json()
+            return AppwriteException(payload.get('message'), response.status_code, payload.get('type'),
+                                     response.text)
+        return AppwriteException(response.text, response.status_code, None, response.text)
+
+    def close(self):
+        self.session.close()
+        if self.httpx_client is not None:
+            self.httpx_client.close()
+
@@ -0,0 +1,390 @@
+"""
+Index advisor driven by a recorded query workload.
+
+Reads a log of executed list_documents calls, loads a synthetic dataset
+(SyntheticDataGenerator, plus config-shaped rows for collections it does
+not generate) into FakeDatabases and recommends indexes for the queries
+that actually run:
+
+- a composite index per query shape (equality attributes, most
+  selective first, then the sort or range attribute, whichever examines
+  fewer documents on the dataset) when it beats the existing indexes
+- fulltext indexes for search queries that have none
+- redundant indexes: a key index whose attributes are a prefix of
+  another index on the same collection
+- unused indexes: key indexes no logged query would use (only for
+  collections that appear in the workload)
+
+The plan is JSON that DevelopmentDatabaseSetup.apply_index_plan() (or
+the index_plan body flag) applies. Deployed next to the setup function
+as index_plan.json it also patches the collections config, so later
+setups and resets keep the plan's indexes instead of restoring the
+dropped ones. Query latency is measured on the
+fake before and after the plan with a per-document scan cost, so the
+numbers reflect documents examined rather than the network.
+
+Workload log, one line per executed query (queries as passed to
+list_documents, count = how often it ran):
+    {"collection_id": "prescriptions", "queries": ["{\\"method\\":\\"equal\\",...}"], "count": 120}
+
+Usage:
+    python example_index_advisor.py workload.jsonl --clinics 20 --out index_plan.json
+    python example_index_advisor.py workload.jsonl --drop-unused
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+
+from example_dev_set_up import DevelopmentDatabaseSetup, BatchedDocumentWriter, iter_documents
+from example_fake_databases import FakeDatabases, RANGE_METHODS, filter_documents, parse_queries, query_plan
+from example_setup_benchmark import QuietContext
+from example_synthetic_data import SyntheticDataGenerator
+
+
+MAX_INDEX_KEY_LENGTH = 36
+MIN_IMPROVEMENT = 0.8  # Recommend only when examined documents drop below 80%
+DEFAULT_SCAN_COST = 0.00001  # Seconds per examined document on the benchmark backend
+
+
+def load_workload(path: str) -> list:
+    """Read the query log into [{'collection_id', 'queries', 'count'}]"""
+    workload = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                workload.append({
+                    'collection_id': entry['collection_id'],
+                    'queries': parse_queries(entry.get('queries')),
+                    'count': int(entry.get('count', 1)),
+                })
+    return workload
+
+
+def query_shape(queries: list) -> tuple:
+    """(equality attributes, range attributes, sort attribute, search attributes) of a query"""
+    equal, ranged, search, order = set(), [], set(), None
+    for query in queries:
+        method, attribute = query['method'], query.get('attribute')
+        if method == 'equal':
+            equal.add(attribute)
+        elif method in RANGE_METHODS:
+            if attribute not in ranged:
+                ranged.append(attribute)
+        elif method == 'search':
+            search.add(attribute)
+        elif method in ('orderAsc', 'orderDesc') and order is None:
+            order = attribute
+    return tuple(sorted(equal)), tuple(ranged), order, tuple(sorted(search))
+
+
+def index_key(attributes: list, taken: set) -> str:
+    """idx_<attributes>, shortened and made unique within the collection"""
+    key = 'idx_' + '_'.join(attributes)
+    key = key[:MAX_INDEX_KEY_LENGTH]
+    suffix = 2
+    while key in taken:
+        key = f"{key[:MAX_INDEX_KEY_LENGTH - len(str(suffix)) - 1]}_{suffix}"
+        suffix += 1
+    return key
+
+
+class IndexAdvisor:
+    """Recommend indexes for a workload from the documents of each collection"""
+
+    def __init__(self, collections_config: list, documents: dict):
+        self.config = {info['id']: info for info in collections_config}
+        self.documents = documents  # collection id -> [document]
+        self.distinct = {}
+
+    def selectivity(self, collection_id: str, attribute: str) -> int:
+        """Distinct values of an attribute (more = more selective)"""
+        if (collection_id, attribute) not in self.distinct:
+            values = {document.get(attribute) for document in self.documents.get(collection_id, [])}
+            self.distinct[(collection_id, attribute)] = len(values)
+        return self.distinct[(collection_id, attribute)]
+
+    def cost(self, collection_id: str, indexes: list, entries: list) -> int:
+        """Documents examined by the entries' queries (weighted by count) with these indexes"""
+        documents = self.documents.get(collection_id, [])
+        total = 0
+        for entry in entries:
+            matched = len(filter_documents(documents, entry['queries']))
+            total += query_plan(documents, indexes, entry['queries'], matched)['examined'] * entry['count']
+        return total
+
+    def candidates(self, collection_id: str, shape: tuple) -> list:
+        """Attribute lists worth trying for one query shape"""
+        equal, ranged, order, _ = shape
+        prefix = sorted(equal, key=lambda a: (-self.selectivity(collection_id, a), a))
+        options = []
+        if order and order not in prefix:
+            options.append(prefix + [order])
+        for attribute in ranged:
+            if attribute not in prefix:
+                options.append(prefix + [attribute])
+        if prefix:
+            options.append(prefix)
+        return options
+
+    def recommend(self, workload: list, drop_unused: bool = False) -> dict:
+        """Build the index plan for a workload"""
+        plan = {'create': [], 'drop': [], 'unused': [], 'shapes': []}
+        by_collection = {}
+        for entry in workload:
+            if entry['collection_id'] not in self.config:
+                raise ValueError(f"Unknown collection in workload: {entry['collection_id']}")
+            by_collection.setdefault(entry['collection_id'], []).append(entry)
+
+        for collection_id, entries in by_collection.items():
+            existing = [{'key': index['key'], 'type': index['index_type'], 'attributes': index['attributes']}
+                        for index in self.config[collection_id].get('indexes', [])]
+            created = []
+
+            shapes = {}
+            for entry in entries:
+                shapes.setdefault(query_shape(entry['queries']), []).append(entry)
+
+            # Most frequent shapes first, so their indexes win when merging
+            for shape, shape_entries in sorted(shapes.items(), key=lambda item: -sum(e['count'] for e in item[1])):
+                self.recommend_search(collection_id, shape, existing + created, created)
+
+                current = self.cost(collection_id, existing + created, shape_entries)
+                best, best_cost = None, current
+                for attributes in self.candidates(collection_id, shape):
+                    index = {'key': '', 'type': 'key', 'attributes': attributes}
+                    cost = self.cost(collection_id, existing + created + [index], shape_entries)
+                    if cost < best_cost:
+                        best, best_cost = attributes, cost
+
+                plan['shapes'].append({
+                    'collection_id': collection_id,
+                    'equal': list(shape[0]), 'range': list(shape[1]), 'order': shape[2],
+                    'count': sum(e['count'] for e in shape_entries),
+                    'examined_before': current,
+                    'examined_after': best_cost if best and best_cost < current * MIN_IMPROVEMENT else current,
+                })
+                if best is None or best_cost >= current * MIN_IMPROVEMENT:
+                    continue
+
+                # A recommended key index that is a prefix of this one becomes redundant
+                created = [index for index in created
+                           if index['type'] != 'key' or index['attributes'] != best[:len(index['attributes'])]]
+                taken = {index['key'] for index in existing + created}
+                created.append({'key': index_key(best, taken), 'type': 'key', 'attributes': best,
+                                'reason': f"{' + '.join(best)} for {sum(e['count'] for e in shape_entries)} queries"})
+
+            final = existing + created
+            dropped = {index['key'] for index in self.redundant(collection_id, existing, final, plan)}
+
+            # Which remaining key indexes does any logged query use?
+            remaining = [index for index in final if index['key'] not in dropped]
+            documents = self.documents.get(collection_id, [])
+            used = {query_plan(documents, remaining, entry['queries'], 0)['index'] for entry in entries}
+            for index in existing:
+                if index['type'] == 'key' and index['key'] not in dropped and index['key'] not in used:
+                    plan['unused'].append({'collection_id': collection_id, 'key': index['key']})
+                    if drop_unused:
+                        plan['drop'].append({'collection_id': collection_id, 'key': index['key'],
+                                             'reason': 'unused by the workload'})
+
+            for index in created:
+                plan['create'].append({'collection_id': collection_id, 'key': index['key'],
+                                       'index_type': index['type'], 'attributes': index['attributes'],
+                                       'reason': index['reason']})
+        return plan
+
+    def recommend_search(self, collection_id: str, shape: tuple, indexes: list, created: list):
+        """Search queries need a fulltext index on their attribute"""
+        for attribute in shape[3]:
+            if not any(index['type'] == 'fulltext' and index['attributes'] == [attribute] for index in indexes):
+                taken = {index['key'] for index in indexes}
+                created.append({'key': index_key([attribute, 'search'], taken), 'type': 'fulltext',
+                                'attributes': [attribute], 'reason': f"search on {attribute}"})
+
+    @staticmethod
+    def redundant(collection_id: str, existing: list, final: list, plan: dict) -> list:
+        """Existing key indexes covered by a longer index with the same leading attributes"""
+        redundant = []
+        for index in existing:
+            if index['type'] != 'key':
+                continue  # Unique indexes are constraints, fulltext serves search
+            for other in final:
+                if other is index or other['type'] == 'fulltext' or other in redundant:
+                    continue
+                if other['attributes'][:len(index['attributes'])] == index['attributes']:
+                    redundant.append(index)
+                    plan['drop'].append({'collection_id': collection_id, 'key': index['key'],
+                                         'reason': f"prefix of {other['key']}"})
+                    break
+        return redundant
+
+
+def equality_attributes(workload: list) -> set:
+    return {q['attribute'] for entry in workload for q in entry['queries'] if q['method'] == 'equal'}
+
+
+def remap_workload(workload: list, values: dict, seed: int) -> list:
+    """
+    The workload with logged equality values replaced by generated ones.
+
+    Real ids (clinic_id=clinic_0001) never occur in the synthetic data, so
+    every distinct logged value of an attribute is mapped to a distinct
+    generated value of that attribute (the same one in every collection,
+    so joins stay consistent); values the data already has are kept.
+    """
+    rng = random.Random(seed)
+    mapping = {}
+    for attribute in equality_attributes(workload):
+        pool = sorted(values.get(attribute, ()), key=repr)
+        if not pool:
+            continue
+        logged = sorted({v for entry in workload for q in entry['queries']
+                         if q['method'] == 'equal' and q.get('attribute') == attribute for v in q['values']}, key=repr)
+        unused = [value for value in pool if value not in logged]
+        rng.shuffle(unused)
+        replacements = itertools.cycle(unused or pool)
+        mapping[attribute] = {value: value if value in values[attribute] else next(replacements)
+                              for value in logged}
+
+    return [{**entry, 'queries': [
+        {**q, 'values': [mapping[q['attribute']].get(v, v) for v in q['values']]}
+        if q['method'] == 'equal' and q.get('attribute') in mapping else q
+        for q in entry['queries']]} for entry in workload]
+
+
+def load_dataset(databases: FakeDatabases, workload: list, clinics: int, rows: int, seed: int) -> tuple:
+    """
+    Provision the schema on the fake and fill it with synthetic documents.
+
+    Logged equality values are remapped onto generated values (see
+    remap_workload), so the queries match realistic fractions of every
+    collection. Collections the generator does not cover get
+    config-shaped rows whose filtered attributes take those values.
+
+    Returns:
+        (collection id -> documents, remapped workload)
+    """
+    setup = DevelopmentDatabaseSetup(QuietContext(), databases=databases)
+    if not setup.execute_complete_setup(concurrency=4)['success']:
+        raise RuntimeError(f"Setup on the fake failed: {setup.context.errors[:3]}")
+
+    generator = SyntheticDataGenerator(seed=seed, patients_per_clinic=50, prescriptions_per_patient=5)
+    writer = BatchedDocumentWriter(databases, setup.database_id, batch_size=500, workers=4)
+    wanted = {entry['collection_id'] for entry in workload}
+    keys = {'clinic_id', 'user_id', 'patient_id', 'prescription_id'} | equality_attributes(workload)
+    values = {}
+    generated = set()
+    for clinic_index in range(clinics):
+        for collection_id, document_id, data in generator.generate_clinic(clinic_index):
+            generated.add(collection_id)
+            if collection_id in wanted:
+                writer.add(collection_id, document_id, data)
+            for key in keys:
+                if key in data and not isinstance(data[key], (list, dict)):
+                    values.setdefault(key, set()).add(data[key])
+
+    workload = remap_workload(workload, values, seed)
+    rng = random.Random(seed)
+    for collection_id in wanted - generated:
+        for attribute in {q.get('attribute') for e in workload if e['collection_id'] == collection_id
+                          for q in e['queries'] if q['method'] == 'equal'}:
+            seen = {v for e in workload if e['collection_id'] == collection_id for q in e['queries']
+                    if q.get('attribute') == attribute and q['method'] == 'equal' for v in q['values']}
+            values[attribute] = values.get(attribute, set()) | seen
+        pools = {key: sorted(pool) for key, pool in values.items()}
+        attributes = {attr['key'] for attr in generator.config[collection_id]['attributes']}
+        for i in range(rows):
+            overrides = {key: rng.choice(pool) for key, pool in pools.items() if key in attributes and pool}
+            writer.add(collection_id, f"adv_{i:08d}", generator.document(rng, collection_id, overrides))
+
+    stats = writer.close()
+    if stats['failed']:
+        raise RuntimeError(f"Loading the dataset failed: {stats['errors'][:3]}")
+
+    documents = {collection_id: list(iter_documents(databases, setup.database_id, collection_id, page_size=5000))
+                 for collection_id in wanted}
+    return documents, workload
+
+
+def measure(databases: FakeDatabases, workload: list, database_id: str = 'eprescription_dev') -> dict:
+    """Latency of every logged query on the fake; summary weighted by count"""
+    samples = []
+    per_collection = {}
+    for entry in workload:
+        queries = [json.dumps(q) for q in entry['queries']]
+        started = time.perf_counter()
+        databases.list_documents(database_id=database_id, collection_id=entry['collection_id'], queries=queries)
+        seconds = time.perf_counter() - started
+        examined = databases.explain(database_id, entry['collection_id'], queries)['examined']
+        samples.extend([seconds] * entry['count'])
+        stats = per_collection.setdefault(entry['collection_id'], {'queries': 0, 'seconds': 0.0, 'examined': 0})
+        stats['queries'] += entry['count']
+        stats['seconds'] += seconds * entry['count']
+        stats['examined'] += examined * entry['count']
+
+    samples.sort()
+
+    def ms(seconds):
+        return round(seconds * 1000, 2)
+
+    return {
+        'queries': len(samples),
+        'mean_ms': ms(sum(samples) / len(samples)) if samples else 0.0,
+        'p50_ms': ms(samples[len(samples) // 2]) if samples else 0.0,
+        'p95_ms': ms(samples[min(len(samples) - 1, int(len(samples) * 0.95))]) if samples else 0.0,
+        'collections': {collection_id: {'mean_ms': ms(stats['seconds'] / stats['queries']),
+                                        'examined_per_query': round(stats['examined'] / stats['queries'], 1)}
+                        for collection_id, stats in per_collection.items()},
+    }
+
+
+def run(options: argparse.Namespace) -> dict:
+    workload = load_workload(options.workload)
+    databases = FakeDatabases(attribute_delay=0.0, seed=options.seed)
+    documents, workload = load_dataset(databases, workload, options.clinics, options.rows, options.seed)
+
+    advisor = IndexAdvisor(DevelopmentDatabaseSetup.get_collections_config(), documents)
+    plan = advisor.recommend(workload, options.drop_unused)
+
+    databases.scan_cost = options.scan_cost
+    before = measure(databases, workload)
+    setup = DevelopmentDatabaseSetup(QuietContext(), databases=databases)
+    applied = setup.apply_index_plan(plan)
+    after = measure(databases, workload)
+
+    return {
+        'dataset': {collection_id: len(docs) for collection_id, docs in documents.items()},
+        'plan': plan,
+        'applied': applied,
+        'before': before,
+        'after': after,
+        'speedup': round(before['mean_ms'] / after['mean_ms'], 2) if after['mean_ms'] else None,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Recommend indexes for a recorded query workload')
+    parser.add_argument('workload', help='JSONL query log')
+    parser.add_argument('--clinics', type=int, default=20, help='Synthetic clinics to generate')
+    parser.add_argument('--rows', type=int, default=5000,
+                        help='Rows for workload collections the generator does not cover')
+    parser.add_argument('--scan-cost', type=float, default=DEFAULT_SCAN_COST,
+                        help='Seconds per examined document on the benchmark backend')
+    parser.add_argument('--drop-unused', action='store_true', help='Also drop indexes the workload never uses')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='Write the index plan to this file')
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    report = run(options)
+    if options.out:
+        with open(options.out, 'w') as f:
+            json.dump({key: report['plan'][key] for key in ('create', 'drop')}, f, indent=2)
+            f.write('\n')
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,689 @@
+"""
+Local prefix/fuzzy search index over nhs_medicines names.
+
+The index is built once from nhs_medicines rows and written to a compact
+snapshot file tagged with the dm+d release_id. Workers open the snapshot
+with mmap: sections are read in place through memoryviews, so a cold
+start is a file open plus a header parse, with no rebuild.
+
+Search is as-you-type: every query token is matched as a prefix of a
+word in the product name. Each word contributes its prefixes of up to
+PREFIX_LENGTH characters as keys; a key's posting list holds document
+numbers in rank order (VMPs, then AMPs, then VTMs, shorter names first),
+so a query scans the most selective posting list from the start and
+stops as soon as it has enough matches. When prefixes find too little,
+tokens are corrected against the name vocabulary through a deletion
+neighbourhood: every word prefix of up to FUZZY_PREFIX_LENGTH characters
+is stored under each string left after deleting up to two of its
+characters, in a hash table in the snapshot. Prefixes within the edit
+limit of a token share such a string with it, so a correction is a few
+dozen hash lookups plus an edit distance for the prefixes they return.
+Results can be filtered by type, prescribable and controlled_drug.
+
+The latency target (bench --max-p99-ms, 1 ms by default) covers queries
+whose tokens are all known prefixes. Typo-corrected queries run a search
+per correction and are reported separately by bench, outside the target.
+
+Usage:
+    python example_medicine_index.py build --from-database --out medicines.idx
+    python example_medicine_index.py build --from-release nhsbsa_dmd_3.4.0_20251103000001.zip --out medicines.idx
+    python example_medicine_index.py search medicines.idx "amox 500" --type VMP --prescribable
+    python example_medicine_index.py bench medicines.idx --max-p99-ms 1
+"""
+
+import argparse
+import json
+import mmap
+import random
+import re
+import struct
+import sys
+import time
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left, insort
+
+MAGIC = b'MEDIDX02'
+PREFIX_LENGTH = 6
+MAX_SCAN = 50000  # Candidates examined per query before giving up
+MAX_FUZZY_WORDS = 8
+FUZZY_PREFIX_LENGTH = 10  # Longest word prefix in the deletion index
+MAX_FUZZY_CANDIDATES = 40  # Distinct word prefixes checked for a token longer than that
+
+TYPE_CODES = {'VTM': 0, 'VMP': 1, 'AMP': 2}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+TYPE_RANK = {'VMP': 0, 'AMP': 1, 'VTM': 2}
+TYPE_MASK = 0b0011
+PRESCRIBABLE_FLAG = 0b0100
+CONTROLLED_FLAG = 0b1000
+
+SECTIONS = [
+    'doc_flags', 'name_offsets', 'names', 'term_offsets', 'terms', 'code_offsets', 'codes',
+    'key_offsets', 'keys', 'posting_offsets', 'postings',
+    'word_offsets', 'words', 'deletion_offsets', 'deletions', 'deletion_posting_offsets', 'deletion_postings',
+    'deletion_slots',
+]
+HEADER = struct.Struct('<8s64sB3xIIII')  # magic, release_id, byte order, docs, keys, words, deletion keys
+SECTION_ENTRY = struct.Struct('<QQ')  # offset, length
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:\.[0-9]+[a-z]*)?')
+
+
+def normalize(text: str) -> str:
+    """Lower-case and strip accents"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def max_edits(length: int) -> int:
+    """Typos tolerated in a token of this length"""
+    return 1 if length < 6 else 2
+
+
+def deletions(word: str, edits: int) -> set:
+    """word and every string left after deleting up to edits of its characters"""
+    variants = frontier = {word}
+    for _ in range(edits):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants = variants | frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int, prefix_slack: int = 0) -> int:
+    """
+    Levenshtein distance, returning limit + 1 once it is exceeded.
+
+    With prefix_slack, the smallest distance between a and the prefixes
+    of b that are up to prefix_slack characters shorter or longer than a
+    (b itself when it is shorter), in a single pass.
+    """
+    if prefix_slack:
+        b = b[:len(a) + prefix_slack]
+        first = min(max(1, len(a) - prefix_slack), len(b))
+    else:
+        first = len(b)
+    if len(a) - len(b) > limit or len(b) - len(a) > limit + prefix_slack:
+        return limit + 1
+    if not a:
+        return first if first <= limit else limit + 1
+
+    # Bit-parallel (Myers/Hyyro): one bit per character of a holds the
+    # vertical deltas of a DP column; score is the distance from a to b[:j]
+    match = {}
+    for i, character in enumerate(a):
+        match[character] = match.get(character, 0) | 1 << i
+    full, high = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    positive, negative, score = full, 0, len(a)
+    best = score if first == 0 else limit + 1
+    for j, character in enumerate(b, 1):
+        equal = match.get(character, 0)
+        diagonal = (((equal & positive) + positive) ^ positive) | equal | negative
+        horizontal_positive = negative | (~(diagonal | positive) & full)
+        horizontal_negative = positive & diagonal
+        if horizontal_positive & high:
+            score += 1
+        elif horizontal_negative & high:
+            score -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(diagonal | horizontal_positive) & full)
+        negative = horizontal_positive & diagonal
+        if j >= first and score < best:
+            best = score
+    return best if best <= limit else limit + 1
+
+
+def build_snapshot(rows, path: str, release_id: str) -> dict:
+    """
+    Build an index snapshot from nhs_medicines rows.
+
+    rows is any iterable of dicts with snomed_code, name, type,
+    prescribable and controlled_drug.
+    """
+    started = time.monotonic()
+    docs = []
+    for row in rows:
+        flags = TYPE_CODES.get(row.get('type'), 3)
+        if row.get('prescribable', True):
+            flags |= PRESCRIBABLE_FLAG
+        if row.get('controlled_drug'):
+            flags |= CONTROLLED_FLAG
+        name = row.get('name') or ''
+        docs.append((TYPE_RANK.get(row.get('type'), 3), len(name), normalize(name), name, row['snomed_code'], flags))
+
+    # Document numbers follow rank order, so posting lists are ranked too
+    docs.sort()
+
+    postings = {}
+    vocabulary = set()
+    for doc_number, (_, _, _, name, _, _) in enumerate(docs):
+        for word in set(tokenize(name)):
+            vocabulary.add(word)
+            for length in range(1, min(len(word), PREFIX_LENGTH) + 1):
+                posting = postings.setdefault(word[:length], [])
+                if not posting or posting[-1] != doc_number:
+                    posting.append(doc_number)
+
+    words = sorted(vocabulary, key=lambda w: w.encode('utf-8'))
+
+    # Deletion neighbourhood of the word prefixes. A prefix is stored as
+    # (number of the first word with it) << 4 | length, under every
+    # deletion variant; a prefix of length n is compared with tokens of
+    # length n - 1 to n + 1, so it gets the edit limit of the longest
+    prefix_ids = {}
+    for word_number, word in enumerate(words):
+        for length in range(2, min(len(word), FUZZY_PREFIX_LENGTH) + 1):
+            prefix_ids.setdefault(word[:length], word_number << 4 | length)
+    deletion_postings = {}
+    for prefix, prefix_id in prefix_ids.items():
+        for variant in deletions(prefix, max_edits(len(prefix) + 1)):
+            deletion_postings.setdefault(variant, []).append(prefix_id)
+
+    keys = sorted(postings, key=lambda k: k.encode('utf-8'))
+    deletion_keys = sorted(deletion_postings, key=lambda k: k.encode('utf-8'))
+
+    # Open-addressing hash table (crc32, linear probing) of key number + 1
+    slots = array('I', [0]) * (1 << max(1, (2 * len(deletion_keys)).bit_length()))
+    for key_number, key in enumerate(deletion_keys):
+        slot = zlib.crc32(key.encode('utf-8')) & (len(slots) - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (len(slots) - 1)
+        slots[slot] = key_number + 1
+
+    def blob(strings):
+        offsets = array('I', [0])
+        data = bytearray()
+        for value in strings:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        return offsets.tobytes(), bytes(data)
+
+    def flatten(lists):
+        offsets = array('I', [0])
+        values = array('I')
+        for values_list in lists:
+            values.extend(values_list)
+            offsets.append(len(values))
+        return offsets.tobytes(), values.tobytes()
+
+    sections = {}
+    sections['doc_flags'] = bytes(doc[5] for doc in docs)
+    sections['name_offsets'], sections['names'] = blob(doc[3] for doc in docs)
+    sections['term_offsets'], sections['terms'] = blob(' ' + ' '.join(tokenize(doc[3])) for doc in docs)
+    sections['code_offsets'], sections['codes'] = blob(str(doc[4]) for doc in docs)
+    sections['key_offsets'], sections['keys'] = blob(keys)
+    sections['posting_offsets'], sections['postings'] = flatten(postings[k] for k in keys)
+    sections['word_offsets'], sections['words'] = blob(words)
+    sections['deletion_offsets'], sections['deletions'] = blob(deletion_keys)
+    sections['deletion_posting_offsets'], sections['deletion_postings'] = flatten(
+        deletion_postings[k] for k in deletion_keys)
+    sections['deletion_slots'] = slots.tobytes()
+
+    header = HEADER.pack(MAGIC, release_id.encode('utf-8')[:64], 0 if sys.byteorder == 'little' else 1,
+                         len(docs), len(keys), len(words), len(deletion_keys))
+    offset = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    table = bytearray()
+    layout = []
+    for name in SECTIONS:
+        offset += -offset % 8  # 8-byte alignment for the typed views
+        table += SECTION_ENTRY.pack(offset, len(sections[name]))
+        layout.append((offset, sections[name]))
+        offset += len(sections[name])
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(table)
+        for section_offset, data in layout:
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(data)
+        size = f.tell()
+
+    return {
+        'release_id': release_id,
+        'documents': len(docs),
+        'prefix_keys': len(keys),
+        'words': len(words),
+        'deletion_keys': len(deletion_keys),
+        'size_mb': round(size / 1024 / 1024, 2),
+        'build_seconds': round(time.monotonic() - started, 2),
+    }
+
+
+class MedicineSearchIndex:
+    """Read-only, memory-mapped view of an index snapshot"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+
+        magic, release_id, byte_order, self.doc_count, self.key_count, self.word_count, self.deletion_count = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            if magic.startswith(MAGIC[:6]):
+                raise ValueError(f"{path} was built by an older version of this module; rebuild it")
+            raise ValueError(f"{path} is not a medicine index snapshot")
+        if byte_order != (0 if sys.byteorder == 'little' else 1):
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+        self.release_id = release_id.rstrip(b'\0').decode('utf-8')
+
+        section = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION_ENTRY.unpack_from(self.map, HEADER.size + i * SECTION_ENTRY.size)
+            section[name] = view[offset:offset + length]
+
+        self.doc_flags = section['doc_flags']
+        self.name_offsets = section['name_offsets'].cast('I')
+        self.names = section['names']
+        self.term_offsets = section['term_offsets'].cast('I')
+        self.terms = section['terms']
+        self.code_offsets = section['code_offsets'].cast('I')
+        self.codes = section['codes']
+        self.key_offsets = section['key_offsets'].cast('I')
+        self.keys = section['keys']
+        self.posting_offsets = section['posting_offsets'].cast('I')
+        self.postings = section['postings'].cast('I')
+        self.word_offsets = section['word_offsets'].cast('I')
+        self.words = section['words']
+        self.deletion_offsets = section['deletion_offsets'].cast('I')
+        self.deletion_keys = section['deletions']
+        self.deletion_posting_offsets = section['deletion_posting_offsets'].cast('I')
+        self.deletion_postings = section['deletion_postings'].cast('I')
+        self.deletion_slots = section['deletion_slots'].cast('I')
+
+        self.type_ranges = {}
+        rank_of = {code: TYPE_RANK.get(name, 3) for name, code in TYPE_CODES.items()}
+        rank = lambda n: rank_of.get(self.doc_flags[n] & TYPE_MASK, 3)
+        for name, value in TYPE_RANK.items():
+            self.type_ranges[name] = (bisect_left(range(self.doc_count), value, key=rank),
+                                      bisect_left(range(self.doc_count), value + 1, key=rank))
+
+    def search(self, query: str, limit: int = 20, type: str = None, prescribable: bool = None,
+               controlled_drug: bool = None, fuzzy: bool = True) -> list:
+        """Products whose name words start with every query token, best ranked first"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        mask, want = 0, 0
+        if prescribable is not None:
+            mask |= PRESCRIBABLE_FLAG
+            want |= PRESCRIBABLE_FLAG if prescribable else 0
+        if controlled_drug is not None:
+            mask |= CONTROLLED_FLAG
+            want |= CONTROLLED_FLAG if controlled_drug else 0
+        # Documents are grouped by type, so a type filter is a document range
+        doc_range = self.type_ranges[type] if type is not None else (0, self.doc_count)
+
+        if all(self.known(token) for token in tokens):
+            return [self.document(n) for n in self.match(tokens, limit, mask, want, doc_range)]
+        if not fuzzy:
+            return []
+
+        doc_numbers = {}  # Ordered set
+        for corrected in self.corrections(tokens):
+            for doc_number in self.match(corrected, limit - len(doc_numbers), mask, want, doc_range):
+                doc_numbers[doc_number] = None
+            if len(doc_numbers) >= limit:
+                break
+        return [self.document(n) for n in list(doc_numbers)[:limit]]
+
+    def match(self, tokens: list, limit: int, mask: int, want: int, doc_range: tuple) -> list:
+        """Leapfrog intersection of the tokens' posting lists, in rank order"""
+        postings = self.postings
+        lists = []
+        for token in tokens:
+            found = self.find(self.key_offsets, self.keys, self.key_count, token[:PREFIX_LENGTH])
+            if found is None:
+                return []
+            start, end = self.posting_offsets[found], self.posting_offsets[found + 1]
+            start = bisect_left(postings, doc_range[0], start, end)
+            end = bisect_left(postings, doc_range[1], start, end)
+            lists.append([end - start, start, end])
+        lists.sort()
+
+        # Keys stop at PREFIX_LENGTH characters; longer tokens are checked
+        # against the document's terms, stored as " word word ..."
+        verify = [(' ' + token).encode('utf-8') for token in tokens if len(token) > PREFIX_LENGTH]
+        doc_flags, term_offsets, terms = self.doc_flags, self.term_offsets, self.terms
+
+        results = []
+        _, position, end = lists[0]
+        others = lists[1:]
+        for _ in range(MAX_SCAN):
+            if position >= end:
+                break
+            doc_number = postings[position]
+            for other in others:
+                other[1] = bisect_left(postings, doc_number, other[1], other[2])
+                if other[1] == other[2]:
+                    return results
+                if postings[other[1]] != doc_number:
+                    # Skip the driver ahead to the other list's next document
+                    position = bisect_left(postings, postings[other[1]], position, end)
+                    break
+            else:
+                position += 1
+                if doc_flags[doc_number] & mask != want:
+                    continue
+                if verify:
+                    doc_terms = terms[term_offsets[doc_number]:term_offsets[doc_number + 1]].tobytes()
+                    if not all(token in doc_terms for token in verify):
+                        continue
+                results.append(doc_number)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def corrections(self, tokens: list):
+        """Yield token lists with one unknown token replaced by close vocabulary words"""
+        for position, token in enumerate(tokens):
+            if len(token) < 3 or self.known(token):
+                continue
+            edits = max_edits(len(token))
+            scored = self.prefix_corrections(token, edits) if len(token) < FUZZY_PREFIX_LENGTH else \
+                self.long_corrections(token, edits)
+            for word, _ in sorted(scored.items(), key=lambda item: (item[1], item[0]))[:MAX_FUZZY_WORDS]:
+                yield tokens[:position] + [word] + tokens[position + 1:]
+
+    def close_prefixes(self, probe: str, edits: int, lengths: range) -> dict:
+        """Vocabulary prefixes of these lengths within edits of probe: prefix id -> (distance, prefix)"""
+        words, word_offsets = self.words, self.word_offsets
+        # A prefix sharing a variant with the probe is within (characters
+        # deleted from the probe) + (characters deleted from the prefix)
+        # edits of it, and no closer than their length difference. When
+        # both sides are the same length and need every allowed deletion,
+        # only substitutions can keep it within edits. Other prefixes need
+        # an edit distance
+        bounds = {}
+        for variant in deletions(probe, edits):
+            for prefix_id in self.deletion_lookup(variant):
+                length = prefix_id & 15
+                if length in lengths and length - len(variant) <= edits:
+                    bound = len(probe) + length - 2 * len(variant)
+                    if bound < bounds.get(prefix_id, edits * 2 + 1):
+                        bounds[prefix_id] = bound
+        found = {}
+        for prefix_id, bound in bounds.items():
+            word_number, length = prefix_id >> 4, prefix_id & 15
+            prefix = str(words[word_offsets[word_number]:word_offsets[word_number] + length], 'utf-8')
+            if bound == abs(length - len(probe)):
+                distance = bound
+            elif bound == 2 * edits and length == len(probe):
+                distance = min(sum(a != b for a, b in zip(probe, prefix)), edits + 1)
+            else:
+                distance = edit_distance(probe, prefix, edits)
+            found[prefix_id] = (distance, prefix)
+        return found
+
+    def prefix_corrections(self, token: str, edits: int) -> dict:
+        """
+        The MAX_FUZZY_WORDS words with a prefix of len(token) - 1 to
+        len(token) + 1 characters closest to the token (shorter words: the
+        whole word), by distance and then word. Words sort after their
+        prefixes, so each distance reads prefixes in order and stops once
+        the words it has sort before the next prefix.
+        """
+        lengths = range(len(token) - edits, len(token) + 2)
+        levels = {}
+        for prefix_id, (distance, prefix) in self.close_prefixes(token, edits, lengths).items():
+            if 0 < distance <= edits:
+                levels.setdefault(distance, []).append((prefix, prefix_id >> 4))
+
+        scored = {}
+        for distance in sorted(levels):
+            wanted = MAX_FUZZY_WORDS - len(scored)
+            found = []
+            for prefix, word_number in sorted(levels[distance]):
+                if len(found) >= wanted and found[wanted - 1] < prefix:
+                    break
+                if len(prefix) < len(token) - 1:
+                    candidates = [word_number] if self.word_length(word_number) == len(prefix) else []
+                else:
+                    candidates = range(word_number, min(word_number + wanted, self.word_count))
+                for number in candidates:
+                    word = self.string(self.word_offsets, self.words, number)
+                    if not word.startswith(prefix):
+                        break
+                    if word not in scored and word not in found:
+                        insort(found, word)
+            for word in found[:wanted]:
+                scored[word] = distance
+            if len(scored) >= MAX_FUZZY_WORDS:
+                break
+        return scored
+
+    def long_corrections(self, token: str, edits: int) -> dict:
+        """
+        Tokens longer than the indexed prefixes: the closest prefixes of its
+        first FUZZY_PREFIX_LENGTH - 2 characters narrow the vocabulary down
+        to a few words, which are compared with the whole token.
+        """
+        probe = token[:FUZZY_PREFIX_LENGTH - 2]
+        lengths = range(len(probe) - edits, len(probe) + edits + 1)
+        distances = {}
+        scored = {}
+        close = sorted(value for value in self.close_prefixes(probe, edits, lengths).values() if value[0] <= edits)
+        for _, prefix in close:
+            first, after = self.word_range(prefix)
+            for number in range(first, after):
+                word = self.string(self.word_offsets, self.words, number)
+                key = word[:len(token) + 1]
+                distance = distances.get(key)
+                if distance is None:
+                    if len(distances) == MAX_FUZZY_CANDIDATES:
+                        return scored
+                    distance = distances[key] = edit_distance(token, key, edits, prefix_slack=1)
+                if 0 < distance <= edits:
+                    scored[word] = distance
+        return scored
+
+    def deletion_lookup(self, variant: str):
+        """Prefix ids stored under a deletion variant (empty when there are none)"""
+        target = variant.encode('utf-8')
+        slots, offsets, keys = self.deletion_slots, self.deletion_offsets, self.deletion_keys
+        mask = len(slots) - 1
+        slot = zlib.crc32(target) & mask
+        while slots[slot]:
+            key_number = slots[slot] - 1
+            if keys[offsets[key_number]:offsets[key_number + 1]] == target:
+                return self.deletion_postings[self.deletion_posting_offsets[key_number]:
+                                              self.deletion_posting_offsets[key_number + 1]]
+            slot = (slot + 1) & mask
+        return ()
+
+    def word_length(self, word_number: int) -> int:
+        return self.word_offsets[word_number + 1] - self.word_offsets[word_number]
+
+    def word_range(self, prefix: str) -> tuple:
+        """Numbers of the vocabulary words starting with prefix, as a range (first, after)"""
+        words, offsets = self.words, self.word_offsets
+        word_bytes = lambda n: words[offsets[n]:offsets[n + 1]].tobytes()
+        target = prefix.encode('utf-8')
+        first = bisect_left(range(self.word_count), target, key=word_bytes)
+        after = bisect_left(range(self.word_count), target + b'\xff', first, key=word_bytes)
+        return first, after
+
+    def known(self, token: str) -> bool:
+        """Whether any vocabulary word starts with the token"""
+        target = token.encode('utf-8')
+        words, offsets = self.words, self.word_offsets
+        i = bisect_left(range(self.word_count), target, key=lambda n: words[offsets[n]:offsets[n + 1]].tobytes())
+        return i < self.word_count and words[offsets[i]:offsets[i + 1]].tobytes().startswith(target)
+
+    def find(self, offsets, blob, count: int, key: str):
+        """Binary search a sorted string table; returns the index or None"""
+        target = key.encode('utf-8')
+        i = bisect_left(range(count), target, key=lambda n: blob[offsets[n]:offsets[n + 1]].tobytes())
+        if i < count and blob[offsets[i]:offsets[i + 1]] == target:
+            return i
+        return None
+
+    @staticmethod
+    def string(offsets, blob, number: int) -> str:
+        return str(blob[offsets[number]:offsets[number + 1]], 'utf-8')
+
+    def name(self, doc_number: int) -> str:
+        return self.string(self.name_offsets, self.names, doc_number)
+
+    def document(self, doc_number: int) -> dict:
+        flags = self.doc_flags[doc_number]
+        return {
+            'snomed_code': self.string(self.code_offsets, self.codes, doc_number),
+            'name': self.name(doc_number),
+            'type': TYPE_NAMES.get(flags & TYPE_MASK),
+            'prescribable': bool(flags & PRESCRIBABLE_FLAG),
+            'controlled_drug': bool(flags & CONTROLLED_FLAG),
+        }
+
+    def close(self):
+        # Views into the map must be released before it can close
+        for value in list(vars(self).values()):
+            if isinstance(value, memoryview):
+                value.release()
+        self.map.close()
+        self.file.close()
+
+
+def benchmark_queries(index: MedicineSearchIndex, count: int = 200, seed: int = 1) -> list:
+    """
+    A fixed mix of (query, filters) drawn from the snapshot's own names:
+    prefixes, several words, full long words and one-edit typos (the
+    fuzzy path), each with and without filters.
+    """
+    rnd = random.Random(seed)
+    filters = [{}, {'type': 'VMP'}, {'prescribable': True, 'controlled_drug': False}, {'controlled_drug': True}]
+    queries = []
+    while len(queries) < count:
+        words = tokenize(index.name(rnd.randrange(index.doc_count)))
+        if not words:
+            continue
+        first = words[0]
+        kind = len(queries) % 4
+        if kind == 0:
+            query = first[:rnd.randint(2, 5)]
+        elif kind == 1:
+            query = ' '.join(words[:3])
+        elif kind == 2:
+            query = ' '.join(words)
+        else:
+            if len(first) < 5:
+                continue
+            i = rnd.randrange(1, len(first) - 1)
+            query = ' '.join([first[:i] + first[i + 1:]] + words[1:2])  # Dropped letter
+        queries.append((query, filters[rnd.randrange(len(filters))]))
+    return queries
+
+
+def run_benchmark(index: MedicineSearchIndex, queries: list, limit: int = 20, runs: int = 3) -> dict:
+    """
+    Search latency over the queries (best of runs per query), in
+    milliseconds. Queries that need typo correction are reported apart
+    under 'fuzzy': the latency target covers the prefix path only.
+    """
+    timings, fuzzy = [], []
+    for query, filters in queries:
+        best = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            index.search(query, limit, **filters)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        corrected = not all(index.known(token) for token in tokenize(query))
+        (fuzzy if corrected else timings).append((best, query, filters))
+
+    report = latency_summary(timings)
+    report['fuzzy'] = latency_summary(fuzzy)
+    return report
+
+
+def latency_summary(timings: list) -> dict:
+    if not timings:
+        return {'queries': 0}
+    ordered = sorted(timings, key=lambda timing: timing[0])
+    percentile = lambda fraction: round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))][0], 3)
+    return {
+        'queries': len(ordered),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1][0], 3),
+        'slowest': [{'query': query, 'filters': filters, 'ms': round(ms, 3)}
+                    for ms, query, filters in reversed(ordered[-5:])],
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Build or query a medicine search index snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build')
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument('--from-database', action='store_true', help='Read nhs_medicines from Appwrite')
+    source.add_argument('--from-release', help='Read a dm+d release zip directly')
+    build.add_argument('--database', default='eprescription_dev')
+    build.add_argument('--release-id', default=None)
+    build.add_argument('--out', required=True)
+
+    search = commands.add_parser('search')
+    search.add_argument('snapshot')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--type', choices=sorted(TYPE_CODES))
+    search.add_argument('--prescribable', action='store_true', default=None)
+    search.add_argument('--controlled-drug', action='store_true', default=None)
+
+    bench = commands.add_parser('bench', help='Measure search latency; exit 1 when p99 of queries without typo '
+                                              'correction is over budget')
+    bench.add_argument('snapshot')
+    bench.add_argument('--queries', type=int, default=400)
+    bench.add_argument('--seed', type=int, default=1)
+    bench.add_argument('--max-p99-ms', type=float, default=1.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == 'search':
+        index = MedicineSearchIndex(args.snapshot)
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit, args.type, args.prescribable, args.controlled_drug)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(json.dumps({'release_id': index.release_id, 'elapsed_ms': round(elapsed_ms, 3),
+                          'results': results}, indent=2))
+        index.close()
+
+    elif args.command == 'bench':
+        index = MedicineSearchIndex(args.snapshot)
+        report = run_benchmark(index, benchmark_queries(index, args.queries, args.seed))
+        report['max_p99_ms'] = args.max_p99_ms
+        report['regression'] = report.get('p99_ms', 0) > args.max_p99_ms
+        print(json.dumps(report, indent=2))
+        index.close()
+        sys.exit(1 if report['regression'] else 0)
+
+    elif args.from_release:
+        from example_dmd_import import DmdImporter, DmdRelease
+
+        release_id = DmdImporter.release_info(args.from_release, args.release_id)[0]
+        release = DmdRelease(args.from_release)
+        importer = DmdImporter(databases=None)
+        print(json.dumps(build_snapshot(importer.iter_medicine_rows(release, release_id), args.out, release_id)))
+        release.close()
+
+    else:
+        from appwrite.query import Query
+        from example_dev_set_up import create_databases_from_env, iter_documents
+
+        databases = create_databases_from_env()
+        fields = ['$id', 'snomed_code', 'name', 'type', 'prescribable', 'controlled_drug', 'release_id']
+        rows = list(iter_documents(databases, args.database, 'nhs_medicines', [Query.select(fields)], 1000))
+        # Tag with the newest release present unless one is given
+        release_id = args.release_id or max((row.get('release_id') or '' for row in rows), default='')
+        print(json.dumps(build_snapshot(rows, args.out, release_id)))
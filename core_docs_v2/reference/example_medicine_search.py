@@ -0,0 +1,283 @@
+"""
+Two-tier cache for medicine search.
+
+Tier 1 is an in-process LRU with a TTL; tier 2 is the
+medicine_search_cache collection, read by primary key (one get_document,
+no query). Cache keys are normalized from the search term and type, so
+"  Amoxicillin " and "amoxicillin" share an entry. Concurrent identical
+searches are coalesced (single-flight): one caller queries the backend
+and the rest wait for its result. Expiry is driven by cached_at in both
+tiers.
+
+Usage:
+    cache = MedicineSearchCache(nhs_medicines_search(databases), databases)
+    results = cache.search('amoxi', 'name')
+    cache.stats()
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+
+from example_dev_set_up import DevelopmentDatabaseSetup
+
+
+# Schema limits of medicine_search_cache
+MAX_CACHE_KEY_LENGTH = 255
+MAX_SEARCH_TERM_LENGTH = 255
+MAX_RESULTS_LENGTH = 50000
+
+
+def normalize_cache_key(term: str, search_type: str) -> str:
+    """Build a cache key from a search term and type"""
+    term = unicodedata.normalize('NFKC', term or '').casefold()
+    term = re.sub(r'\s+', ' ', term).strip()
+    key = f"{search_type.strip().lower()}:{term}"
+    if len(key) > MAX_CACHE_KEY_LENGTH:
+        key = f"{search_type.strip().lower()}:sha1:{hashlib.sha1(term.encode('utf-8')).hexdigest()}"
+    return key
+
+
+def nhs_medicines_search(databases, database_id: str = 'eprescription_dev', limit: int = 50):
+    """
+    Backend search over nhs_medicines.
+
+    search_type 'name' uses the idx_name fulltext index, 'snomed_code'
+    an exact match on idx_snomed_code.
+    """
+    def search(term: str, search_type: str) -> list:
+        if search_type == 'snomed_code':
+            queries = [Query.equal('snomed_code', term)]
+        else:
+            queries = [Query.search('name', term)]
+        response = databases.list_documents(
+            database_id=database_id,
+            collection_id='nhs_medicines',
+            queries=queries + [Query.limit(limit)]
+        )
+        return [{key: document.get(key) for key in ('snomed_code', 'name', 'type', 'form', 'strength',
+                                                    'prescribable', 'controlled_drug')}
+                for document in response['documents']]
+    return search
+
+
+def copy_results(results: list) -> list:
+    """A caller's own copy of cached results (the cached list is shared)"""
+    return [dict(result) for result in results]
+
+
+class _InFlight:
+    """A backend lookup other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MedicineSearchCache:
+    """In-process LRU+TTL tier in front of the medicine_search_cache collection"""
+
+    def __init__(self, backend, databases=None, database_id: str = 'eprescription_dev',
+                 max_entries: int = 10000, ttl_seconds: float = 3600, write_workers: int = 2):
+        self.backend = backend
+        self.databases = databases
+        self.database_id = database_id
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.entries = OrderedDict()  # cache_key -> (results, cached_at epoch seconds)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0,
+            'expired': 0, 'backend_calls': 0, 'backend_errors': 0, 'l2_errors': 0, 'l2_oversize': 0,
+        }
+
+        # Tier-2 writes happen off the request path
+        self.writer = ThreadPoolExecutor(max_workers=write_workers) if databases is not None else None
+
+    def search(self, term: str, search_type: str = 'name') -> list:
+        """
+        Cached search: tier 1, then tier 2, then one backend call per key.
+        Every caller gets its own copy, so changing it leaves the cache intact.
+        """
+        cache_key = normalize_cache_key(term, search_type)
+
+        with self.lock:
+            results = self.get_local(cache_key)
+            if results is not None:
+                self.counters['l1_hits'] += 1
+                return copy_results(results)
+
+            call = self.in_flight.get(cache_key)
+            if call is not None:
+                self.counters['coalesced'] += 1
+                leader = False
+            else:
+                call = self.in_flight[cache_key] = _InFlight()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy_results(call.results)
+
+        try:
+            call.results = self.load(cache_key, term.strip(), search_type)
+            return copy_results(call.results)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(cache_key, None)
+            call.done.set()
+
+    def load(self, cache_key: str, term: str, search_type: str) -> list:
+        """Resolve a tier-1 miss from tier 2 or the backend"""
+        cached = self.get_remote(cache_key)
+        if cached is not None:
+            results, cached_at = cached
+            self.put_local(cache_key, results, cached_at)
+            self.count('l2_hits')
+            return results
+
+        self.count('misses')
+        self.count('backend_calls')
+        try:
+            results = self.backend(term, search_type)
+        except Exception:
+            self.count('backend_errors')
+            raise
+
+        cached_at = time.time()
+        self.put_local(cache_key, results, cached_at)
+        if self.writer is not None:
+            self.writer.submit(self.put_remote, cache_key, term, search_type, results, cached_at)
+        return results
+
+    def get_local(self, cache_key: str):
+        """Tier-1 lookup; call with the lock held"""
+        entry = self.entries.get(cache_key)
+        if entry is None:
+            return None
+        results, cached_at = entry
+        if time.time() - cached_at > self.ttl_seconds:
+            del self.entries[cache_key]
+            self.counters['expired'] += 1
+            return None
+        self.entries.move_to_end(cache_key)
+        return results
+
+    def put_local(self, cache_key: str, results: list, cached_at: float):
+        with self.lock:
+            self.entries[cache_key] = (results, cached_at)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get_remote(self, cache_key: str):
+        """Tier-2 lookup by document ID; returns (results, cached_at) or None"""
+        if self.databases is None:
+            return None
+        try:
+            document = self.databases.get_document(
+                database_id=self.database_id,
+                collection_id='medicine_search_cache',
+                document_id=self.document_id(cache_key)
+            )
+        except AppwriteException as e:
+            if e.code != 404:
+                self.count('l2_errors')
+            return None
+
+        cached_at = parse_datetime(document['cached_at'])
+        if time.time() - cached_at > self.ttl_seconds:
+            self.count('expired')
+            return None
+        return json.loads(document['results']), cached_at
+
+    def put_remote(self, cache_key: str, term: str, search_type: str, results: list, cached_at: float):
+        """Write (or refresh) the tier-2 document for a key"""
+        encoded = json.dumps(results, separators=(',', ':'))
+        if len(encoded) > MAX_RESULTS_LENGTH:
+            self.count('l2_oversize')  # Still cached in tier 1
+            return
+
+        timestamp = datetime.fromtimestamp(cached_at, timezone.utc).isoformat().replace('+00:00', 'Z')
+        data = {
+            'cache_key': cache_key,
+            'search_term': term[:MAX_SEARCH_TERM_LENGTH],
+            'search_type': search_type[:50],
+            'results': encoded,
+            'results_count': len(results),
+            'cached_at': timestamp,
+            'updated_at': timestamp,
+        }
+        document_id = self.document_id(cache_key)
+        try:
+            try:
+                self.databases.update_document(
+                    database_id=self.database_id,
+                    collection_id='medicine_search_cache',
+                    document_id=document_id,
+                    data=data
+                )
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+                self.databases.create_document(
+                    database_id=self.database_id,
+                    collection_id='medicine_search_cache',
+                    document_id=document_id,
+                    data={**data, 'created_at': timestamp}
+                )
+        except AppwriteException:
+            self.count('l2_errors')
+
+    def invalidate(self, term: str = None, search_type: str = 'name'):
+        """Drop one key (or everything) from tier 1"""
+        with self.lock:
+            if term is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(normalize_cache_key(term, search_type), None)
+
+    @staticmethod
+    def document_id(cache_key: str) -> str:
+        return DevelopmentDatabaseSetup.seed_document_id('medicine_search_cache', cache_key, 'msc')
+
+    def count(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> dict:
+        """Counters plus hit ratio and current size"""
+        with self.lock:
+            counters = dict(self.counters)
+            counters['size'] = len(self.entries)
+        lookups = counters['l1_hits'] + counters['l2_hits'] + counters['misses'] + counters['coalesced']
+        hits = counters['l1_hits'] + counters['l2_hits'] + counters['coalesced']
+        counters['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return counters
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.shutdown(wait=True)
+
+
+def parse_datetime(value: str) -> float:
+    """Appwrite datetime string -> epoch seconds"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
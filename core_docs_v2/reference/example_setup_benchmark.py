@@ -0,0 +1,211 @@
+"""
+Provisioning benchmark for DevelopmentDatabaseSetup.
+
+Runs the full setup and the seed loader against FakeDatabases with a
+latency profile (per-call latency plus attribute processing time) and
+reports wall-clock time, API calls and per-phase time as JSON. Phases
+come from DevelopmentDatabaseSetup.phase_stats: plan, create_database,
+create_collection, attributes, attribute_wait, indexes, throttle, seed.
+Phase seconds are summed over worker threads, so with concurrency > 1
+they can add up to more than the wall-clock time; idle_seconds is time
+spent sleeping.
+
+With --check the run is compared with a stored baseline and the exit
+status is 1 when wall-clock time or the API call count of a scenario
+regresses beyond the tolerance.
+
+Usage:
+    python example_setup_benchmark.py --profile local --profile regional
+    python example_setup_benchmark.py --check benchmarks/setup_baseline.json
+    python example_setup_benchmark.py --update-baseline benchmarks/setup_baseline.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+from example_dev_set_up import DevelopmentDatabaseSetup
+from example_fake_databases import FakeDatabases
+
+
+LATENCY_PROFILES = {
+    # Self-hosted Appwrite on the same machine or LAN
+    'local': {'latency': (0.004, 0.006), 'attribute_delay': 0.02, 'attribute_workers': 2},
+    # Appwrite Cloud from another region
+    'regional': {'latency': (0.07, 0.09), 'attribute_delay': 0.05, 'attribute_workers': 2},
+    # No latency at all: measures our own overhead
+    'zero': {'latency': 0.0, 'attribute_delay': 0.0, 'attribute_workers': 1},
+}
+
+SCENARIOS = ['setup', 'rerun', 'seed']
+DEFAULT_TOLERANCE = 0.25
+MIN_SLACK_SECONDS = 0.05  # Absolute slack so tiny timings don't flap
+
+
+class QuietContext:
+    """Function context that keeps errors and drops info logs"""
+
+    class req:
+        method = 'POST'
+        body = '{}'
+        headers = {}
+
+    def __init__(self):
+        self.errors = []
+
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def new_setup(databases) -> DevelopmentDatabaseSetup:
+    return DevelopmentDatabaseSetup(QuietContext(), databases=databases)
+
+
+def write_seed_fixtures(directory: str, rows: int):
+    """A system_settings fixture with the given number of rows"""
+    with open(os.path.join(directory, 'system_settings.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['setting_key', 'setting_value', 'setting_type', 'description', 'is_encrypted'])
+        for i in range(rows):
+            writer.writerow([f'benchmark_setting_{i:06d}', str(i), 'integer', f'Benchmark setting {i}', 'false'])
+
+
+def measure(setup: DevelopmentDatabaseSetup, databases: FakeDatabases, run) -> dict:
+    """Run one scenario step and collect its numbers"""
+    setup.phase_stats = {}
+    databases.reset_stats()
+    started = time.monotonic()
+    success = run()
+    wall_seconds = time.monotonic() - started
+    stats = databases.stats()
+    return {
+        'success': bool(success),
+        'wall_seconds': round(wall_seconds, 3),
+        'api_calls': stats['total_calls'],
+        'calls_by_method': stats['calls'],
+        'phases': setup.get_phase_timings(),
+        'api_metrics': setup.api_metrics.summary()['operations'],
+        'errors': setup.context.errors[:10],
+    }
+
+
+def run_scenario(scenario: str, profile: str, options: argparse.Namespace) -> dict:
+    databases = FakeDatabases(seed=options.seed, **LATENCY_PROFILES[profile])
+    setup = new_setup(databases)
+
+    def full_setup(setup):
+        return setup.execute_complete_setup(pipelined=not options.legacy, concurrency=options.concurrency)['success']
+
+    if scenario == 'setup':
+        return measure(setup, databases, lambda: full_setup(setup))
+
+    # The other scenarios start from a provisioned database
+    full_setup(setup)
+    if scenario == 'rerun':
+        rerun_setup = new_setup(databases)
+        return measure(rerun_setup, databases, lambda: full_setup(rerun_setup))
+
+    with tempfile.TemporaryDirectory() as fixtures_dir:
+        write_seed_fixtures(fixtures_dir, options.seed_rows)
+        seed_setup = new_setup(databases)
+        result = measure(seed_setup, databases,
+                         lambda: seed_setup.insert_development_data(fixtures_dir, options.seed_workers))
+    result['rows_per_second'] = round(options.seed_rows / result['wall_seconds'], 1) if result['wall_seconds'] else 0
+    return result
+
+
+def run_benchmarks(options: argparse.Namespace) -> dict:
+    results = {}
+    for profile in options.profile:
+        for scenario in options.scenario:
+            runs = [run_scenario(scenario, profile, options) for _ in range(options.repeat)]
+            # Report the median run
+            runs.sort(key=lambda r: r['wall_seconds'])
+            result = runs[len(runs) // 2]
+            result['wall_seconds_all'] = [r['wall_seconds'] for r in runs]
+            results[f"{profile}/{scenario}"] = result
+    return {
+        'options': {
+            'concurrency': options.concurrency,
+            'pipelined': not options.legacy,
+            'seed_rows': options.seed_rows,
+            'seed_workers': options.seed_workers,
+            'repeat': options.repeat,
+        },
+        'profiles': {name: LATENCY_PROFILES[name] for name in options.profile},
+        'results': results,
+    }
+
+
+def check_regressions(report: dict, baseline: dict) -> list:
+    """Compare a report with a baseline; returns regression messages"""
+    tolerance = baseline.get('tolerance', DEFAULT_TOLERANCE)
+    regressions = []
+    for name, result in report['results'].items():
+        expected = baseline['results'].get(name)
+        if expected is None:
+            continue
+        if not result['success']:
+            regressions.append(f"{name}: run failed")
+        limit = max(expected['wall_seconds'] * (1 + tolerance), expected['wall_seconds'] + MIN_SLACK_SECONDS)
+        if result['wall_seconds'] > limit:
+            regressions.append(f"{name}: wall_seconds {result['wall_seconds']} > {round(limit, 3)} "
+                               f"(baseline {expected['wall_seconds']})")
+        # Attribute polling makes the call count slightly timing dependent
+        if result['api_calls'] > expected['api_calls'] * (1 + tolerance):
+            regressions.append(f"{name}: api_calls {result['api_calls']} > baseline {expected['api_calls']}")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark development database provisioning')
+    parser.add_argument('--profile', action='append', choices=sorted(LATENCY_PROFILES),
+                        help='Latency profile (repeatable, default local and regional)')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario (repeatable, default all)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--legacy', action='store_true', help='Use the sequential sleep-based setup path')
+    parser.add_argument('--seed-rows', type=int, default=1000)
+    parser.add_argument('--seed-workers', type=int, default=DevelopmentDatabaseSetup.SEED_WORKERS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0, help='Seed for latency jitter')
+    parser.add_argument('--check', metavar='BASELINE', help='Fail on regressions against this baseline')
+    parser.add_argument('--update-baseline', metavar='BASELINE', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative regression, stored with --update-baseline')
+    options = parser.parse_args(argv)
+    options.profile = options.profile or ['local', 'regional']
+    options.scenario = options.scenario or SCENARIOS
+    return options
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    report = run_benchmarks(options)
+
+    if options.check:
+        with open(options.check) as f:
+            baseline = json.load(f)
+        report['regressions'] = check_regressions(report, baseline)
+
+    print(json.dumps(report, indent=2))
+
+    if options.update_baseline:
+        baseline = {
+            'tolerance': options.tolerance,
+            'options': report['options'],
+            'results': {name: {'wall_seconds': result['wall_seconds'], 'api_calls': result['api_calls']}
+                        for name, result in report['results'].items()},
+        }
+        with open(options.update_baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+
+    sys.exit(1 if report.get('regressions') else 0)
@@ -0,0 +1,305 @@
+"""
+Deterministic synthetic data for load-testing the e-prescription schema.
+
+Generates clinics -> patients -> prescriptions -> prescription_items ->
+dispensing_records (plus prescriber profiles, memberships and token
+balances per clinic) with values shaped by get_collections_config():
+types, string sizes and required flags are respected, and every
+reference points at a generated parent.
+
+Each clinic gets its own random stream seeded from (seed, clinic index),
+so output is identical for a given seed no matter how the clinics are
+split into shards or processes.
+
+Usage:
+    python example_synthetic_data.py --clinics 10000 --patients-per-clinic 100 \\
+        --prescriptions-per-patient 5 --processes 8 --out ./synthetic
+    python example_synthetic_data.py --clinics 100 --database eprescription_dev
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+from example_dev_set_up import DevelopmentDatabaseSetup, BatchedDocumentWriter, create_databases_from_env
+
+
+FIRST_NAMES = ['Oliver', 'Amelia', 'George', 'Isla', 'Harry', 'Ava', 'Noah', 'Mia', 'Jack', 'Ivy',
+               'Leo', 'Grace', 'Arthur', 'Freya', 'Muhammad', 'Lily', 'Oscar', 'Sophia', 'Charlie', 'Aisha']
+LAST_NAMES = ['Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Johnson', 'Davies', 'Patel',
+              'Robinson', 'Wright', 'Thompson', 'Evans', 'Walker', 'White', 'Roberts', 'Green', 'Khan']
+MEDICATIONS = [('Amoxicillin 500mg capsules', 'capsule'), ('Paracetamol 500mg tablets', 'tablet'),
+               ('Ibuprofen 400mg tablets', 'tablet'), ('Omeprazole 20mg capsules', 'capsule'),
+               ('Salbutamol 100mcg inhaler', 'inhaler'), ('Sertraline 50mg tablets', 'tablet'),
+               ('Metformin 500mg tablets', 'tablet'), ('Amlodipine 5mg tablets', 'tablet'),
+               ('Lisinopril 10mg tablets', 'tablet'), ('Atorvastatin 20mg tablets', 'tablet')]
+WORDS = ['clinical', 'review', 'patient', 'dose', 'daily', 'follow', 'up', 'notes', 'repeat', 'course',
+         'advice', 'monitor', 'symptoms', 'reported', 'stable', 'improving', 'referral', 'history']
+
+STATUS_VALUES = {
+    'prescriptions': ['draft', 'signed', 'dispensed', 'partially_dispensed', 'void', 'expired'],
+    'patients': ['active', 'active', 'active', 'inactive'],
+    'clinics': ['active', 'active', 'suspended'],
+}
+
+# Share of optional attributes that get a value
+OPTIONAL_FILL_RATE = 0.6
+
+# Datetimes are spread over two years from this point
+BASE_TIME = datetime(2024, 1, 1)
+
+
+class SyntheticDataGenerator:
+    """Stream deterministic, referentially consistent documents per clinic"""
+
+    def __init__(self, seed: int = 42, patients_per_clinic: int = 100, prescriptions_per_patient: int = 5,
+                 max_items_per_prescription: int = 3, prescribers_per_clinic: int = 3,
+                 dispense_rate: float = 0.7):
+        self.seed = seed
+        self.patients_per_clinic = patients_per_clinic
+        self.prescriptions_per_patient = prescriptions_per_patient
+        self.max_items_per_prescription = max_items_per_prescription
+        self.prescribers_per_clinic = prescribers_per_clinic
+        self.dispense_rate = dispense_rate
+        self.config = {info['id']: info for info in DevelopmentDatabaseSetup.get_collections_config()}
+
+    def generate_clinic(self, clinic_index: int):
+        """
+        Yield (collection_id, document_id, data) for one clinic and everything under it.
+
+        Parents are always yielded before their children.
+        """
+        rng = random.Random(f"{self.seed}:{clinic_index}")
+        clinic_id = f"clinic_{clinic_index:07d}"
+
+        yield 'clinics', clinic_id, self.document(rng, 'clinics', {
+            'name': f"{rng.choice(LAST_NAMES)} Medical Centre {clinic_index}",
+            'registration_number': f"REG{clinic_index:09d}",
+        })
+        yield 'clinic_token_balances', f"bal_{clinic_index:07d}", self.document(rng, 'clinic_token_balances', {
+            'clinic_id': clinic_id,
+            'current_balance': rng.randint(0, 5000),
+            'reserved_balance': 0,
+        })
+
+        prescriber_ids = []
+        for p in range(self.prescribers_per_clinic):
+            user_id = f"usr_{clinic_index:07d}_{p:02d}"
+            prescriber_ids.append(user_id)
+            yield 'user_profiles', user_id, self.document(rng, 'user_profiles', {
+                'appwrite_user_id': user_id,
+                'gmc_number': f"{clinic_index:07d}{p:02d}",
+            })
+            yield 'clinic_memberships', f"mem_{clinic_index:07d}_{p:02d}", self.document(rng, 'clinic_memberships', {
+                'clinic_id': clinic_id,
+                'user_id': user_id,
+                'appwrite_user_id': user_id,
+                'role': 'admin' if p == 0 else 'prescriber',
+            })
+
+        for j in range(self.patients_per_clinic):
+            patient_id = f"pat_{clinic_index:07d}_{j:05d}"
+            patient_ordinal = clinic_index * self.patients_per_clinic + j
+            yield 'patients', patient_id, self.document(rng, 'patients', {
+                'clinic_id': clinic_id,
+                'created_by': rng.choice(prescriber_ids),
+                'nhs_number': f"{patient_ordinal:010d}",
+                'first_name': rng.choice(FIRST_NAMES),
+                'last_name': rng.choice(LAST_NAMES),
+            })
+
+            for k in range(self.prescriptions_per_patient):
+                prescription_id = f"rx_{clinic_index:07d}_{j:05d}_{k:02d}"
+                prescription_date = self.random_datetime(rng)
+                yield 'prescriptions', prescription_id, self.document(rng, 'prescriptions', {
+                    'prescription_code': prescription_id.upper(),
+                    'clinic_id': clinic_id,
+                    'patient_id': patient_id,
+                    'prescriber_id': rng.choice(prescriber_ids),
+                    'prescription_date': self.format_datetime(prescription_date),
+                    'expiry_date': self.format_datetime(prescription_date + timedelta(days=180)),
+                    'first_dispense_deadline': self.format_datetime(prescription_date + timedelta(days=28)),
+                })
+
+                for item_order in range(1, rng.randint(1, self.max_items_per_prescription) + 1):
+                    item_id = f"item_{clinic_index:07d}_{j:05d}_{k:02d}_{item_order}"
+                    medication, unit = rng.choice(MEDICATIONS)
+                    quantity = float(rng.choice([7, 14, 28, 56, 84]))
+                    yield 'prescription_items', item_id, self.document(rng, 'prescription_items', {
+                        'prescription_id': prescription_id,
+                        'medication_name': medication,
+                        'quantity_to_dispense': quantity,
+                        'quantity_unit': unit,
+                        'item_order': item_order,
+                    })
+
+                    if rng.random() < self.dispense_rate:
+                        dispensed_at = prescription_date + timedelta(hours=rng.randint(1, 24 * 14))
+                        yield 'dispensing_records', f"disp_{item_id[5:]}", self.document(rng, 'dispensing_records', {
+                            'prescription_id': prescription_id,
+                            'prescription_item_id': item_id,
+                            'dispensed_quantity': quantity,
+                            'dispensed_at': self.format_datetime(dispensed_at),
+                        })
+
+    def document(self, rng: random.Random, collection_id: str, overrides: dict) -> dict:
+        """Build a document from the collection config, applying fixed values"""
+        data = {}
+        for attr in self.config[collection_id]['attributes']:
+            key = attr['key']
+            if key in overrides:
+                data[key] = overrides[key]
+            elif attr.get('required') or rng.random() < OPTIONAL_FILL_RATE:
+                data[key] = self.value_for(rng, collection_id, attr)
+
+        # Keep audit timestamps in order (ISO strings compare chronologically)
+        if 'updated_at' in data and data['updated_at'] < data.get('created_at', ''):
+            data['created_at'], data['updated_at'] = data['updated_at'], data['created_at']
+        return data
+
+    def value_for(self, rng: random.Random, collection_id: str, attr: dict):
+        """Random value matching an attribute's type and size"""
+        key = attr['key']
+        attr_type = attr['attr_type']
+
+        if attr_type == 'boolean':
+            return rng.random() < 0.5
+        if attr_type == 'integer':
+            return rng.randint(0, 100)
+        if attr_type == 'float':
+            return round(rng.uniform(1, 500), 2)
+        if attr_type == 'datetime':
+            return self.format_datetime(self.random_datetime(rng))
+        if attr_type == 'email':
+            return f"{rng.choice(FIRST_NAMES).lower()}.{rng.randint(1, 10 ** 6)}@example.test"
+        if attr_type == 'url':
+            return f"https://example.test/{rng.randint(1, 10 ** 6)}"
+
+        size = attr.get('size') or 255
+        if key == 'status' and collection_id in STATUS_VALUES:
+            value = rng.choice(STATUS_VALUES[collection_id])
+        elif key == 'status' or key.endswith('_status') or key.endswith('_type'):
+            value = attr.get('default') or rng.choice(['standard', 'active', 'pending'])
+        elif size >= 500:
+            # Larger strings hold JSON blobs in this schema
+            value = json.dumps({'note': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))})
+        else:
+            value = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+        return value[:size]
+
+    @staticmethod
+    def random_datetime(rng: random.Random) -> datetime:
+        return BASE_TIME + timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+
+    @staticmethod
+    def format_datetime(value: datetime) -> str:
+        return value.isoformat(timespec='milliseconds') + 'Z'
+
+
+def shard_ranges(clinics: int, shards: int) -> list:
+    """Split clinic indexes into contiguous [start, end) ranges"""
+    return [(shard, clinics * shard // shards, clinics * (shard + 1) // shards) for shard in range(shards)]
+
+
+def write_shard_jsonl(args: tuple) -> dict:
+    """Generate one shard into <out_dir>/<collection_id>/part-NNNNN.jsonl"""
+    generator_options, out_dir, shard, start, end = args
+    generator = SyntheticDataGenerator(**generator_options)
+    files = {}
+    counts = {}
+    try:
+        for clinic_index in range(start, end):
+            for collection_id, document_id, data in generator.generate_clinic(clinic_index):
+                f = files.get(collection_id)
+                if f is None:
+                    os.makedirs(os.path.join(out_dir, collection_id), exist_ok=True)
+                    f = files[collection_id] = open(
+                        os.path.join(out_dir, collection_id, f"part-{shard:05d}.jsonl"), 'w', encoding='utf-8')
+                f.write(json.dumps({'$id': document_id, **data}, separators=(',', ':')) + '\n')
+                counts[collection_id] = counts.get(collection_id, 0) + 1
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def write_shard_database(args: tuple) -> dict:
+    """Generate one shard straight into the database through a batched writer"""
+    generator_options, database_id, shard, start, end, batch_size, workers = args
+    generator = SyntheticDataGenerator(**generator_options)
+    writer = BatchedDocumentWriter(create_databases_from_env(), database_id, batch_size, workers)
+    counts = {}
+    for clinic_index in range(start, end):
+        for collection_id, document_id, data in generator.generate_clinic(clinic_index):
+            writer.add(collection_id, document_id, data)
+            counts[collection_id] = counts.get(collection_id, 0) + 1
+    stats = writer.close()
+    return {**counts, '_writer': stats}
+
+
+def run(options: argparse.Namespace) -> dict:
+    """Generate every shard on a process pool and merge the counts"""
+    generator_options = {
+        'seed': options.seed,
+        'patients_per_clinic': options.patients_per_clinic,
+        'prescriptions_per_patient': options.prescriptions_per_patient,
+        'max_items_per_prescription': options.max_items_per_prescription,
+        'prescribers_per_clinic': options.prescribers_per_clinic,
+        'dispense_rate': options.dispense_rate,
+    }
+    shards = shard_ranges(options.clinics, options.shards or options.processes)
+
+    if options.database:
+        worker = write_shard_database
+        jobs = [(generator_options, options.database, shard, start, end, options.batch_size, options.workers)
+                for shard, start, end in shards]
+    else:
+        worker = write_shard_jsonl
+        jobs = [(generator_options, options.out, shard, start, end) for shard, start, end in shards]
+
+    started = time.monotonic()
+    totals = {}
+    writer_totals = {}
+    with Pool(processes=options.processes) as pool:
+        for counts in pool.imap_unordered(worker, jobs):
+            for key, value in counts.pop('_writer', {}).items():
+                if key != 'errors':
+                    writer_totals[key] = writer_totals.get(key, 0) + value
+            for collection_id, count in counts.items():
+                totals[collection_id] = totals.get(collection_id, 0) + count
+
+    elapsed = time.monotonic() - started
+    documents = sum(totals.values())
+    return {
+        'documents': documents,
+        'per_collection': totals,
+        'writer': writer_totals,
+        'duration_seconds': round(elapsed, 2),
+        'documents_per_second': round(documents / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Generate synthetic e-prescription data')
+    parser.add_argument('--clinics', type=int, default=100)
+    parser.add_argument('--patients-per-clinic', type=int, default=100)
+    parser.add_argument('--prescriptions-per-patient', type=int, default=5)
+    parser.add_argument('--max-items-per-prescription', type=int, default=3)
+    parser.add_argument('--prescribers-per-clinic', type=int, default=3)
+    parser.add_argument('--dispense-rate', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, default=None, help='Defaults to --processes')
+    parser.add_argument('--out', default='./synthetic', help='JSONL output directory')
+    parser.add_argument('--database', default=None, help='Write into this database instead of JSONL')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8, help='Writer threads per process')
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(parse_args()), indent=2))
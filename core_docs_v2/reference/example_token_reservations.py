@@ -0,0 +1,622 @@
+"""
+Token reservations and consumption over clinic_token_balances.
+
+Reserving, consuming and releasing tokens only touch per-clinic state in
+memory; a flusher thread folds everything that happened since the last
+write into a single balance update, so thousands of reservations per
+second per clinic cost a few writes per second.
+
+Every balance write is guarded by optimistic concurrency on
+last_transaction_id. Appwrite has no conditional update, so the guard is
+a billing_transactions ledger entry whose document ID is derived from
+the clinic and the last_transaction_id the write is based on: of two
+writers starting from the same version only one can create it, the other
+gets a 409, reloads the balance and reapplies its changes on top. The
+ledger entry carries the resulting balance, so a write that stopped
+between the ledger entry and the balance update is rolled forward by the
+next writer.
+
+Each process checks reservations against its own view of the balance,
+so with several processes a clinic can overdraw by what the others
+consumed within one flush interval; no consumption is ever lost.
+
+Reservations live in memory, but the reserved_balance they add to is
+stored. So that a process that dies does not hold its tokens forever,
+each process keeps a lease in billing_transactions (transaction_type
+'token_reservation', one document per clinic and process) with the
+tokens it has reserved in the stored balance and an expiry of
+reservation_ttl past its last write. The lease is written before the
+ledger entry that changes those tokens and names that entry as 'next',
+so it counts as applied exactly when the entry exists and names the
+lease's holder (ledger entries record their writer). When a process
+loads a clinic it reconciles: the stored reserved_balance is set to the
+sum of the unexpired leases and expired ones are marked released.
+Reservations written by processes that keep no lease are released by
+that step too.
+
+Auto top-up runs on the flusher, never on the caller's thread: when a
+flushed balance drops to auto_topup_threshold, the topup callback is
+called in the background and the tokens it returns are credited. It
+fires once per crossing, not again until the balance has been above the
+threshold.
+
+Usage:
+    tokens = TokenReservations(databases, topup=charge_saved_card)
+    reservation_id = tokens.reserve(clinic_id, 1)
+    ...
+    tokens.consume(reservation_id)   # or tokens.release(reservation_id)
+    tokens.close()
+"""
+
+import hashlib
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+
+
+BALANCE_FIELDS = ('current_balance', 'reserved_balance', 'lifetime_purchased', 'lifetime_consumed')
+TOPUP_FIELDS = ('auto_topup_enabled', 'auto_topup_threshold', 'auto_topup_amount', 'auto_topup_max_amount')
+
+
+class InsufficientTokens(Exception):
+    """Raised by reserve() when the clinic's available balance is too low"""
+
+
+def transaction_id(clinic_id: str, base_version: str) -> str:
+    """Ledger document ID for the write that follows base_version (the same for every writer)"""
+    return 'tok' + hashlib.sha1(f'{clinic_id}:{base_version or ""}'.encode()).hexdigest()[:32]
+
+
+def lease_id(clinic_id: str, holder: str) -> str:
+    """Document ID of a process's reservation lease for a clinic"""
+    return 'res' + hashlib.sha1(f'{clinic_id}:{holder}'.encode()).hexdigest()[:32]
+
+
+class ClinicAccount:
+    """In-memory view of one clinic's balance plus the changes not yet written"""
+
+    def __init__(self, clinic_id: str):
+        self.clinic_id = clinic_id
+        self.lock = threading.Lock()
+        self.document_id = None
+        self.version = None  # last_transaction_id of the stored balance
+        self.stored = {}  # Balance fields as last read or written
+        self.settings = {}  # auto top-up settings
+        self.billing_user_id = None
+        self.pending = dict.fromkeys(BALANCE_FIELDS, 0)
+        self.reservations = {}  # reservation id -> (tokens, reserved at)
+        self.dirty = False
+        self.flushing = False
+        self.unapplied = None  # (base version, version, balance) of a ledger entry not yet on the balance
+        self.topup_armed = True  # Cleared by a top-up, set again once the balance is above the threshold
+        self.held = 0  # This process's reservations included in the stored reserved_balance
+        self.lease_expires = 0.0  # Expiry (epoch seconds) of this process's lease as last written
+
+    def load(self, document: dict):
+        self.document_id = document['$id']
+        self.version = document.get('last_transaction_id')
+        self.stored = {field: document.get(field) or 0 for field in BALANCE_FIELDS}
+        self.settings = {field: document.get(field) for field in TOPUP_FIELDS}
+        self.billing_user_id = document.get('billing_admin_user_id')
+
+    def available(self) -> int:
+        """Tokens that can still be reserved; call with the lock held"""
+        return (self.stored['current_balance'] + self.pending['current_balance']
+                - self.stored['reserved_balance'] - self.pending['reserved_balance'])
+
+
+class TokenReservations:
+    """Aggregating reserve/consume engine for clinic token balances"""
+
+    MAX_CONFLICTS = 20
+    ROLL_FORWARD_AFTER = 10.0  # Seconds before an unapplied ledger entry counts as abandoned
+    LEASE_GRACE = 60.0  # Seconds a lease outlives the reservations it covers
+    MAX_LEASES = 1000
+
+    def __init__(self, databases, database_id: str = 'eprescription_dev', flush_interval: float = 0.05,
+                 workers: int = 4, reservation_ttl: float = 900.0, topup=None, log=print):
+        """
+        Args:
+            flush_interval: seconds between balance writes for a busy clinic
+            workers: clinics flushed in parallel
+            reservation_ttl: reservations neither consumed nor released
+                within this many seconds are released
+            topup: topup(clinic_id, tokens) -> tokens actually purchased,
+                called in the background when auto top-up triggers
+        """
+        self.databases = databases
+        self.database_id = database_id
+        self.flush_interval = flush_interval
+        self.reservation_ttl = reservation_ttl
+        self.topup = topup
+        self.log = log
+
+        self.accounts = {}
+        self.accounts_lock = threading.Lock()
+        self.reservation_clinics = {}  # reservation id -> clinic id
+        self.id_prefix = uuid.uuid4().hex[:12]
+        self.sequence = itertools.count()
+
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            'reserved': 0, 'consumed': 0, 'released': 0, 'expired': 0, 'refused': 0,
+            'flushes': 0, 'conflicts': 0, 'rolled_forward': 0, 'topups': 0, 'flush_errors': 0,
+            'leases_released': 0, 'reconciled_tokens': 0,
+        }
+
+        self.wake = threading.Event()
+        self.stopping = False
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.topup_executor = ThreadPoolExecutor(max_workers=2)
+        self.flusher = threading.Thread(target=self.run, name='token-flusher', daemon=True)
+        self.flusher.start()
+
+    # Hot path
+
+    def reserve(self, clinic_id: str, tokens: int = 1) -> str:
+        """Hold tokens for a prescription; returns the reservation id"""
+        account = self.account(clinic_id)
+        reservation_id = f'{self.id_prefix}{next(self.sequence):x}'
+        with account.lock:
+            if account.available() < tokens:
+                self.count('refused')
+                raise InsufficientTokens(f'Clinic {clinic_id} has {account.available()} tokens available, '
+                                         f'{tokens} requested')
+            account.pending['reserved_balance'] += tokens
+            account.reservations[reservation_id] = (tokens, time.monotonic())
+            account.dirty = True
+        self.reservation_clinics[reservation_id] = clinic_id
+        self.count('reserved')
+        return reservation_id
+
+    def consume(self, reservation_id: str, tokens: int = None):
+        """Spend a reservation (or part of it; the rest is released)"""
+        account, reserved = self.take_reservation(reservation_id)
+        used = reserved if tokens is None else min(tokens, reserved)
+        with account.lock:
+            account.pending['reserved_balance'] -= reserved
+            account.pending['current_balance'] -= used
+            account.pending['lifetime_consumed'] += used
+            account.dirty = True
+        self.count('consumed')
+
+    def release(self, reservation_id: str):
+        """Give a reservation back unused"""
+        account, reserved = self.take_reservation(reservation_id)
+        with account.lock:
+            account.pending['reserved_balance'] -= reserved
+            account.dirty = True
+        self.count('released')
+
+    def consume_now(self, clinic_id: str, tokens: int = 1):
+        """Reserve and consume in one step"""
+        self.consume(self.reserve(clinic_id, tokens))
+
+    def credit(self, clinic_id: str, tokens: int):
+        """Add purchased tokens to a clinic's balance"""
+        account = self.account(clinic_id)
+        with account.lock:
+            account.pending['current_balance'] += tokens
+            account.pending['lifetime_purchased'] += tokens
+            account.dirty = True
+        self.wake.set()
+
+    def available(self, clinic_id: str) -> int:
+        account = self.account(clinic_id)
+        with account.lock:
+            return account.available()
+
+    def take_reservation(self, reservation_id: str) -> tuple:
+        clinic_id = self.reservation_clinics.pop(reservation_id, None)
+        account = self.accounts.get(clinic_id)
+        if account is not None:
+            with account.lock:
+                entry = account.reservations.pop(reservation_id, None)
+            if entry is not None:
+                return account, entry[0]
+        raise KeyError(f'Unknown or already settled reservation {reservation_id}')
+
+    def account(self, clinic_id: str) -> ClinicAccount:
+        """The clinic's account, loading its balance document on first use"""
+        account = self.accounts.get(clinic_id)
+        if account is not None:
+            return account
+        with self.accounts_lock:
+            account = self.accounts.get(clinic_id)
+            if account is None:
+                account = ClinicAccount(clinic_id)
+                account.load(self.fetch_balance(clinic_id))
+                try:
+                    self.reconcile_reservations(account)
+                except Exception as e:
+                    self.log(f"Reservation reconcile for clinic {clinic_id} failed: {e}")
+                self.accounts[clinic_id] = account
+        return account
+
+    def count(self, name: str, amount: int = 1):
+        with self.stats_lock:
+            self.counters[name] += amount
+
+    # Flushing
+
+    def run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.expire_reservations()
+            self.flush_dirty()
+
+    def flush_dirty(self) -> list:
+        """Start a flush for every clinic with unwritten changes; returns the futures"""
+        futures = []
+        for account in list(self.accounts.values()):
+            with account.lock:
+                if not account.dirty or account.flushing:
+                    continue
+                account.flushing = True
+            futures.append(self.executor.submit(self.flush_account, account))
+        return futures
+
+    def flush_account(self, account: ClinicAccount):
+        try:
+            self.write_balance(account)
+        except Exception as e:
+            self.count('flush_errors')
+            self.log(f"Token balance write for clinic {account.clinic_id} failed, will retry: {e}")
+        try:
+            self.maybe_topup(account)
+        finally:
+            # Cleared only now, so flush() returns after any top-up this flush started is scheduled
+            with account.lock:
+                account.flushing = False
+
+    def write_balance(self, account: ClinicAccount):
+        """Write the pending changes as one ledger entry plus one balance update"""
+        if account.unapplied:
+            self.apply_entry(account, check=True)
+
+        with account.lock:
+            changes = account.pending
+            account.pending = dict.fromkeys(BALANCE_FIELDS, 0)
+            account.dirty = False
+        if not any(changes.values()):
+            return
+        try:
+            for _ in range(self.MAX_CONFLICTS):
+                with account.lock:
+                    base_version, stored = account.version, dict(account.stored)
+                values = {field: stored[field] + changes[field] for field in BALANCE_FIELDS}
+                new_version = transaction_id(account.clinic_id, base_version)
+                held = account.held + changes['reserved_balance']
+                if changes['reserved_balance'] or (held and account.lease_expires < time.time() + self.reservation_ttl):
+                    self.write_lease(account, new_version, held)
+                try:
+                    self.create_ledger_entry(account, new_version, base_version, changes, values)
+                except AppwriteException as e:
+                    if e.code != 409:
+                        raise
+                    # Someone else already wrote on top of base_version
+                    self.count('conflicts')
+                    self.refresh(account, new_version)
+                    continue
+                break
+            else:
+                raise AppwriteException(f'Gave up after {self.MAX_CONFLICTS} conflicting balance writes', 409,
+                                        'document_update_conflict')
+        except Exception:
+            # Nothing was recorded; the next flush includes these changes
+            with account.lock:
+                for field in BALANCE_FIELDS:
+                    account.pending[field] += changes[field]
+                account.dirty = True
+            raise
+
+        # The changes are in the ledger now; from here on only the balance update is retried
+        with account.lock:
+            account.held = held
+            account.unapplied = (base_version, new_version, values)
+        self.apply_entry(account)
+        if values['current_balance'] < 0:
+            self.log(f"Clinic {account.clinic_id} balance is {values['current_balance']} "
+                     f"after concurrent consumption elsewhere")
+        self.count('flushes')
+
+    def apply_entry(self, account: ClinicAccount, check: bool = False):
+        """
+        Update the balance to this writer's latest ledger entry. With check,
+        the entry is only applied if the balance is still at the version
+        it was based on (another writer may have rolled it forward and
+        written on top since).
+        """
+        base_version, new_version, values = account.unapplied
+        try:
+            if check:
+                document = self.fetch_balance(account.clinic_id)
+                if document.get('last_transaction_id') != base_version:
+                    with account.lock:
+                        account.load(document)
+                        account.unapplied = None
+                    return
+            self.update_balance(account, new_version, values)
+        except Exception:
+            with account.lock:
+                account.dirty = True  # Keeps the flusher retrying
+            raise
+        with account.lock:
+            account.version, account.stored = new_version, values
+            account.unapplied = None
+
+    def create_ledger_entry(self, account: ClinicAccount, new_version: str, base_version: str,
+                            changes: dict, values: dict, transaction_type: str = 'token_usage'):
+        now = datetime.utcnow().isoformat() + 'Z'
+        self.databases.create_document(
+            database_id=self.database_id,
+            collection_id='billing_transactions',
+            document_id=new_version,
+            data={
+                'user_id': account.billing_user_id or 'system',
+                'clinic_id': account.clinic_id,
+                'transaction_type': transaction_type,
+                'amount': float(changes['lifetime_consumed']),
+                'token_data': json.dumps({'holder': self.id_prefix, 'base': base_version, 'changes': changes,
+                                          'balance': values}, separators=(',', ':')),
+                'status': 'completed',
+                'processed_at': now,
+                'created_at': now,
+                'updated_at': now,
+            }
+        )
+
+    def update_balance(self, account: ClinicAccount, version: str, values: dict):
+        self.databases.update_document(
+            database_id=self.database_id,
+            collection_id='clinic_token_balances',
+            document_id=account.document_id,
+            data={**values, 'last_transaction_id': version, 'updated_at': datetime.utcnow().isoformat() + 'Z'}
+        )
+
+    def refresh(self, account: ClinicAccount, conflicting_version: str):
+        """
+        Reload the balance after a conflict. If the balance still shows the
+        version the conflicting ledger entry was based on, that writer
+        stopped before updating it: once the entry is old enough that the
+        writer cannot still be running, apply the entry's balance first.
+        """
+        document = self.fetch_balance(account.clinic_id)
+        if document.get('last_transaction_id') == account.version:
+            entry = self.databases.get_document(self.database_id, 'billing_transactions', conflicting_version)
+            created = datetime.fromisoformat(entry['created_at'].replace('Z', '+00:00')).replace(tzinfo=None)
+            if (datetime.utcnow() - created).total_seconds() < self.ROLL_FORWARD_AFTER:
+                time.sleep(self.flush_interval)  # Probably still in flight; give it time to land
+                return
+            balance = json.loads(entry['token_data'])['balance']
+            self.update_balance(account, conflicting_version, balance)
+            document = {**document, **balance, 'last_transaction_id': conflicting_version}
+            self.count('rolled_forward')
+        with account.lock:
+            account.load(document)
+
+    def fetch_balance(self, clinic_id: str) -> dict:
+        documents = self.databases.list_documents(
+            database_id=self.database_id,
+            collection_id='clinic_token_balances',
+            queries=[Query.equal('clinic_id', clinic_id), Query.limit(1)]
+        )['documents']
+        if not documents:
+            raise AppwriteException(f'No token balance for clinic {clinic_id}', 404, 'document_not_found')
+        return documents[0]
+
+    # Reservation leases
+
+    def write_lease(self, account: ClinicAccount, next_version: str, next_held: int, status: str = 'held'):
+        """
+        Record the tokens this process holds: account.held now, next_held
+        once the ledger entry next_version exists.
+        """
+        expires = time.time() + self.reservation_ttl + self.LEASE_GRACE
+        now = datetime.utcnow().isoformat() + 'Z'
+        self.databases.upsert_document(
+            database_id=self.database_id,
+            collection_id='billing_transactions',
+            document_id=lease_id(account.clinic_id, self.id_prefix),
+            data={
+                'user_id': account.billing_user_id or 'system',
+                'clinic_id': account.clinic_id,
+                'transaction_type': 'token_reservation',
+                'amount': float(next_held),
+                'token_data': json.dumps({
+                    'holder': self.id_prefix, 'held': account.held, 'next': [next_version, next_held],
+                    'expires': datetime.utcfromtimestamp(expires).isoformat() + 'Z',
+                }, separators=(',', ':')),
+                'status': status,
+                'created_at': now,
+                'updated_at': now,
+            }
+        )
+        account.lease_expires = expires
+
+    def lease_held(self, lease: dict) -> tuple:
+        """
+        (tokens held, expired) of a lease document. The next amount only
+        counts once the ledger entry next_version exists and was written by
+        the lease holder: any writer can take that ID first.
+        """
+        data = json.loads(lease['token_data'])
+        held = data['held']
+        next_version, next_held = data.get('next') or (None, None)
+        if next_version:
+            try:
+                entry = self.databases.get_document(self.database_id, 'billing_transactions', next_version)
+                if json.loads(entry.get('token_data') or '{}').get('holder') == data['holder']:
+                    held = next_held
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+        expires = datetime.fromisoformat(data['expires'].replace('Z', '+00:00')).replace(tzinfo=None)
+        return held, expires < datetime.utcnow()
+
+    def reconcile_reservations(self, account: ClinicAccount) -> int:
+        """
+        Set the stored reserved_balance to the sum of the unexpired leases
+        and mark the expired ones released; returns the tokens released.
+        Runs when a clinic is first loaded, before anything is reserved.
+        """
+        expired = []
+        for _ in range(self.MAX_CONFLICTS):
+            leases = self.databases.list_documents(
+                database_id=self.database_id,
+                collection_id='billing_transactions',
+                queries=[Query.equal('clinic_id', account.clinic_id),
+                         Query.equal('transaction_type', 'token_reservation'),
+                         Query.equal('status', 'held'), Query.limit(self.MAX_LEASES)]
+            )['documents']
+            target, expired = 0, []
+            for lease in leases:
+                held, lapsed = self.lease_held(lease)
+                if lapsed:
+                    expired.append(lease)
+                else:
+                    target += held
+
+            with account.lock:
+                base_version, stored = account.version, dict(account.stored)
+            released = stored['reserved_balance'] - target
+            if not released:
+                break
+            changes = {**dict.fromkeys(BALANCE_FIELDS, 0), 'reserved_balance': -released}
+            values = {**stored, 'reserved_balance': target}
+            new_version = transaction_id(account.clinic_id, base_version)
+            try:
+                self.create_ledger_entry(account, new_version, base_version, changes, values,
+                                         transaction_type='token_adjustment')
+            except AppwriteException as e:
+                if e.code != 409:
+                    raise
+                self.count('conflicts')
+                self.refresh(account, new_version)
+                continue
+            with account.lock:
+                account.unapplied = (base_version, new_version, values)
+            self.apply_entry(account)
+            self.count('reconciled_tokens', released)
+            self.log(f"Clinic {account.clinic_id} reserved_balance reconciled from {stored['reserved_balance']} "
+                     f"to {target} ({len(expired)} expired leases)")
+            break
+        else:
+            raise AppwriteException(f'Gave up after {self.MAX_CONFLICTS} conflicting balance writes', 409,
+                                    'document_update_conflict')
+
+        for lease in expired:
+            self.databases.update_document(
+                database_id=self.database_id,
+                collection_id='billing_transactions',
+                document_id=lease['$id'],
+                data={'status': 'released', 'updated_at': datetime.utcnow().isoformat() + 'Z'}
+            )
+            self.count('leases_released')
+        return released
+
+    def expire_reservations(self):
+        deadline = time.monotonic() - self.reservation_ttl
+        for account in list(self.accounts.values()):
+            with account.lock:
+                expired = [rid for rid, (_, at) in account.reservations.items() if at < deadline]
+            for reservation_id in expired:
+                try:
+                    self.release(reservation_id)
+                except KeyError:
+                    continue  # Settled meanwhile
+                self.count('expired')
+
+    # Auto top-up
+
+    def maybe_topup(self, account: ClinicAccount):
+        """Start a top-up when the balance has crossed the threshold since the last one"""
+        settings = account.settings
+        if self.topup is None or not settings.get('auto_topup_enabled'):
+            return
+        with account.lock:
+            if account.available() > (settings.get('auto_topup_threshold') or 0):
+                account.topup_armed = True
+                return
+            if not account.topup_armed:
+                return
+            account.topup_armed = False
+        tokens = min(settings.get('auto_topup_amount') or 0,
+                     settings.get('auto_topup_max_amount') or settings.get('auto_topup_amount') or 0)
+        try:
+            self.topup_executor.submit(self.run_topup, account, tokens)
+        except RuntimeError as e:  # Shutting down
+            with account.lock:
+                account.topup_armed = True  # A later flush can try again
+            self.log(f"Auto top-up for clinic {account.clinic_id} could not be scheduled: {e}")
+
+    def run_topup(self, account: ClinicAccount, tokens: int):
+        try:
+            purchased = self.topup(account.clinic_id, tokens)
+            if purchased:
+                self.credit(account.clinic_id, purchased)
+                self.count('topups')
+        except Exception as e:
+            # Not retried until the balance has been above the threshold again
+            self.log(f"Auto top-up for clinic {account.clinic_id} failed: {e}")
+
+    # Shutdown
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Write every clinic's pending changes now; False if some are still unwritten at the timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.accounts_lock:
+                accounts = list(self.accounts.values())
+            if not any(account.dirty or account.flushing or account.unapplied for account in accounts):
+                return True
+            if time.monotonic() > deadline:
+                return False
+            for future in self.flush_dirty():
+                future.result()
+            time.sleep(0.001)
+
+    def close(self) -> dict:
+        """Stop the flusher, write what is pending and return the stats"""
+        self.stopping = True
+        self.wake.set()
+        self.flusher.join()
+        flushed = self.flush()
+        # Top-ups started by those flushes credit tokens that need one more write
+        self.topup_executor.shutdown(wait=True)
+        if not self.flush() or not flushed:
+            self.log("Closing with unwritten token balance changes")
+        self.executor.shutdown(wait=True)
+        self.release_leases()
+        return self.stats()
+
+    def release_leases(self):
+        """Mark this process's empty leases released; ones still holding tokens are left to expire"""
+        for account in list(self.accounts.values()):
+            if not account.lease_expires or account.dirty or account.unapplied:
+                continue
+            if account.held:
+                self.log(f"Clinic {account.clinic_id} keeps {account.held} tokens reserved until its lease expires")
+                continue
+            try:
+                self.write_lease(account, None, 0, status='released')
+            except AppwriteException as e:
+                self.log(f"Releasing the reservation lease of clinic {account.clinic_id} failed: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return dict(self.counters)
@@ -0,0 +1,7 @@
+"""
+Behaviour checks for the reference tools, run against FakeDatabases.
+
+From core_docs_v2/reference:
+    python -m pytest tests
+    python -m unittest discover -s tests -t .
+"""
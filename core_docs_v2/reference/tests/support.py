@@ -0,0 +1,39 @@
+"""Shared helpers: a function context and a provisioned fake database"""
+
+import json
+
+from example_fake_databases import FakeDatabases
+from example_setup_benchmark import new_setup
+
+
+class RequestContext:
+    """Appwrite function context for one POST body; res.json returns (status, payload)"""
+
+    class res:
+        @staticmethod
+        def json(payload, status=200):
+            return status, payload
+
+    def __init__(self, body=None):
+        self.req = type('req', (), {'method': 'POST', 'headers': {},
+                                    'body': body if isinstance(body, str) else json.dumps(body or {})})
+        self.logs = []
+        self.errors = []
+
+    def log(self, message):
+        self.logs.append(message)
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def provisioned_databases(**options) -> FakeDatabases:
+    """A FakeDatabases with the development database set up and seeded"""
+    databases = FakeDatabases(**{'attribute_delay': 0, **options})
+    result = new_setup(databases).execute_complete_setup()
+    assert result['success'], result.get('error')
+    return databases
+
+
+def document_count(databases, database_id: str, collection_id: str) -> int:
+    return databases.list_documents(database_id, collection_id)['total']
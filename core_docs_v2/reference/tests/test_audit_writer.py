@@ -0,0 +1,122 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from example_audit_writer import AuditWriter
+from tests.support import document_count, provisioned_databases
+
+DATABASE_ID = 'eprescription_dev'
+
+
+class QuickRetryWriter(AuditWriter):
+    MAX_ATTEMPTS = 2
+    RETRY_BASE_DELAY = 0.0
+
+
+class SpillReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.databases = provisioned_databases()
+        self.spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spill_dir)
+
+    def writer(self, cls=QuickRetryWriter, **options) -> AuditWriter:
+        return cls(self.databases, spill_dir=self.spill_dir, flush_interval=0.01, **options)
+
+    def spill_files(self) -> list:
+        return glob.glob(os.path.join(self.spill_dir, '*.spill.jsonl'))
+
+    def stored(self) -> int:
+        return document_count(self.databases, DATABASE_ID, 'audit_logs')
+
+    def spill_while_down(self, events: int) -> dict:
+        self.databases.errors = {'create_documents': (1.0, 503), 'create_document': (1.0, 503)}
+        writer = self.writer()
+        for i in range(events):
+            writer.log_audit('prescription.sign', 'prescription', user_id=f'user_{i}')
+        stats = writer.close()
+        self.databases.errors = {}
+        return stats
+
+    def test_failed_batches_are_spilled_and_replayed_on_start(self):
+        stats = self.spill_while_down(30)
+        self.assertEqual(stats['spilled'], 30)
+        self.assertEqual(stats['written'], 0)
+        self.assertEqual(self.stored(), 0)
+        self.assertTrue(self.spill_files())
+
+        stats = self.writer().close()
+        self.assertEqual(stats['replayed'], 30)
+        self.assertEqual(stats['written'], 30)
+        self.assertEqual(self.stored(), 30)
+        self.assertFalse(self.spill_files())
+        self.assertFalse(glob.glob(os.path.join(self.spill_dir, '*.replay')))
+
+    def test_replaying_written_events_does_not_duplicate_them(self):
+        self.spill_while_down(10)
+        path = self.spill_files()[0]
+        copy = os.path.join(self.spill_dir, 'copy.keep')
+        shutil.copy(path, copy)
+        self.writer().close()
+
+        shutil.move(copy, path)  # The same events spilled a second time
+        stats = self.writer().close()
+        self.assertEqual(stats['replayed'], 10)
+        self.assertEqual(stats['written'], 0)
+        self.assertEqual(stats['existing'], 10)
+        self.assertEqual(self.stored(), 10)
+
+    def test_torn_spill_line_is_moved_to_rejected(self):
+        with open(os.path.join(self.spill_dir, 'audit_logs.spill.jsonl'), 'w', encoding='utf-8') as f:
+            for i in range(5):
+                f.write(json.dumps(['audit_logs', f'spilled{i}', time.time(),
+                                    {'action': 'prescription.sign', 'resource_type': 'prescription'}]) + '\n')
+            f.write('["audit_logs", "spilled9", 17')  # Cut off by a crash
+
+        stats = self.writer().close()
+        self.assertEqual(stats['written'], 5)
+        self.assertEqual(stats['rejected'], 1)
+        with open(os.path.join(self.spill_dir, 'rejected.jsonl'), encoding='utf-8') as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual(len(rejected), 1)
+        self.assertIn('spilled9', rejected[0]['line'])
+        self.assertFalse(self.spill_files())
+
+    def test_events_left_by_a_dead_flusher_are_spilled_on_close(self):
+        class DeadFlusher(QuickRetryWriter):
+            def run(self):
+                pass
+
+        writer = self.writer(cls=DeadFlusher)
+        for i in range(20):
+            writer.log_security_event('login_failed', 'warning', user_id=f'user_{i}')
+        stats = writer.close()
+        self.assertEqual(stats['spilled'], 20)
+        self.assertEqual(stats['queue_depth'], 0)
+
+        stats = self.writer().close()
+        self.assertEqual(stats['written'], 20)
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'security_events'), 20)
+
+    def test_full_queue_spills_instead_of_blocking(self):
+        self.databases.latency = {'create_documents': 0.05}
+        writer = self.writer(max_queue=5, batch_size=5)
+        started = time.monotonic()
+        for i in range(200):
+            writer.log_audit('prescription.view', 'prescription', user_id=f'user_{i}')
+        self.assertLess(time.monotonic() - started, 1.0)
+        stats = writer.close()
+        self.assertGreater(stats['spilled'], 0)
+        self.assertEqual(stats['blocked'], 0)
+
+        self.databases.latency = {}
+        self.writer().close()
+        self.assertEqual(self.stored(), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import unittest
+from unittest import mock
+
+from example_dev_set_up import DevelopmentDatabaseSetup, main, request_options
+from example_fake_databases import FakeDatabases
+from tests.support import RequestContext
+
+
+def call(body):
+    """(status, payload) of the function for this request body"""
+    return main(RequestContext(body), FakeDatabases(attribute_delay=0))
+
+
+class RequestOptionsTest(unittest.TestCase):
+
+    def test_numbers_sent_as_strings_are_converted(self):
+        options = request_options({'concurrency': '4', 'rate_limit': '2.5', 'database_id': None})
+        self.assertEqual(options['concurrency'], 4)
+        self.assertEqual(options['rate_limit'], 2.5)
+        self.assertNotIn('database_id', options)
+
+    def test_rejected_fields_are_named(self):
+        cases = {
+            'pipelined': {'pipelined': 'false'},
+            'dry_run': {'dry_run': 0},
+            'concurrency': {'concurrency': True},
+            'time_budget_seconds': {'time_budget_seconds': 'nan'},
+            'database_ids': {'database_ids': ['eprescription_test_a', 7]},
+            'log_level': {'log_level': 'verbose'},
+            'log_sample': {'log_sample': {'debug': '0.5'}},
+        }
+        for field, body in cases.items():
+            with self.subTest(field=field):
+                with self.assertRaisesRegex(ValueError, field):
+                    request_options(body)
+
+    def test_body_must_be_an_object(self):
+        with self.assertRaises(ValueError):
+            request_options(['pipelined'])
+
+
+class RequestValidationTest(unittest.TestCase):
+
+    def assert_rejected(self, body, message):
+        status, payload = call(body)
+        self.assertEqual(status, 400, payload)
+        self.assertFalse(payload['success'])
+        self.assertIn(message, payload['error'])
+
+    def test_bad_types_answer_400_before_any_work(self):
+        databases = FakeDatabases(attribute_delay=0)
+        status, payload = main(RequestContext({'pipelined': 'false'}), databases)
+        self.assertEqual(status, 400)
+        self.assertIn('pipelined', payload['error'])
+        self.assertEqual(databases.stats()['total_calls'], 0)
+
+    def test_unmanaged_databases_are_refused(self):
+        self.assert_rejected({'database_id': 'production'}, 'not managed')
+        self.assert_rejected({'database_ids': ['eprescription_test_a', 'production']}, 'not managed')
+        self.assert_rejected({'database_count': 2, 'database_prefix': 'prod_'}, 'not managed')
+
+    def test_database_count_is_capped(self):
+        self.assert_rejected({'database_count': DevelopmentDatabaseSetup.MAX_DATABASE_COUNT + 1}, 'limited')
+
+    def test_allowlisted_database_is_accepted(self):
+        with mock.patch.dict(os.environ, {DevelopmentDatabaseSetup.DATABASE_ALLOWLIST_ENV: 'staging_copy'}):
+            status, payload = call({'database_id': 'staging_copy'})
+        self.assertEqual(status, 200, payload.get('error'))
+        self.assertTrue(payload['success'])
+
+    def test_fixtures_dir_must_be_a_bundled_set(self):
+        self.assert_rejected({'fixtures_dir': '../../etc'}, 'fixtures_dir')
+
+    def test_index_plan_is_checked_up_front(self):
+        plan = {'create': [{'collection_id': 'no_such_collection', 'key': 'idx_x', 'index_type': 'key',
+                            'attributes': ['status']}]}
+        self.assert_rejected({'index_plan': plan}, 'no_such_collection')
+
+    def test_valid_request_sets_up_the_database(self):
+        status, payload = call({'concurrency': '2', 'pipelined': True})
+        self.assertEqual(status, 200, payload.get('error'))
+        self.assertTrue(payload['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from example_dev_set_up import DevelopmentDatabaseSetup
+from tests.support import RequestContext, document_count, provisioned_databases
+
+DATABASE_ID = DevelopmentDatabaseSetup.DEVELOPMENT_DATABASE_ID
+
+
+class ResetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.databases = provisioned_databases()
+        self.databases.create_document(DATABASE_ID, 'audit_logs', 'stale_event', {
+            'action': 'test.reset', 'resource_type': 'test', 'created_at': '2024-01-01T00:00:00Z'})
+        self.settings = document_count(self.databases, DATABASE_ID, 'system_settings')
+        self.assertGreater(self.settings, 0)
+
+    def setup(self, database_id: str = DATABASE_ID) -> DevelopmentDatabaseSetup:
+        return DevelopmentDatabaseSetup(RequestContext(), self.databases, database_id)
+
+    def attribute_keys(self) -> dict:
+        return {collection_id: set(collection['attributes'])
+                for collection_id, collection in self.databases.databases[DATABASE_ID]['collections'].items()}
+
+    def test_fast_reset_keeps_the_schema_and_reseeds(self):
+        schema = self.attribute_keys()
+        self.databases.reset_stats()
+        result = self.setup().execute_complete_setup(force_recreate='fast')
+        self.assertTrue(result['success'], result.get('error'))
+        self.assertEqual(result['reset']['strategy'], 'fast')
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'audit_logs'), 0)
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'system_settings'), self.settings)
+        self.assertEqual(self.attribute_keys(), schema)
+        calls = self.databases.stats()['calls']
+        self.assertNotIn('delete', calls)
+        self.assertFalse([method for method in calls if method.startswith('create_') and method.endswith('attribute')])
+
+    def test_full_reset_rebuilds_the_database(self):
+        schema = self.attribute_keys()
+        result = self.setup().execute_complete_setup(force_recreate='full')
+        self.assertTrue(result['success'], result.get('error'))
+        self.assertEqual(result['reset']['strategy'], 'full')
+        self.assertEqual(self.databases.stats()['calls']['delete'], 1)
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'audit_logs'), 0)
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'system_settings'), self.settings)
+        self.assertEqual(self.attribute_keys(), schema)
+
+    def test_reset_is_not_repeated_on_resume(self):
+        setup = self.setup()
+        setup.mark_done('reset_done')
+        result = setup.execute_complete_setup(force_recreate='fast')
+        self.assertTrue(result['success'], result.get('error'))
+        self.assertIsNone(result['reset'])
+        self.assertEqual(document_count(self.databases, DATABASE_ID, 'audit_logs'), 1)
+
+    def test_unmanaged_database_is_never_reset(self):
+        self.databases.create('production', 'Production')
+        for strategy in ('fast', 'full'):
+            with self.subTest(strategy=strategy):
+                with self.assertRaisesRegex(ValueError, 'not managed'):
+                    self.setup('production').reset_database(strategy)
+        self.databases.get('production')  # Still there
+        self.assertNotIn('delete', self.databases.stats()['calls'])
+
+
+if __name__ == '__main__':
+    unittest.main()
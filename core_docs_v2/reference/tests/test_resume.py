@@ -0,0 +1,97 @@
+import time
+import unittest
+
+from example_dev_set_up import DevelopmentDatabaseSetup
+from example_fake_databases import FakeDatabases
+from tests.support import RequestContext
+
+DATABASE_ID = 'eprescription_test_resume'
+
+
+def new_setup(databases, token: str = None, index_plan: dict = None) -> DevelopmentDatabaseSetup:
+    setup = DevelopmentDatabaseSetup(RequestContext(), databases, DATABASE_ID)
+    if index_plan is not None:
+        setup.index_plan = index_plan
+    if token:
+        setup.load_checkpoint(token)
+    return setup
+
+
+def live_index_keys(databases, collections_config: list) -> set:
+    return {(info['id'], index['key'])
+            for info in collections_config
+            for index in databases.list_indexes(DATABASE_ID, info['id'])['indexes']}
+
+
+def configured_index_keys(collections_config: list) -> set:
+    return {(info['id'], index['key']) for info in collections_config for index in info.get('indexes', [])}
+
+
+class AttributeTimeoutTest(unittest.TestCase):
+
+    def test_timed_out_collections_are_finished_by_the_next_run(self):
+        # Attributes take 0.2s to become available; the first run gives up after 0.01s
+        databases = FakeDatabases(attribute_delay=0.2, index_delay=0, attribute_workers=1000)
+        first = new_setup(databases)
+        first.ATTRIBUTE_READY_TIMEOUT = 0.01
+        result = first.execute_complete_setup(pipelined=True, concurrency=8)
+        self.assertFalse(result['success'])
+        indexed = {info['id'] for info in first.collections_config() if info.get('indexes')}
+        self.assertFalse(indexed & set(first.checkpoint['collections_done']))
+
+        second = new_setup(databases)
+        result = second.execute_complete_setup(pipelined=True, concurrency=8)
+        self.assertTrue(result['success'], result.get('error'))
+        config = second.collections_config()
+        self.assertEqual(live_index_keys(databases, config), configured_index_keys(config))
+
+
+class ContinuationTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.databases = FakeDatabases(attribute_delay=0)
+
+    def deferred_run(self, index_plan: dict = None) -> dict:
+        setup = new_setup(self.databases, index_plan=index_plan)
+        setup.deadline = time.monotonic()  # Budget already used up: everything is deferred
+        result = setup.execute_complete_setup(pipelined=True, concurrency=4)
+        self.assertEqual(result.get('status'), 'resumable', result.get('error'))
+        return result
+
+    def test_deferred_work_resumes_from_the_token(self):
+        result = self.deferred_run()
+        self.assertLess(result['progress']['collections_done'], result['progress']['collections_total'])
+
+        setup = new_setup(self.databases, result['continuation_token'])
+        result = setup.execute_complete_setup(pipelined=True, concurrency=4)
+        self.assertTrue(result['success'], result.get('error'))
+        self.assertEqual(setup.checkpoint['invocations'], 2)
+        progress = setup.checkpoint_progress()
+        self.assertEqual(progress['collections_done'], progress['collections_total'])
+        config = setup.collections_config()
+        self.assertEqual(live_index_keys(self.databases, config), configured_index_keys(config))
+
+    def test_token_is_bound_to_the_index_plan(self):
+        plan = {'create': [{'collection_id': 'prescriptions', 'key': 'idx_resume_status', 'index_type': 'key',
+                            'attributes': ['status']}]}
+        token = self.deferred_run(index_plan=plan)['continuation_token']
+        with self.assertRaisesRegex(ValueError, 'different collections config'):
+            new_setup(self.databases, token)
+        setup = new_setup(self.databases, token, index_plan=plan)
+        self.assertTrue(setup.execute_complete_setup(pipelined=True)['success'])
+        self.assertIn(('prescriptions', 'idx_resume_status'),
+                      live_index_keys(self.databases, setup.collections_config()))
+
+    def test_token_is_bound_to_its_database(self):
+        token = self.deferred_run()['continuation_token']
+        other = DevelopmentDatabaseSetup(RequestContext(), self.databases, 'eprescription_test_other')
+        with self.assertRaisesRegex(ValueError, DATABASE_ID):
+            other.load_checkpoint(token)
+
+    def test_damaged_token_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'Invalid continuation token'):
+            new_setup(self.databases, 'not-a-token')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import random
+import threading
+import time
+import unittest
+
+from example_token_reservations import InsufficientTokens, TokenReservations
+from tests.support import provisioned_databases
+
+DATABASE_ID = 'eprescription_dev'
+CLINIC_ID = 'clinic_test'
+
+
+class TokenReservationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.databases = provisioned_databases()
+
+    def create_balance(self, tokens: int):
+        now = '2024-01-01T00:00:00Z'
+        self.databases.create_document(DATABASE_ID, 'clinic_token_balances', 'balance_test', {
+            'clinic_id': CLINIC_ID, 'current_balance': tokens, 'reserved_balance': 0,
+            'lifetime_purchased': tokens, 'lifetime_consumed': 0, 'auto_topup_enabled': False,
+            'billing_admin_user_id': 'user_admin', 'created_at': now, 'updated_at': now})
+
+    def balance(self) -> dict:
+        return self.databases.get_document(DATABASE_ID, 'clinic_token_balances', 'balance_test')
+
+    def engine(self, **options) -> TokenReservations:
+        return TokenReservations(self.databases, flush_interval=0.005, log=lambda message: None, **options)
+
+    def run_threads(self, target, count: int):
+        threads = [threading.Thread(target=target, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_processes_lose_no_consumption(self):
+        self.create_balance(1000)
+        engines = [self.engine() for _ in range(3)]
+        consumed = [0] * 12
+        lock = threading.Lock()
+
+        def worker(n):
+            engine, rnd = engines[n % len(engines)], random.Random(n)
+            for _ in range(60):
+                try:
+                    reservation_id = engine.reserve(CLINIC_ID)
+                except InsufficientTokens:
+                    continue
+                if rnd.random() < 0.7:
+                    engine.consume(reservation_id)
+                    with lock:
+                        consumed[n] += 1
+                else:
+                    engine.release(reservation_id)
+
+        self.run_threads(worker, len(consumed))
+        for engine in engines:
+            engine.close()
+
+        balance = self.balance()
+        self.assertEqual(balance['current_balance'], 1000 - sum(consumed))
+        self.assertEqual(balance['lifetime_consumed'], sum(consumed))
+        self.assertEqual(balance['reserved_balance'], 0)
+
+        # The ledger chain ends at the stored version and adds up to the same consumption
+        ledger = [document for document in self.databases.list_documents(DATABASE_ID, 'billing_transactions')
+                  ['documents'] if document['transaction_type'] == 'token_usage']
+        self.assertIn(balance['last_transaction_id'], {document['$id'] for document in ledger})
+        self.assertEqual(sum(json.loads(document['token_data'])['changes']['lifetime_consumed']
+                             for document in ledger), sum(consumed))
+
+    def test_one_process_never_overdraws(self):
+        self.create_balance(50)
+        engine = self.engine()
+        consumed = []
+
+        def worker(n):
+            for _ in range(20):
+                try:
+                    engine.consume_now(CLINIC_ID)
+                    consumed.append(n)
+                except InsufficientTokens:
+                    pass
+
+        self.run_threads(worker, 8)
+        stats = engine.close()
+        self.assertEqual(len(consumed), 50)
+        self.assertEqual(stats['refused'], 8 * 20 - 50)
+        self.assertEqual(self.balance()['current_balance'], 0)
+        self.assertEqual(self.balance()['reserved_balance'], 0)
+
+    def test_reservations_of_a_dead_process_are_returned(self):
+        self.create_balance(20)
+        dead = self.engine(reservation_ttl=0.2)
+        dead.LEASE_GRACE = 0
+        for _ in range(5):
+            dead.reserve(CLINIC_ID)
+        self.assertTrue(dead.flush())
+        dead.stopping = True  # Stops without close(): no release, the lease is left behind
+        dead.wake.set()
+        dead.flusher.join()
+        self.assertEqual(self.balance()['reserved_balance'], 5)
+
+        live = self.engine()
+        live_id = live.reserve(CLINIC_ID, 3)
+        self.assertTrue(live.flush())
+        time.sleep(0.3)
+
+        newcomer = self.engine()
+        self.assertEqual(newcomer.available(CLINIC_ID), 17)
+        self.assertEqual(newcomer.stats()['reconciled_tokens'], 5)
+        self.assertEqual(self.balance()['reserved_balance'], 3)
+
+        live.consume(live_id)
+        live.close()
+        newcomer.close()
+        self.assertEqual(self.balance()['current_balance'], 17)
+        self.assertEqual(self.balance()['reserved_balance'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()